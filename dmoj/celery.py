@@ -37,6 +37,13 @@ app.conf.beat_schedule = {
             'expires': 60 * 60 * 24,
         },
     },
+    'problem-stats-reconcile': {
+        'task': 'judge.tasks.problem.reconcile_problem_stats',
+        'schedule': crontab(**settings.VNOJ_PROBLEM_STATS_RECONCILE_CRONTAB_KWARGS),
+        'options': {
+            'expires': 60 * 60 * 24,
+        },
+    },
     'organization-monthly-reset': {
         'task': 'judge.tasks.organization.organization_monthly_reset',
         'schedule': crontab(minute=0, hour=0, day_of_month=1),
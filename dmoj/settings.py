@@ -175,9 +175,29 @@ VNOJ_LOW_POWER_MODE_CONFIG = {
     'heat_map_limit': 20_000,
 }
 
+# Paginate submission lists with `?before=<id>` cursors instead of page numbers, so that deep pages cost as much as
+# the first one. Always done in low power mode, which then doesn't limit the number of pages.
+VNOJ_SUBMISSION_KEYSET_PAGINATION = False
+
 # maximum number of problems in a contest
 MAX_CONTEST_PROBLEMS_COUNT = None
 
+# Seconds a contest's materialized scoreboard is kept in the cache.
+# It is updated as participations are rescored; this bounds how stale the names and organizations on it can get.
+VNOJ_CONTEST_SCOREBOARD_TIMEOUT = 10 * 60
+# Number of rescored participations a scoreboard remembers, so that clients can fetch only what changed.
+# Clients that fall further behind reload the full ranking.
+VNOJ_CONTEST_SCOREBOARD_HISTORY = 1000
+
+# Compute contest ratings with NumPy if it is installed, which is much faster for large contests.
+# Results match the pure Python implementation up to floating point error.
+VNOJ_RATING_NUMPY = True
+# Past performances weigh less and less in a user's rating. Those weighing less than this are left out, which
+# changes ratings by at most about 1. Set to 0 to always use the whole history.
+VNOJ_RATING_HISTORY_MIN_WEIGHT = 1e-3
+# Seconds the standings and rating histories used to preview a contest's ratings are kept in the cache.
+VNOJ_RATING_PREVIEW_TIMEOUT = 10 * 60
+
 VNOJ_MAGAZINE_TAG_SLUG = None
 
 CELERY_TIMEZONE = 'UTC'
@@ -272,6 +292,8 @@ VNOJ_PROBLEM_DELETION_GRACE_PERIOD = datetime.timedelta(days=7)
 # Maximum time the garbage collection task is allowed to run per invocation
 VNOJ_PROBLEM_GARBAGE_COLLECTOR_TIME_LIMIT = datetime.timedelta(hours=1)
 VNOJ_PROBLEM_GARBAGE_COLLECTOR_CRONTAB_KWARGS = {'minute': 0, 'hour': 0}
+# When to correct any drift in the incrementally maintained problem statistics
+VNOJ_PROBLEM_STATS_RECONCILE_CRONTAB_KWARGS = {'minute': 0, 'hour': 3}
 
 DMOJ_PROBLEM_STATEMENT_DISALLOWED_CHARACTERS = {'“', '”', '‘', '’', '−', 'ﬀ', 'ﬁ', 'ﬂ', 'ﬃ', 'ﬄ'}
 DMOJ_RATING_COLORS = True
@@ -764,8 +786,23 @@ BALANCER_JUDGE_ADDRESS = [('localhost', 8888)]
 # Bridged configuration
 BRIDGED_JUDGE_ADDRESS = [('localhost', 9999)]
 BRIDGED_JUDGE_PROXIES = None
+# Test case results from judges are buffered and written to the database once this many have arrived,
+# or once this many seconds have passed since the last write, whichever comes first.
+BRIDGED_JUDGE_TEST_CASE_BUFFER_SIZE = 100
+BRIDGED_JUDGE_TEST_CASE_FLUSH_INTERVAL = 0.5
+# User, problem, contest ranking and organization statistics are recomputed in the background at most this many
+# seconds after a submission affecting them is graded. Set to None to recompute them as each submission is graded.
+BRIDGED_POST_GRADING_DELAY = 1
+# Events posted by the bridge are sent to the event daemon in batches from a background thread, at most this many
+# seconds after they are posted. Identical events on the same channel that are waiting to be sent are merged.
+# Set to None to send each event as it is posted.
+BRIDGED_EVENT_POST_DELAY = 0.1
+# Events posted while this many are waiting to be sent are dropped.
+BRIDGED_EVENT_POST_QUEUE_SIZE = 10000
 BRIDGED_DJANGO_ADDRESS = [('localhost', 9998)]
 BRIDGED_DJANGO_CONNECT = None
+# Whether to keep one connection to the bridge open per process, instead of connecting for each request.
+BRIDGED_DJANGO_PERSISTENT_CONNECTION = True
 
 # Event Server configuration
 EVENT_DAEMON_USE = False
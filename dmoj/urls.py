@@ -253,6 +253,8 @@ urlpatterns = [
         path('/clone', contests.ContestClone.as_view(), name='contest_clone'),
         path('/ranking/', contests.ContestRanking.as_view(), name='contest_ranking'),
         path('/replay/<int:version>/', contests.ContestReplayData.as_view(), name='contest_replay_data'),
+        path('/replay/<int:version>/columns/', contests.ContestReplayColumns.as_view(),
+             name='contest_replay_columns'),
         path('/public_ranking/', contests.ContestPublicRanking.as_view(), name='contest_public_ranking'),
         path('/official_ranking/', contests.ContestOfficialRanking.as_view(), name='contest_official_ranking'),
         path('/register', contests.ContestRegister.as_view(), name='contest_register'),
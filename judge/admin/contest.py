@@ -4,7 +4,7 @@ from django.core.exceptions import PermissionDenied
 from django.db import connection, transaction
 from django.db.models import F, Q, TextField
 from django.forms import ModelForm, ModelMultipleChoiceField
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.urls import path, reverse, reverse_lazy
 from django.utils import timezone
@@ -16,7 +16,7 @@ from reversion.admin import VersionAdmin
 
 from judge.admin.utils import AdminFastPaginationMixin
 from judge.models import Contest, ContestAnnouncement, ContestProblem, ContestSubmission, Profile, Rating, Submission
-from judge.ratings import rate_contest
+from judge.ratings import preview_contest_ratings, rate_contests
 from judge.utils.views import NoBatchDeleteMixin
 from judge.widgets import AdminAceWidget, AdminHeavySelect2MultipleWidget, AdminHeavySelect2Widget, \
     AdminMartorWidget, AdminSelect2MultipleWidget
@@ -305,6 +305,7 @@ class ContestAdmin(AdminFastPaginationMixin, NoBatchDeleteMixin, SortableAdminBa
         return [
             path('rate/all/', self.rate_all_view, name='judge_contest_rate_all'),
             path('<int:id>/rate/', self.rate_view, name='judge_contest_rate'),
+            path('<int:id>/rate/preview/', self.rate_preview_view, name='judge_contest_rate_preview'),
             path('<int:contest_id>/invalidate_replay/', self.invalidate_replay_view,
                  name='judge_contest_invalidate_replay'),
             path('<int:contest_id>/rejudge/<int:problem_id>/', self.rejudge_view, name='judge_contest_rejudge'),
@@ -359,8 +360,7 @@ class ContestAdmin(AdminFastPaginationMixin, NoBatchDeleteMixin, SortableAdminBa
             with connection.cursor() as cursor:
                 cursor.execute('TRUNCATE TABLE `%s`' % Rating._meta.db_table)
             Profile.objects.update(rating=None)
-            for contest in Contest.objects.filter(is_rated=True, end_time__lte=timezone.now()).order_by('end_time'):
-                rate_contest(contest)
+            rate_contests(Contest.objects.filter(is_rated=True, end_time__lte=timezone.now()))
         return HttpResponseRedirect(reverse('admin:judge_contest_changelist'))
 
     @method_decorator(require_POST)
@@ -374,6 +374,42 @@ class ContestAdmin(AdminFastPaginationMixin, NoBatchDeleteMixin, SortableAdminBa
             contest.rate()
         return HttpResponseRedirect(request.headers.get('referer', reverse('admin:judge_contest_changelist')))
 
+    def rate_preview_view(self, request, id):
+        if not request.user.has_perm('judge.contest_rating'):
+            raise PermissionDenied()
+        contest = get_object_or_404(Contest, id=id)
+        if not contest.ended:
+            raise Http404()
+
+        # The contest is not saved, so these only change the preview.
+        rate_exclude = None
+        try:
+            for field in ('rating_floor', 'rating_ceiling'):
+                if field in request.GET:
+                    setattr(contest, field, int(request.GET[field]) if request.GET[field] else None)
+        except ValueError:
+            return HttpResponseBadRequest()
+        if 'rate_exclude' in request.GET:
+            usernames = [username for username in request.GET['rate_exclude'].split(',') if username]
+            rate_exclude = Profile.objects.filter(user__username__in=usernames).values_list('id', flat=True)
+
+        preview = preview_contest_ratings(contest, rate_exclude)
+        usernames = dict(Profile.objects.filter(id__in=[participation['user_id'] for participation, *_ in preview])
+                         .values_list('id', 'user__username'))
+        return JsonResponse({
+            'contest': contest.key,
+            'rating_floor': contest.rating_floor,
+            'rating_ceiling': contest.rating_ceiling,
+            'ratings': [{
+                'user': usernames[participation['user_id']],
+                'rank': rank,
+                'old_rating': old_rating,
+                'rating': rating,
+                'mean': mean,
+                'performance': performance,
+            } for participation, rank, old_rating, rating, mean, performance in preview],
+        })
+
     def get_form(self, request, obj=None, **kwargs):
         form = super(ContestAdmin, self).get_form(request, obj, **kwargs)
         if 'problem_label_script' in form.base_fields:
@@ -7,7 +7,7 @@ from django.utils.html import format_html
 from django.utils.translation import gettext, gettext_lazy as _, ngettext
 from reversion.admin import VersionAdmin
 
-from judge.models import Profile, WebAuthnCredential
+from judge.models import Profile, UserProblemScore, WebAuthnCredential
 from judge.utils.views import NoBatchDeleteMixin
 from judge.widgets import AdminAceWidget, AdminMartorWidget, AdminSelect2MultipleWidget, AdminSelect2Widget
 
@@ -128,6 +128,7 @@ class ProfileAdmin(NoBatchDeleteMixin, VersionAdmin):
     @admin.display(description=_('Recalculate scores'))
     def recalculate_points(self, request, queryset):
         count = 0
+        UserProblemScore.rebuild(user_ids=list(queryset.values_list('id', flat=True)))
         for profile in queryset:
             profile.calculate_points()
             count += 1
@@ -16,8 +16,10 @@ from django.views.decorators.http import require_POST
 from reversion.admin import VersionAdmin
 
 from judge.admin.utils import AdminFastPaginationMixin
+from judge.judgeapi import REJUDGE_BATCH_SIZE, batch_rejudge_submissions
 from judge.models import ContestParticipation, ContestProblem, ContestSubmission, Profile, Submission, \
-    SubmissionSource, SubmissionTestCase
+    SubmissionSource, SubmissionTestCase, UserProblemScore
+from judge.utils.iterator import chunk
 from judge.utils.raw_sql import use_straight_join
 from judge.widgets import AdminAceWidget
 
@@ -176,9 +178,9 @@ class SubmissionAdmin(AdminFastPaginationMixin, VersionAdmin):
         if not request.user.has_perm('judge.edit_all_problem'):
             id = request.profile.id
             queryset = queryset.filter(Q(problem__authors__id=id) | Q(problem__curators__id=id))
-        judged = len(queryset)
-        for model in queryset:
-            model.judge(rejudge=True, batch_rejudge=True, rejudge_user=request.user)
+        judged = 0
+        for ids in chunk(queryset.values_list('id', flat=True), REJUDGE_BATCH_SIZE):
+            judged += batch_rejudge_submissions(ids, rejudge_user=request.user)
         self.message_user(request, ngettext('%d submission was successfully scheduled for rejudging.',
                                             '%d submissions were successfully scheduled for rejudging.',
                                             judged) % judged)
@@ -199,6 +201,9 @@ class SubmissionAdmin(AdminFastPaginationMixin, VersionAdmin):
             submission.save()
             submission.update_contest()
 
+        for user_id, problem_id in queryset.order_by().values_list('user_id', 'problem_id').distinct():
+            UserProblemScore.recompute(user_id, problem_id)
+
         for profile in Profile.objects.filter(id__in=queryset.values_list('user_id', flat=True).distinct()):
             profile.calculate_points()
             cache.delete('user_complete:%d' % profile.id)
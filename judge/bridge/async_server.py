@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from judge.bridge.base_handler import Disconnect, MAX_ALLOWED_PACKET_SIZE, size_pack
+
+logger = logging.getLogger('judge.bridge')
+
+# Stop reading from a connection while this many packets are waiting to be handled.
+MAX_PENDING_PACKETS = 64
+# Max line length for PROXY protocol.
+MAX_PROXY_HEADER_SIZE = 107
+
+_TIMEOUT = object()
+_CLOSED = object()
+
+
+class AsyncRequest:
+    """Socket-like facade over an asyncio transport, safe to use from the handler's worker threads."""
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.loop = protocol.loop
+
+    def sendall(self, data):
+        self.loop.call_soon_threadsafe(self.protocol.write, data)
+
+    def gettimeout(self):
+        return self.protocol.timeout
+
+    def settimeout(self, timeout):
+        self.loop.call_soon_threadsafe(self.protocol.set_timeout, timeout)
+
+    def shutdown(self, how):
+        self.loop.call_soon_threadsafe(self.protocol.close)
+
+
+class PeriodicJob:
+    def __init__(self, server, interval, func):
+        self.server = server
+        self.interval = interval
+        self.func = func
+        self._cancelled = False
+        server.loop.call_soon_threadsafe(self._run)
+
+    def _run(self):
+        if not self._cancelled:
+            self.server.run_in_executor(self.func).add_done_callback(self._done)
+
+    def _done(self, future):
+        # Like the threaded version, a job that raised is not run again.
+        if not self._cancelled and not future.cancelled() and future.exception() is None:
+            self.server.loop.call_later(self.interval, self._run)
+
+    def cancel(self):
+        self._cancelled = True
+
+
+class DelayedJob:
+    def __init__(self, server, delay, func):
+        self.server = server
+        self.func = func
+        self._cancelled = False
+        server.loop.call_soon_threadsafe(server.loop.call_later, delay, self._run)
+
+    def _run(self):
+        if not self._cancelled:
+            self.server.run_in_executor(self.func)
+
+    def cancel(self):
+        self._cancelled = True
+
+
+class AsyncListener:
+    """Stands in for the socketserver instance that handlers get in the threaded server."""
+
+    asynchronous = True
+
+    def __init__(self, server, server_address):
+        self.server = server
+        self.server_address = server_address
+
+    def call_periodically(self, interval, func):
+        return PeriodicJob(self.server, interval, func)
+
+    def call_later(self, delay, func):
+        return DelayedJob(self.server, delay, func)
+
+
+class ZlibPacketProtocol(asyncio.Protocol):
+    """Implements the framing of ZlibPacketHandler on top of asyncio.
+
+    Packets are decompressed and handled in the server's executor, one at a time per connection and in order,
+    so that handlers are free to block on the database.
+    """
+
+    def __init__(self, listener):
+        self.listener = listener
+        self.server = listener.server
+        self.loop = self.server.loop
+        self.transport = None
+        self.handler = None
+        self.timeout = None
+        self._timeout_handle = None
+        self._buffer = bytearray()
+        self._initial = True
+        self._closed = False
+        # Set once the client sent something invalid. Packets received until then are still handled.
+        self._disconnecting = False
+        self._paused = False
+        self._packets = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.handler = self.server.handler(AsyncRequest(self), transport.get_extra_info('peername'), self.listener)
+        self.loop.create_task(self._process())
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._cancel_timeout()
+        self._packets.put_nowait(_CLOSED)
+
+    def data_received(self, data):
+        if self._closed or self._disconnecting:
+            return
+        self._buffer += data
+        self._reset_timeout()
+        try:
+            self._parse()
+        except Disconnect:
+            # Like the threaded server, handle the packets that came before, then disconnect.
+            self._disconnecting = True
+            self._cancel_timeout()
+            self.transport.pause_reading()
+            self._packets.put_nowait(_CLOSED)
+            return
+
+        if not self._paused and self._packets.qsize() >= MAX_PENDING_PACKETS:
+            self._paused = True
+            self.transport.pause_reading()
+
+    def _parse(self):
+        if self._initial:
+            if len(self._buffer) < size_pack.size:
+                return
+            tag = bytes(self._buffer[:size_pack.size])
+            if self.handler.client_address[0] in self.handler.proxies and tag == b'PROX':
+                end = self._buffer.find(b'\r\n')
+                if end < 0:
+                    if len(self._buffer) > MAX_PROXY_HEADER_SIZE + size_pack.size:
+                        raise Disconnect()
+                    return
+                self.handler.parse_proxy_protocol(bytes(self._buffer[:end]))
+                del self._buffer[:end + 2]
+            self.handler._initial_tag = tag
+            self._initial = False
+
+        while len(self._buffer) >= size_pack.size:
+            size = size_pack.unpack_from(self._buffer)[0]
+            if size > MAX_ALLOWED_PACKET_SIZE:
+                logger.log(logging.WARNING if self.handler._got_packet else logging.INFO,
+                           'Disconnecting client due to too-large message size (%d bytes): %s',
+                           size, self.handler.client_address)
+                raise Disconnect()
+            if len(self._buffer) < size_pack.size + size:
+                return
+            self._packets.put_nowait(bytes(self._buffer[size_pack.size:size_pack.size + size]))
+            del self._buffer[:size_pack.size + size]
+
+    def write(self, data):
+        if not self._closed:
+            self.transport.write(data)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._cancel_timeout()
+            self.transport.close()
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+        self._reset_timeout()
+
+    def _cancel_timeout(self):
+        if self._timeout_handle is not None:
+            self._timeout_handle.cancel()
+            self._timeout_handle = None
+
+    def _reset_timeout(self):
+        self._cancel_timeout()
+        if self.timeout and not self._closed and not self._disconnecting:
+            self._timeout_handle = self.loop.call_later(self.timeout, self._on_timeout)
+
+    def _on_timeout(self):
+        self._timeout_handle = None
+        self._packets.put_nowait(_TIMEOUT)
+
+    async def _next_packet(self):
+        packet = await self._packets.get()
+        if self._paused and self._packets.qsize() < MAX_PENDING_PACKETS // 2:
+            self._paused = False
+            if not self._closed and not self._disconnecting:
+                self.transport.resume_reading()
+        return packet
+
+    async def _process(self):
+        handler = self.handler
+        run = self.server.run_in_executor
+        try:
+            await run(handler.on_connect)
+            try:
+                while True:
+                    packet = await self._next_packet()
+                    if packet is _CLOSED:
+                        break
+                    if packet is _TIMEOUT:
+                        if handler._got_packet:
+                            logger.info('Socket timed out: %s', handler.client_address)
+                            await run(handler.on_timeout)
+                        else:
+                            logger.info('Potentially wrong protocol: %s: %r',
+                                        handler.client_address, handler._initial_tag)
+                        break
+                    await run(handler._on_packet, packet)
+            except Disconnect:
+                pass
+            except zlib.error:
+                if handler._got_packet:
+                    logger.warning('Encountered zlib error during packet handling, disconnecting client: %s',
+                                   handler.client_address, exc_info=True)
+                else:
+                    logger.info('Potentially wrong protocol (zlib error): %s: %r',
+                                handler.client_address, handler._initial_tag, exc_info=True)
+            finally:
+                self.close()
+                await run(handler.on_cleanup)
+        except Exception:
+            logger.exception('Error in base packet handling')
+        finally:
+            await run(handler.on_disconnect)
+
+
+class AsyncServer:
+    """Drop-in replacement for judge.bridge.server.Server that runs all connections on a single event loop.
+
+    Packet handlers run in a bounded thread pool instead of one thread per connection.
+    """
+
+    def __init__(self, addresses, handler, max_workers=None):
+        self.addresses = addresses
+        self.handler = handler
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bridge-worker')
+        self.loop = None
+        # The addresses actually listened on, once started, e.g. to find the port picked for port 0.
+        self.server_addresses = []
+        self._started = threading.Event()
+        self._shutdown = None
+
+    def run_in_executor(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._shutdown = asyncio.Event()
+        servers = []
+        for address in self.addresses:
+            listener = AsyncListener(self, address)
+            servers.append(await self.loop.create_server(
+                partial(ZlibPacketProtocol, listener), address[0], address[1], reuse_address=True,
+            ))
+            self.server_addresses += [sock.getsockname() for sock in servers[-1].sockets]
+        self._started.set()
+        try:
+            await self._shutdown.wait()
+        finally:
+            for server in servers:
+                server.close()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._started.set()
+            self.executor.shutdown(wait=False)
+
+    def shutdown(self):
+        self._started.wait()
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._shutdown.set)
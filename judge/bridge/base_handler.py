@@ -36,9 +36,13 @@ class Disconnect(Exception):
 # use setup(), most tools will complain about uninitialized variables.
 # This metaclass will allow sane __init__ behaviour while also magically
 # calling the methods that handle the request.
+# Asynchronous servers (see judge.bridge.async_server) feed packets to the
+# handler themselves, so for them we only construct the handler.
 class RequestHandlerMeta(type):
     def __call__(cls, *args, **kwargs):
         handler = super().__call__(*args, **kwargs)
+        if handler.server.asynchronous:
+            return handler
         handler.on_connect()
         try:
             handler.handle()
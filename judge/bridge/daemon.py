@@ -5,9 +5,11 @@ from functools import partial
 
 from django.conf import settings
 
+from judge import event_poster as event
 from judge.bridge.django_handler import DjangoHandler
 from judge.bridge.judge_handler import JudgeHandler
 from judge.bridge.judge_list import JudgeList
+from judge.bridge.post_grading import PostGradingPipeline
 from judge.bridge.server import Server
 from judge.models import Judge, Submission
 
@@ -18,23 +20,36 @@ def reset_judges():
     Judge.objects.update(online=False, ping=None, load=None)
 
 
-def judge_daemon(run_monitor=False, problem_storage_globs=None):
+def judge_daemon(run_monitor=False, problem_storage_globs=None, use_asyncio=False, workers=None):
     reset_judges()
     Submission.objects.filter(status__in=Submission.IN_PROGRESS_GRADING_STATUS) \
         .update(status='IE', result='IE', error=None)
     judges = JudgeList()
+    post_grading = PostGradingPipeline(delay=settings.BRIDGED_POST_GRADING_DELAY)
 
     monitor = None
     if run_monitor:
         from judge.bridge.monitor import Monitor
         monitor = Monitor(judges, problem_storage_globs or [])
 
-    judge_server = Server(
+    if use_asyncio:
+        from judge.bridge.async_server import AsyncServer
+        make_server = partial(AsyncServer, max_workers=workers)
+    else:
+        make_server = Server
+
+    judge_server = make_server(
         settings.BRIDGED_JUDGE_ADDRESS,
-        partial(JudgeHandler, judges=judges, ignore_problems_packet=run_monitor),
+        partial(JudgeHandler, judges=judges, ignore_problems_packet=run_monitor, post_grading=post_grading),
+    )
+    django_server = make_server(
+        settings.BRIDGED_DJANGO_ADDRESS,
+        partial(DjangoHandler, judges=judges, post_grading=post_grading),
     )
-    django_server = Server(settings.BRIDGED_DJANGO_ADDRESS, partial(DjangoHandler, judges=judges))
 
+    if settings.BRIDGED_EVENT_POST_DELAY is not None:
+        event.start_async(settings.BRIDGED_EVENT_POST_DELAY, settings.BRIDGED_EVENT_POST_QUEUE_SIZE)
+    post_grading.start()
     if monitor is not None:
         monitor.start()
     threading.Thread(target=django_server.serve_forever).start()
@@ -57,3 +72,5 @@ def judge_daemon(run_monitor=False, problem_storage_globs=None):
             monitor.stop()
         django_server.shutdown()
         judge_server.shutdown()
+        post_grading.stop()
+        event.stop_async()
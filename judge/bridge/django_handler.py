@@ -4,6 +4,7 @@ import struct
 
 from django import db
 
+from judge import event_poster as event
 from judge.bridge.base_handler import Disconnect, ZlibPacketHandler
 
 logger = logging.getLogger('judge.bridge')
@@ -11,7 +12,7 @@ size_pack = struct.Struct('!I')
 
 
 class DjangoHandler(ZlibPacketHandler):
-    def __init__(self, request, client_address, server, judges):
+    def __init__(self, request, client_address, server, judges, post_grading=None):
         super().__init__(request, client_address, server)
 
         self.handlers = {
@@ -19,21 +20,35 @@ class DjangoHandler(ZlibPacketHandler):
             'terminate-submission': self.on_termination,
             'disconnect-judge': self.on_disconnect_request,
             'disable-judge': self.on_disable_judge,
+            'batch': self.on_batch,
+            'post-grading-metrics': self.on_post_grading_metrics,
+            'event-metrics': self.on_event_metrics,
         }
         self.judges = judges
+        self.post_grading = post_grading
 
     def send(self, data):
         super().send(json.dumps(data, separators=(',', ':')))
 
     def on_packet(self, packet):
         packet = json.loads(packet)
+        request_id = packet.get('request-id')
+        if request_id is None:
+            # One-shot connection: reply and hang up.
+            self.send(self.handle_packet(packet))
+            raise Disconnect()
+
+        # Persistent connection, which may stay open for a long time and carry many requests,
+        # so make sure the database connection is still usable.
+        db.connection.close_if_unusable_or_obsolete()
+        self.send({'name': 'response', 'request-id': request_id, 'response': self.handle_packet(packet)})
+
+    def handle_packet(self, packet):
         try:
-            result = self.handlers.get(packet.get('name', None), self.on_malformed)(packet)
+            return self.handlers.get(packet.get('name', None), self.on_malformed)(packet)
         except Exception:
             logger.exception('Error in packet handling (Django-facing)')
-            result = {'name': 'bad-request'}
-        self.send(result)
-        raise Disconnect()
+            return {'name': 'bad-request'}
 
     def on_submission(self, data):
         id = data['submission-id']
@@ -61,6 +76,17 @@ class DjangoHandler(ZlibPacketHandler):
         is_disabled = data['is-disabled']
         self.judges.update_disable_judge(judge_id, is_disabled)
 
+    def on_batch(self, data):
+        return {'name': 'batch-received', 'responses': [self.handle_packet(packet) for packet in data['packets']]}
+
+    def on_post_grading_metrics(self, data):
+        if self.post_grading is None:
+            return {'name': 'bad-request'}
+        return {'name': 'post-grading-metrics', 'metrics': self.post_grading.metrics()}
+
+    def on_event_metrics(self, data):
+        return {'name': 'event-metrics', 'metrics': event.async_metrics()}
+
     def on_malformed(self, packet):
         logger.error('Malformed packet: %s', packet)
 
@@ -0,0 +1,79 @@
+import asyncio
+import struct
+import time
+import zlib
+
+size_pack = struct.Struct('!I')
+
+
+def zlibify(data):
+    data = zlib.compress(data.encode('utf-8'))
+    return size_pack.pack(len(data)) + data
+
+
+async def read_packet(reader):
+    size = size_pack.unpack(await reader.readexactly(size_pack.size))[0]
+    return zlib.decompress(await reader.readexactly(size)).decode('utf-8')
+
+
+async def echo(reader, writer, packet, expected):
+    writer.write(packet)
+    await writer.drain()
+    assert await read_packet(reader) == expected
+
+
+async def one_shot_worker(host, port, count, packet, expected):
+    # Like Django talking to the bridge: connect, send one packet, wait for the reply, disconnect.
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection(host, port)
+        await echo(reader, writer, packet, expected)
+        writer.close()
+        await writer.wait_closed()
+
+
+async def persistent_worker(host, port, count, packet, expected):
+    # Like a judge: one long-lived connection with a steady stream of packets.
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(count):
+        await echo(reader, writer, packet, expected)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(worker, host, port, concurrency, total, payload):
+    packet = zlibify(payload)
+    per_worker, extra = divmod(total, concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        worker(host, port, per_worker + (i < extra), packet, payload) for i in range(concurrency)
+    ])
+    return time.perf_counter() - start
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Load test a bridge echo server (see echo_test_server.py).')
+    parser.add_argument('-l', '--host', default='localhost')
+    parser.add_argument('-p', '--port', default=9999, type=int)
+    parser.add_argument('-c', '--concurrency', default=200, type=int,
+                        help='number of concurrent clients')
+    parser.add_argument('-n', '--connections', default=5000, type=int,
+                        help='number of one-shot connections to make')
+    parser.add_argument('-m', '--packets', default=50000, type=int,
+                        help='number of packets to send over persistent connections')
+    parser.add_argument('-s', '--size', default=256, type=int, help='size of each packet payload')
+    args = parser.parse_args()
+
+    payload = 'x' * args.size
+
+    elapsed = asyncio.run(run(one_shot_worker, args.host, args.port, args.concurrency, args.connections, payload))
+    print('One-shot connections: %d in %.3fs (%.0f connections/s)' %
+          (args.connections, elapsed, args.connections / elapsed))
+
+    elapsed = asyncio.run(run(persistent_worker, args.host, args.port, args.concurrency, args.packets, payload))
+    print('Persistent connections: %d packets over %d connections in %.3fs (%.0f packets/s)' %
+          (args.packets, args.concurrency, elapsed, args.packets / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,26 @@ from judge.bridge.base_handler import ZlibPacketHandler
 
 
 class EchoPacketHandler(ZlibPacketHandler):
+    quiet = False
+
     def on_connect(self):
-        print('New client:', self.client_address)
+        if not self.quiet:
+            print('New client:', self.client_address)
         self.timeout = 5
 
     def on_timeout(self):
-        print('Inactive client:', self.client_address)
+        if not self.quiet:
+            print('Inactive client:', self.client_address)
 
     def on_packet(self, data):
         self.timeout = None
-        print('Data from %s: %r' % (self.client_address, data[:30] if len(data) > 30 else data))
+        if not self.quiet:
+            print('Data from %s: %r' % (self.client_address, data[:30] if len(data) > 30 else data))
         self.send(data)
 
     def on_disconnect(self):
-        print('Closed client:', self.client_address)
+        if not self.quiet:
+            print('Closed client:', self.client_address)
 
 
 def main():
@@ -26,12 +32,20 @@ def main():
     parser.add_argument('-l', '--host', action='append')
     parser.add_argument('-p', '--port', type=int, action='append')
     parser.add_argument('-P', '--proxy', action='append')
+    parser.add_argument('-a', '--asyncio', action='store_true', help='use the asyncio server')
+    parser.add_argument('-w', '--workers', type=int, default=32, help='worker threads for the asyncio server')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log connections and packets')
     args = parser.parse_args()
 
     class Handler(EchoPacketHandler):
         proxies = args.proxy or []
+        quiet = args.quiet
 
-    server = Server(list(zip(args.host, args.port)), Handler)
+    if args.asyncio:
+        from judge.bridge.async_server import AsyncServer
+        server = AsyncServer(list(zip(args.host, args.port)), Handler, max_workers=args.workers)
+    else:
+        server = Server(list(zip(args.host, args.port)), Handler)
     server.serve_forever()
 
 
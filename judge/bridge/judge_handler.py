@@ -8,13 +8,15 @@ from operator import itemgetter
 
 from django import db
 from django.conf import settings
+from django.db.models import Case, IntegerField, Max, Min, Sum, Value, When
 from django.utils import timezone
 
 from judge import event_poster as event
 from judge.bridge.base_handler import ZlibPacketHandler, proxy_list
+from judge.bridge.post_grading import PostGradingPipeline
 from judge.caching import finished_submission
 from judge.models import Judge, Language, LanguageLimit, Problem, Profile, \
-    RuntimeVersion, Submission, SubmissionTestCase
+    RuntimeVersion, Submission, SubmissionTestCase, UserProblemScore
 from judge.models.problem import ProblemTestcaseResultAccess
 from judge.utils.url import get_absolute_submission_file_url
 
@@ -23,6 +25,10 @@ json_log = logging.getLogger('judge.json.bridge')
 
 UPDATE_RATE_LIMIT = 5
 UPDATE_RATE_TIME = 0.5
+# How long the organizations of users are cached for, in seconds, when posting submission updates.
+ORGANIZATION_CACHE_TIME = 60
+# Test case statuses, from best to worst. The worst status among the cases is the result of the submission.
+STATUS_CODES = ['SC', 'AC', 'PAC', 'WA', 'MLE', 'TLE', 'IR', 'RTE', 'OLE']
 SubmissionData = namedtuple(
     'SubmissionData',
     'time memory short_circuit pretests_only contest_no attempt_no user_id file_only file_size_limit',
@@ -37,13 +43,78 @@ class SubmissionUnavailable(Exception):
     """Raised when a submission cannot be prepared for dispatch, in which case no judge is at fault."""
 
 
+class GradingResult:
+    """Running aggregate of the test case results of a submission."""
+
+    def __init__(self):
+        self.time = 0.0
+        self.total_time = 0.0
+        self.memory = 0
+        self.status = 0
+        self.points = 0.0
+        self.total = 0
+        self.batches = {}  # batch number: [points, total]
+
+    def add(self, case):
+        self.time = max(self.time, case.time)
+        self.total_time += case.time
+        self.memory = max(self.memory, case.memory)
+        self.status = max(self.status, STATUS_CODES.index(case.status))
+        if not case.batch:
+            self.points += case.points
+            self.total += case.total
+        elif case.batch in self.batches:
+            batch = self.batches[case.batch]
+            batch[0] = min(batch[0], case.points)
+            batch[1] = max(batch[1], case.total)
+        else:
+            self.batches[case.batch] = [case.points, case.total]
+
+    @classmethod
+    def from_database(cls, submission_id):
+        result = cls()
+        rows = SubmissionTestCase.objects.filter(submission_id=submission_id).values('batch').annotate(
+            max_time=Max('time'), sum_time=Sum('time'), max_memory=Max('memory'),
+            sum_points=Sum('points'), min_points=Min('points'), sum_total=Sum('total'), max_total=Max('total'),
+            worst_status=Max(Case(
+                *[When(status=code, then=Value(i)) for i, code in enumerate(STATUS_CODES)],
+                default=Value(0), output_field=IntegerField(),
+            )),
+        ).order_by()
+
+        for row in rows:
+            result.time = max(result.time, row['max_time'] or 0)
+            result.total_time += row['sum_time'] or 0
+            result.memory = max(result.memory, row['max_memory'] or 0)
+            result.status = max(result.status, row['worst_status'])
+            if not row['batch']:
+                result.points += row['sum_points'] or 0
+                result.total += row['sum_total'] or 0
+            else:
+                result.batches[row['batch']] = [row['min_points'], row['max_total']]
+        return result
+
+    @property
+    def result(self):
+        return STATUS_CODES[self.status]
+
+    @property
+    def case_points(self):
+        return round(self.points + sum(points for points, total in self.batches.values()), 3)
+
+    @property
+    def case_total(self):
+        return round(self.total + sum(total for points, total in self.batches.values()), 3)
+
+
 class JudgeHandler(ZlibPacketHandler):
     proxies = proxy_list(settings.BRIDGED_JUDGE_PROXIES or [])
 
-    def __init__(self, request, client_address, server, judges, ignore_problems_packet=True):
+    def __init__(self, request, client_address, server, judges, ignore_problems_packet=True, post_grading=None):
         super().__init__(request, client_address, server)
 
         self.judges = judges
+        self.post_grading = post_grading or PostGradingPipeline()
         self.handlers = {
             'grading-begin': self.on_grading_begin,
             'grading-end': self.on_grading_end,
@@ -72,7 +143,8 @@ class JudgeHandler(ZlibPacketHandler):
         self.tier = None
         self.batch_id = None
         self.in_batch = False
-        self._stop_ping = threading.Event()
+        self._ping_job = None
+        self._test_case_flush_job = None
         self._ping_average = deque(maxlen=6)  # 1 minute average, just like load
         self._time_delta = deque(maxlen=6)
 
@@ -84,6 +156,17 @@ class JudgeHandler(ZlibPacketHandler):
 
         self._submission_cache_id = None
         self._submission_cache = {}
+        self._organization_cache = {}
+        self._organization_cache_time = time.monotonic()
+
+        # Write-behind buffer of test case results for the submission being graded, see _flush_test_cases.
+        # It is also flushed from _flush_stale_test_cases, which runs on another thread.
+        self._test_case_lock = threading.RLock()
+        self._test_case_buffer_id = None
+        self._test_case_buffer = []
+        self._test_case_position = 0
+        self._test_case_flush_time = 0
+        self._grading_result = None
 
     def on_connect(self):
         self.timeout = 15
@@ -91,7 +174,13 @@ class JudgeHandler(ZlibPacketHandler):
         json_log.info(self._make_json_log(action='connect'))
 
     def on_disconnect(self):
-        self._stop_ping.set()
+        if self._ping_job is not None:
+            self._ping_job.cancel()
+        if self._test_case_flush_job is not None:
+            self._test_case_flush_job.cancel()
+        if self._no_response_job is not None:
+            self._no_response_job.cancel()
+        self._flush_test_cases()
         if self._working:
             logger.error('Judge %s disconnected while handling submission %s', self.name, self._working)
         self.judges.remove(self)
@@ -179,7 +268,9 @@ class JudgeHandler(ZlibPacketHandler):
         self.send({'name': 'handshake-success'})
         logger.info('Judge authenticated: %s (%s)', self.client_address, packet['id'])
         self.judges.register(self)
-        threading.Thread(target=self._ping_thread).start()
+        self._ping_job = self.server.call_periodically(10, self._ping)
+        self._test_case_flush_job = self.server.call_periodically(settings.BRIDGED_JUDGE_TEST_CASE_FLUSH_INTERVAL,
+                                                                  self._flush_stale_test_cases)
         self._connected()
 
     def can_judge(self, problem, executor, judge_id=None):
@@ -243,7 +334,7 @@ class JudgeHandler(ZlibPacketHandler):
             raise SubmissionUnavailable('submission %s vanished before it could be dispatched' % id)
 
         self._working = id
-        self._no_response_job = threading.Timer(20, self._kill_if_no_response)
+        self._no_response_job = self.server.call_later(20, self._kill_if_no_response)
         self.send({
             'name': 'submission-request',
             'submission-id': id,
@@ -389,6 +480,8 @@ class JudgeHandler(ZlibPacketHandler):
     def on_grading_begin(self, packet):
         logger.info('%s: Grading has begun on: %s', self.name, packet['submission-id'])
         self.batch_id = None
+        self._flush_test_cases()
+        self._reset_test_cases(packet['submission-id'])
 
         if Submission.objects.filter(id=packet['submission-id']).update(
                 status='G', is_pretested=packet['pretested'], current_testcase=1,
@@ -403,62 +496,45 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_grading_end(self, packet):
         logger.info('%s: Grading has ended on: %s', self.name, packet['submission-id'])
+        self._flush_test_cases()
         self._free_self(packet)
         self.batch_id = None
 
+        id = packet['submission-id']
         try:
-            submission = Submission.objects.get(id=packet['submission-id'])
+            submission = Submission.objects.select_related('problem', 'user').get(id=id)
         except Submission.DoesNotExist:
-            logger.warning('Unknown submission: %s', packet['submission-id'])
+            logger.warning('Unknown submission: %s', id)
             json_log.error(self._make_json_log(packet, action='grading-end', info='unknown submission'))
             return
 
-        time = 0.0
-        total_time = 0.0
-        memory = 0
-        points = 0.0
-        total = 0
-        status = 0
-        status_codes = ['SC', 'AC', 'PAC', 'WA', 'MLE', 'TLE', 'IR', 'RTE', 'OLE']
-        batches = {}  # batch number: (points, total)
-
-        for case in SubmissionTestCase.objects.filter(submission=submission):
-            time = max(time, case.time)
-            total_time += case.time
-            memory = max(memory, case.memory)
-            if not case.batch:
-                points += case.points
-                total += case.total
-            else:
-                if case.batch in batches:
-                    batches[case.batch][0] = min(batches[case.batch][0], case.points)
-                    batches[case.batch][1] = max(batches[case.batch][1], case.total)
-                else:
-                    batches[case.batch] = [case.points, case.total]
-            i = status_codes.index(case.status)
-            if i > status:
-                status = i
-
-        for i in batches:
-            points += batches[i][0]
-            total += batches[i][1]
-
-        points = round(points, 3)
-        total = round(total, 3)
-        submission.case_points = points
-        submission.case_total = total
+        # Every test case of the submission passed through this handler since grading began, unless the judge
+        # skipped the grading-begin packet, so there is usually no need to read them back.
+        if self._test_case_buffer_id == id:
+            result = self._grading_result
+        else:
+            result = GradingResult.from_database(id)
+        time = result.time
+        memory = result.memory
+        points = result.case_points
+        total = result.case_total
 
         problem = submission.problem
         sub_points = round(points / total * problem.points if total > 0 else 0, 3)
         if not problem.partial and sub_points != problem.points:
             sub_points = 0
 
-        submission.status = 'D'
-        submission.time = time
-        submission.memory = memory
-        submission.points = sub_points
-        submission.result = status_codes[status]
-        submission.save()
+        changed = []
+        for field, value in (('status', 'D'), ('time', time), ('memory', memory), ('points', sub_points),
+                             ('result', result.result), ('case_points', points), ('case_total', total)):
+            if getattr(submission, field) != value:
+                setattr(submission, field, value)
+                changed.append(field)
+        submission.save(update_fields=changed)
+        users = UserProblemScore.update_from_submission(submission)
+        if not submission.user.is_unlisted:
+            # The result was reset when the submission was queued, so this can only add an accepted submission.
+            Problem.update_submission_counts(problem.id, accepted=int(submission.result == 'AC'), users=users)
 
         json_log.info(self._make_json_log(
             packet, action='grading-end', time=time, memory=memory,
@@ -467,21 +543,18 @@ class JudgeHandler(ZlibPacketHandler):
             problem=problem.code, finish=True,
         ))
 
+        # The contest points of the submission itself are cheap to update, everything else that depends on the
+        # result is recomputed in the background. The contest update event is posted once the ranking is.
+        submission.update_contest(recompute=False)
         if problem.is_public and not problem.is_organization_private:
-            submission.user._updating_stats_only = True
-            submission.user.calculate_points()
-
-        problem._updating_stats_only = True
-        problem.update_stats()
-        submission.update_contest()
-        submission.update_credit(total_time)
+            self.post_grading.update_user(submission.user_id)
+        if hasattr(submission, 'contest'):
+            self.post_grading.update_participation(submission.contest.participation_id)
+        self.post_grading.update_credit(submission.id, result.total_time)
 
         finished_submission(submission)
 
         event.post('sub_%s' % submission.id_secret, {'type': 'grading-end'})
-        if hasattr(submission, 'contest'):
-            participation = submission.contest.participation
-            event.post('contest_%d' % participation.contest_id, {'type': 'update'})
         self._post_update_submission(submission.id, 'grading-end', done=True)
 
     def on_compile_error(self, packet):
@@ -489,6 +562,7 @@ class JudgeHandler(ZlibPacketHandler):
         self._free_self(packet)
 
         if Submission.objects.filter(id=packet['submission-id']).update(status='CE', result='CE', error=packet['log']):
+            self._update_rejudged_score(packet['submission-id'])
             event.post('sub_%s' % Submission.get_id_secret(packet['submission-id']), {'type': 'compile-error'})
             self._post_update_submission(packet['submission-id'], 'compile-error', done=True)
             json_log.info(self._make_json_log(packet, action='compile-error', log=packet['log'],
@@ -514,10 +588,12 @@ class JudgeHandler(ZlibPacketHandler):
             raise ValueError('\n\n' + packet['message'])
         except ValueError:
             logger.exception('Judge %s failed while handling submission %s', self.name, packet['submission-id'])
+        self._flush_test_cases()
         self._free_self(packet)
 
         id = packet['submission-id']
         if Submission.objects.filter(id=id).update(status='IE', result='IE', error=packet['message']):
+            self._update_rejudged_score(id)
             event.post('sub_%s' % Submission.get_id_secret(id), {'type': 'internal-error'})
             self._post_update_submission(id, 'internal-error', done=True)
             json_log.info(self._make_json_log(packet, action='internal-error', message=packet['message'],
@@ -529,9 +605,11 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_submission_terminated(self, packet):
         logger.info('%s: Submission aborted: %s', self.name, packet['submission-id'])
+        self._flush_test_cases()
         self._free_self(packet)
 
         if Submission.objects.filter(id=packet['submission-id']).update(status='AB', result='AB', points=0):
+            self._update_rejudged_score(packet['submission-id'])
             event.post('sub_%s' % Submission.get_id_secret(packet['submission-id']), {'type': 'aborted'})
             self._post_update_submission(packet['submission-id'], 'aborted', done=True)
             json_log.info(self._make_json_log(packet, action='aborted', finish=True, result='AB'))
@@ -540,6 +618,22 @@ class JudgeHandler(ZlibPacketHandler):
             json_log.error(self._make_json_log(packet, action='aborted', info='unknown submission',
                                                finish=True, result='AB'))
 
+    def _update_rejudged_score(self, id):
+        # The score of a user is otherwise only updated when grading ends. A rejudge that never gets there may still
+        # have taken away what used to be their best submission.
+        try:
+            data = Submission.objects.filter(id=id, rejudged_date__isnull=False).values(
+                'user_id', 'user__is_unlisted', 'problem_id', 'problem__is_public',
+                'problem__is_organization_private',
+            ).get()
+        except Submission.DoesNotExist:
+            return
+        users = UserProblemScore.recompute(data['user_id'], data['problem_id'])
+        if not data['user__is_unlisted']:
+            Problem.update_submission_counts(data['problem_id'], users=users)
+        if data['problem__is_public'] and not data['problem__is_organization_private']:
+            self.post_grading.update_user(data['user_id'])
+
     def on_batch_begin(self, packet):
         logger.info('%s: Batch began on: %s', self.name, packet['submission-id'])
         self.in_batch = True
@@ -558,60 +652,79 @@ class JudgeHandler(ZlibPacketHandler):
     def on_test_case(self, packet, max_feedback=SubmissionTestCase._meta.get_field('feedback').max_length):
         logger.info('%s: %d test case(s) completed on: %s', self.name, len(packet['cases']), packet['submission-id'])
 
-        id = packet['submission-id']
-        updates = packet['cases']
-        max_position = max(map(itemgetter('position'), updates))
-
-        if not Submission.objects.filter(id=id).update(current_testcase=max_position + 1):
-            logger.warning('Unknown submission: %s', id)
-            json_log.error(self._make_json_log(packet, action='test-case', info='unknown submission'))
-            return
-
-        bulk_test_case_updates = []
-        for result in updates:
-            test_case = SubmissionTestCase(submission_id=id, case=result['position'])
-            status = result['status']
-            if status & 4:
-                test_case.status = 'TLE'
-            elif status & 8:
-                test_case.status = 'MLE'
-            elif status & 64:
-                test_case.status = 'OLE'
-            elif status & 2:
-                test_case.status = 'RTE'
-            elif status & 16:
-                test_case.status = 'IR'
-            elif status & 1:
-                test_case.status = 'WA'
-            elif status & 32:
-                test_case.status = 'SC'
-            else:
-                if result['points'] < result['total-points']:
-                    test_case.status = 'PAC'
+        with self._test_case_lock:
+            id = packet['submission-id']
+            updates = packet['cases']
+            if self._test_case_buffer_id != id:
+                self._flush_test_cases()
+                self._reset_test_cases(id)
+            self._test_case_position = max(self._test_case_position, *map(itemgetter('position'), updates))
+
+            for result in updates:
+                test_case = SubmissionTestCase(submission_id=id, case=result['position'])
+                status = result['status']
+                if status & 4:
+                    test_case.status = 'TLE'
+                elif status & 8:
+                    test_case.status = 'MLE'
+                elif status & 64:
+                    test_case.status = 'OLE'
+                elif status & 2:
+                    test_case.status = 'RTE'
+                elif status & 16:
+                    test_case.status = 'IR'
+                elif status & 1:
+                    test_case.status = 'WA'
+                elif status & 32:
+                    test_case.status = 'SC'
                 else:
-                    test_case.status = 'AC'
-            test_case.time = result['time']
-            test_case.memory = result['memory']
-            test_case.points = result['points']
-            test_case.total = result['total-points']
-            test_case.batch = self.batch_id if self.in_batch else None
-            test_case.feedback = (result.get('feedback') or '')[:max_feedback]
-            test_case.extended_feedback = result.get('extended-feedback') or ''
-            test_case.output = result['output']
-            bulk_test_case_updates.append(test_case)
-
-            json_log.info(self._make_json_log(
-                packet, action='test-case', case=test_case.case, batch=test_case.batch,
-                time=test_case.time, memory=test_case.memory, feedback=test_case.feedback,
-                extended_feedback=test_case.extended_feedback, output=test_case.output,
-                points=test_case.points, total=test_case.total, status=test_case.status,
-                voluntary_context_switches=result.get('voluntary-context-switches', 0),
-                involuntary_context_switches=result.get('involuntary-context-switches', 0),
-                runtime_version=result.get('runtime-version', ''),
-            ))
-
-        SubmissionTestCase.objects.bulk_create(bulk_test_case_updates)
+                    if result['points'] < result['total-points']:
+                        test_case.status = 'PAC'
+                    else:
+                        test_case.status = 'AC'
+                test_case.time = result['time']
+                test_case.memory = result['memory']
+                test_case.points = result['points']
+                test_case.total = result['total-points']
+                test_case.batch = self.batch_id if self.in_batch else None
+                test_case.feedback = (result.get('feedback') or '')[:max_feedback]
+                test_case.extended_feedback = result.get('extended-feedback') or ''
+                test_case.output = result['output']
+                self._test_case_buffer.append(test_case)
+                self._grading_result.add(test_case)
+
+                json_log.info(self._make_json_log(
+                    packet, action='test-case', case=test_case.case, batch=test_case.batch,
+                    time=test_case.time, memory=test_case.memory, feedback=test_case.feedback,
+                    extended_feedback=test_case.extended_feedback, output=test_case.output,
+                    points=test_case.points, total=test_case.total, status=test_case.status,
+                    voluntary_context_switches=result.get('voluntary-context-switches', 0),
+                    involuntary_context_switches=result.get('involuntary-context-switches', 0),
+                    runtime_version=result.get('runtime-version', ''),
+                ))
+
+            if len(self._test_case_buffer) < settings.BRIDGED_JUDGE_TEST_CASE_BUFFER_SIZE and \
+                    time.monotonic() - self._test_case_flush_time < settings.BRIDGED_JUDGE_TEST_CASE_FLUSH_INTERVAL:
+                return
+
+            # Clients read test cases from the database, so there is nothing new to tell them until we write.
+            if self._flush_test_cases():
+                self._post_test_cases(id)
+
+    def _flush_stale_test_cases(self):
+        # Judges may take a long time to send the next test case, which must not hold back the ones already received.
+        with self._test_case_lock:
+            if time.monotonic() - self._test_case_flush_time < settings.BRIDGED_JUDGE_TEST_CASE_FLUSH_INTERVAL:
+                return
+            id = self._test_case_buffer_id
+            try:
+                if self._flush_test_cases():
+                    self._post_test_cases(id)
+            except Exception:
+                # Keep the periodic job running.
+                logger.exception('Failed to post test cases of submission %s', id)
 
+    def _post_test_cases(self, id):
         data = self._get_submission_cache(id)
         if data['problem__testcase_result_visibility_mode'] != ProblemTestcaseResultAccess.ALL_TEST_CASE:
             return
@@ -634,6 +747,38 @@ class JudgeHandler(ZlibPacketHandler):
             event.post('sub_%s' % Submission.get_id_secret(id), {'type': 'test-case'})
             self._post_update_submission(id, state='test-case')
 
+    def _reset_test_cases(self, id):
+        with self._test_case_lock:
+            self._test_case_buffer_id = id
+            self._test_case_position = 0
+            self._test_case_flush_time = time.monotonic()
+            self._grading_result = GradingResult()
+
+    def _flush_test_cases(self):
+        # Test case results are coalesced per submission instead of being written as each packet arrives, since
+        # problems with many small tests would otherwise cost two queries per test case. The buffer is flushed
+        # whenever it grows large or old enough, and before anything that reads or replaces the test cases.
+        with self._test_case_lock:
+            id = self._test_case_buffer_id
+            cases = self._test_case_buffer
+            self._test_case_buffer = []
+            self._test_case_flush_time = time.monotonic()
+            if not cases:
+                return False
+
+            # Failing to save test cases must not keep the judge from being freed when grading ends.
+            try:
+                if not Submission.objects.filter(id=id).update(current_testcase=self._test_case_position + 1):
+                    logger.warning('Unknown submission: %s', id)
+                    json_log.error(self._make_json_log(sub=id, action='test-case', info='unknown submission'))
+                    return False
+                SubmissionTestCase.objects.bulk_create(cases)
+            except Exception:
+                logger.exception('Failed to save %d test case(s) of submission %s', len(cases), id)
+                self._packet_exception()
+                return False
+            return True
+
     def on_malformed(self, packet):
         logger.error('%s: Malformed packet: %s', self.name, packet)
         json_log.exception(self._make_json_log(sub=self._working, info='malformed json packet'))
@@ -650,12 +795,9 @@ class JudgeHandler(ZlibPacketHandler):
     def _free_self(self, packet):
         self.judges.on_judge_free(self, packet['submission-id'])
 
-    def _ping_thread(self):
+    def _ping(self):
         try:
-            while True:
-                self.ping()
-                if self._stop_ping.wait(10):
-                    break
+            self.ping()
         except Exception:
             logger.exception('Ping error in %s', self.name)
             self.close()
@@ -683,6 +825,20 @@ class JudgeHandler(ZlibPacketHandler):
 
         return self._submission_cache
 
+    def _get_user_organizations(self, user_id):
+        # The whole cache is dropped periodically, which bounds both its size and how stale it gets.
+        now = time.monotonic()
+        if now - self._organization_cache_time > ORGANIZATION_CACHE_TIME:
+            self._organization_cache.clear()
+            self._organization_cache_time = now
+
+        if user_id not in self._organization_cache:
+            self._organization_cache[user_id] = list(
+                Profile.organizations.through.objects.filter(profile_id=user_id)
+                .values_list('organization_id', flat=True),
+            )
+        return self._organization_cache[user_id]
+
     def _post_update_submission(self, id, state, done=False):
         data = self._get_submission_cache(id)
         if data['problem__is_public']:
@@ -692,8 +848,7 @@ class JudgeHandler(ZlibPacketHandler):
                 'contest': data['contest_object_id'],
                 'user': data['user_id'], 'problem': data['problem_id'],
                 'status': data['status'], 'language': data['language__key'],
-                'organizations':
-                [x[0] for x in Profile.objects.get(id=data['user_id']).organizations.values_list('id')],
+                'organizations': self._get_user_organizations(data['user_id']),
             })
 
     def on_cleanup(self):
@@ -1,5 +1,6 @@
 import logging
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from itertools import count
 from random import random
 from threading import RLock
 
@@ -9,22 +10,20 @@ from judge.bridge.judge_handler import SubmissionUnavailable
 from judge.judge_priority import REJUDGE_PRIORITY
 from judge.tasks import on_long_queue
 
-try:
-    from llist import dllist
-except ImportError:
-    from pyllist import dllist
-
 logger = logging.getLogger('judge.bridge')
 
-PriorityMarker = namedtuple('PriorityMarker', 'priority')
+QueuedSubmission = namedtuple('QueuedSubmission', 'id problem language source judge_id banned_judges priority sequence')
 
 
 class JudgeList(object):
     priorities = 4
 
     def __init__(self):
-        self.queue = dllist()
-        self.priority = [self.queue.append(PriorityMarker(i)) for i in range(self.priorities)]
+        # The queue is indexed by priority, then by problem, then by (language, judge_id). Each bucket is in FIFO
+        # order, and the sequence number of a queued submission gives the order across the buckets of the same
+        # priority. This way, a free judge only has to look at the heads of the buckets of the problems it supports.
+        self.queue = [{} for _ in range(self.priorities)]
+        self.sequence = count()
         self.judges = set()
         self.node_map = {}
         self.submission_map = {}
@@ -33,39 +32,79 @@ class JudgeList(object):
         self.problems = set()
         self.problem_ids = set()
 
+    def _next_queued_submission(self, judge):
+        for priority, problems in enumerate(self.queue):
+            if not problems:
+                continue
+            if priority >= REJUDGE_PRIORITY and self.should_reserve_judge():
+                return None
+
+            # Go through whichever is smaller of the problems the judge supports and those with queued submissions.
+            if len(judge.problems) < len(problems):
+                candidates = ((problem, problems[problem]) for problem in judge.problems if problem in problems)
+            else:
+                candidates = ((problem, buckets) for problem, buckets in problems.items() if problem in judge.problems)
+
+            best = None
+            for problem, buckets in candidates:
+                for (language, judge_id), bucket in buckets.items():
+                    # Buckets are FIFO, so nothing in this bucket can come before the best candidate found so far.
+                    if best is not None and next(iter(bucket.values())).sequence > best.sequence:
+                        continue
+                    if not judge.can_judge(problem, language, judge_id):
+                        continue
+                    for queued in bucket.values():
+                        if best is not None and queued.sequence > best.sequence:
+                            break
+                        if judge.name not in queued.banned_judges:
+                            best = queued
+                            break
+            if best is not None:
+                return best
+        return None
+
+    def _enqueue(self, id, problem, language, source, judge_id, priority, banned_judges):
+        queued = QueuedSubmission(id, problem, language, source, judge_id, banned_judges, priority, next(self.sequence))
+        buckets = self.queue[priority].setdefault(problem, {})
+        buckets.setdefault((language, judge_id), OrderedDict())[id] = queued
+        self.node_map[id] = queued
+
+    def _dequeue(self, id):
+        queued = self.node_map.pop(id)
+        problems = self.queue[queued.priority]
+        buckets = problems[queued.problem]
+        key = (queued.language, queued.judge_id)
+        bucket = buckets[key]
+        del bucket[id]
+        if not bucket:
+            del buckets[key]
+            if not buckets:
+                del problems[queued.problem]
+
     def _handle_free_judge(self, judge):
         with self.lock:
             if judge.tier > self.min_tier:
                 return
 
-            node = self.queue.first
-            priority = 0
-            while node:
-                if isinstance(node.value, PriorityMarker):
-                    priority = node.value.priority + 1
-                elif priority >= REJUDGE_PRIORITY and self.should_reserve_judge():
-                    return
-                else:
-                    id, problem, language, source, judge_id, banned_judges = node.value
-                    if judge.name not in banned_judges and judge.can_judge(problem, language, judge_id):
-                        try:
-                            judge.submit(id, problem, language, source)
-                        except SubmissionUnavailable:
-                            logger.error('Dropping queued submission %d, it is no longer available', id)
-                            self.queue.remove(node)
-                            del self.node_map[id]
-                            # The judge is fine, so let it pick up the next queued submission.
-                            return self._handle_free_judge(judge)
-                        except Exception:
-                            logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
-                            self.judges.remove(judge)
-                            return
-                        self.submission_map[id] = judge
-                        logger.info('Dispatched queued submission %d: %s', id, judge.name)
-                        self.queue.remove(node)
-                        del self.node_map[id]
-                        break
-                node = node.next
+            queued = self._next_queued_submission(judge)
+            if queued is None:
+                return
+
+            id, problem, language = queued.id, queued.problem, queued.language
+            try:
+                judge.submit(id, problem, language, queued.source)
+            except SubmissionUnavailable:
+                logger.error('Dropping queued submission %d, it is no longer available', id)
+                self._dequeue(id)
+                # The judge is fine, so let it pick up the next queued submission.
+                return self._handle_free_judge(judge)
+            except Exception:
+                logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
+                self.judges.remove(judge)
+                return
+            self.submission_map[id] = judge
+            logger.info('Dispatched queued submission %d: %s', id, judge.name)
+            self._dequeue(id)
 
     def _update_min_tier(self):
         with self.lock:
@@ -184,13 +223,8 @@ class JudgeList(object):
                 self.submission_map[submission].abort()
                 return True
             except KeyError:
-                try:
-                    node = self.node_map[submission]
-                except KeyError:
-                    pass
-                else:
-                    self.queue.remove(node)
-                    del self.node_map[submission]
+                if submission in self.node_map:
+                    self._dequeue(submission)
                 return False
 
     def check_priority(self, priority):
@@ -232,10 +266,7 @@ class JudgeList(object):
                     return self.judge(id, problem, language, source, judge_id, priority, banned_judges)
                 self.submission_map[id] = judge
             else:
-                self.node_map[id] = self.queue.insert(
-                    (id, problem, language, source, judge_id, banned_judges),
-                    self.priority[priority],
-                )
+                self._enqueue(id, problem, language, source, judge_id, priority, banned_judges)
                 logger.info('Queued submission: %d', id)
-                if self.queue.size == settings.VNOJ_LONG_QUEUE_ALERT_THRESHOLD + self.priorities:
+                if len(self.node_map) == settings.VNOJ_LONG_QUEUE_ALERT_THRESHOLD:
                     on_long_queue.delay()
@@ -0,0 +1,164 @@
+import heapq
+import logging
+import threading
+import time
+from itertools import count
+
+from django import db
+
+from judge import event_poster as event
+from judge.models import ContestParticipation, Organization, Profile, Submission
+from judge.utils.float_compare import float_compare_equal
+
+logger = logging.getLogger('judge.bridge')
+
+
+class PostGradingPipeline:
+    """Recomputes the statistics that depend on graded submissions, away from the judge handlers.
+
+    Each update is keyed by the object it recomputes. Scheduling an update that is already pending does nothing,
+    so that e.g. a burst of submissions by the same user results in a single `Profile.calculate_points` once the
+    first of them is `delay` seconds old.
+
+    If `delay` is None, updates run as soon as they are scheduled, on the calling thread.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = delay
+        self._lock = threading.Condition()
+        self._pending = {}  # key: (func, args)
+        self._deadlines = []  # heap of (deadline, sequence, key)
+        self._sequence = count()
+        self._thread = None
+        self._stopping = False
+
+        self.scheduled = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def synchronous(self):
+        return self.delay is None
+
+    def start(self):
+        if not self.synchronous:
+            self._thread = threading.Thread(target=self._work, name='post-grading')
+            self._thread.start()
+
+    def stop(self):
+        # Pending updates are run right away rather than dropped.
+        if self._thread is not None:
+            with self._lock:
+                self._stopping = True
+                self._lock.notify()
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'pending': len(self._pending),
+                'oldest': max(now - self._deadlines[0][0] + self.delay, 0) if self._deadlines else 0,
+                'scheduled': self.scheduled,
+                'coalesced': self.coalesced,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+
+    def schedule(self, key, func, *args):
+        with self._lock:
+            self.scheduled += 1
+            if key in self._pending:
+                self.coalesced += 1
+                return
+            # Updates scheduled by handlers that outlive stop() are run right away, so that they are not lost.
+            if not self.synchronous and not self._stopping:
+                self._pending[key] = (func, args)
+                heapq.heappush(self._deadlines, (time.monotonic() + self.delay, next(self._sequence), key))
+                self._lock.notify()
+                return
+        self._run(key, func, args)
+
+    def update_user(self, profile_id):
+        self.schedule(('user', profile_id), self._update_user, profile_id)
+
+    def update_organization(self, organization_id):
+        self.schedule(('organization', organization_id), self._update_organization, organization_id)
+
+    def update_participation(self, participation_id):
+        self.schedule(('participation', participation_id), self._update_participation, participation_id)
+
+    def update_credit(self, submission_id, consumed_credit):
+        # Credit is consumed once per submission, so there is nothing to coalesce here.
+        self.schedule(('credit', submission_id), self._update_credit, submission_id, consumed_credit)
+
+    def _update_user(self, profile_id):
+        profile = Profile.objects.filter(id=profile_id).first()
+        if profile is None:
+            return
+        profile._updating_stats_only = True
+        performance_points = profile.performance_points
+        profile.calculate_points(update_organizations=False)
+        if not float_compare_equal(performance_points, profile.performance_points):
+            for organization_id in profile.organizations.values_list('id', flat=True):
+                self.update_organization(organization_id)
+
+    def _update_organization(self, organization_id):
+        organization = Organization.objects.filter(id=organization_id).first()
+        if organization is not None:
+            organization.calculate_points()
+
+    def _update_participation(self, participation_id):
+        participation = ContestParticipation.objects.filter(id=participation_id).first()
+        if participation is not None:
+            participation.recompute_results()
+            event.post('contest_%d' % participation.contest_id, {'type': 'update'})
+
+    def _update_credit(self, submission_id, consumed_credit):
+        submission = Submission.objects.filter(id=submission_id).select_related('problem').first()
+        if submission is not None:
+            submission.update_credit(consumed_credit)
+
+    def _run(self, key, func, args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Failed to update %s %s', *key)
+            failed = True
+        else:
+            failed = False
+
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def _next(self):
+        with self._lock:
+            while True:
+                if self._deadlines:
+                    wait = self._deadlines[0][0] - time.monotonic()
+                    if wait <= 0 or self._stopping:
+                        _, _, key = heapq.heappop(self._deadlines)
+                        func, args = self._pending.pop(key)
+                        return key, func, args
+                elif self._stopping:
+                    return None
+                else:
+                    wait = None
+                self._lock.wait(wait)
+
+    def _work(self):
+        try:
+            while True:
+                job = self._next()
+                if job is None:
+                    break
+                # This thread may sit idle for a long time between updates.
+                db.connection.close_if_unusable_or_obsolete()
+                self._run(*job)
+        finally:
+            db.connection.close()
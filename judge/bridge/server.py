@@ -2,8 +2,36 @@ import threading
 from socketserver import TCPServer, ThreadingMixIn
 
 
+class PeriodicThread(threading.Thread):
+    def __init__(self, interval, func):
+        super().__init__()
+        self.interval = interval
+        self.func = func
+        self._cancelled = threading.Event()
+
+    def run(self):
+        while True:
+            self.func()
+            if self._cancelled.wait(self.interval):
+                break
+
+    def cancel(self):
+        self._cancelled.set()
+
+
 class ThreadingTCPListener(ThreadingMixIn, TCPServer):
     allow_reuse_address = True
+    asynchronous = False
+
+    def call_periodically(self, interval, func):
+        job = PeriodicThread(interval, func)
+        job.start()
+        return job
+
+    def call_later(self, delay, func):
+        job = threading.Timer(delay, func)
+        job.start()
+        return job
 
 
 class Server:
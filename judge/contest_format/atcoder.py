@@ -1,10 +1,9 @@
 from django.core.exceptions import ValidationError
-from django.db import connection
 from django.utils.translation import gettext as _, gettext_lazy, ngettext
 
+from judge.contest_format.base import best_submission, counts_towards_penalty
 from judge.contest_format.default import DefaultContestFormat
 from judge.contest_format.registry import register_contest_format
-from judge.timezone import from_database_time
 
 
 @register_contest_format('atcoder')
@@ -37,56 +36,38 @@ class AtCoderContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def update_participation(self, participation):
+    def score_participation(self, participation, problem_submissions):
         cumtime = 0
         penalty = 0
         points = 0
         format_data = {}
 
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT MAX(cs.points) as `score`, (
-                    SELECT MIN(csub.date)
-                        FROM judge_contestsubmission ccs LEFT OUTER JOIN
-                             judge_submission csub ON (csub.id = ccs.submission_id)
-                        WHERE ccs.problem_id = cp.id AND ccs.participation_id = %s AND ccs.points = MAX(cs.points)
-                ) AS `time`, cp.id AS `prob`
-                FROM judge_contestproblem cp INNER JOIN
-                     judge_contestsubmission cs ON (cs.problem_id = cp.id AND cs.participation_id = %s) LEFT OUTER JOIN
-                     judge_submission sub ON (sub.id = cs.submission_id)
-                GROUP BY cp.id
-            """, (participation.id, participation.id))
+        for prob, subs in problem_submissions.items():
+            score, time = best_submission(subs)
+            dt = (time - participation.start).total_seconds()
 
-            for score, time, prob in cursor.fetchall():
-                time = from_database_time(time)
-                dt = (time - participation.start).total_seconds()
-
-                # Compute penalty
-                if self.config['penalty']:
-                    # An IE can have a submission result of `None`
-                    subs = participation.submissions.exclude(submission__result__isnull=True) \
-                                                    .exclude(submission__result__in=['IE', 'CE']) \
-                                                    .filter(problem_id=prob)
-                    if score:
-                        prev = subs.filter(submission__date__lte=time).count() - 1
-                        penalty += prev * self.config['penalty'] * 60
-                    else:
-                        # We should always display the penalty, even if the user has a score of 0
-                        prev = subs.count()
+            # Compute penalty
+            if self.config['penalty']:
+                subs = [sub for sub in subs if counts_towards_penalty(sub)]
+                if score:
+                    prev = sum(sub.date <= time for sub in subs) - 1
+                    penalty += prev * self.config['penalty'] * 60
                 else:
-                    prev = 0
+                    # We should always display the penalty, even if the user has a score of 0
+                    prev = len(subs)
+            else:
+                prev = 0
 
-                if score:
-                    cumtime = max(cumtime, dt)
+            if score:
+                cumtime = max(cumtime, dt)
 
-                format_data[str(prob)] = {'time': dt, 'points': score, 'penalty': prev}
-                points += score
+            format_data[str(prob)] = {'time': dt, 'points': score, 'penalty': prev}
+            points += score
 
         participation.cumtime = max(cumtime + penalty, 0)
         participation.score = round(points, self.contest.points_precision)
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def get_short_form_display(self):
         yield _('The maximum score submission for each problem will be used.')
@@ -1,4 +1,9 @@
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+ContestSubmissionInfo = namedtuple('ContestSubmissionInfo', 'problem_id points date result')
 
 
 class abstractclassmethod(classmethod):
@@ -10,6 +15,9 @@ class abstractclassmethod(classmethod):
 
 
 class BaseContestFormat(metaclass=ABCMeta):
+    # Whether score_participation is implemented, so that a contest can be rescored in bulk.
+    scores_from_submissions = False
+
     @abstractmethod
     def __init__(self, contest, config):
         self.config = config
@@ -47,6 +55,33 @@ class BaseContestFormat(metaclass=ABCMeta):
         """
         raise NotImplementedError()
 
+    def score_participation(self, participation, problem_submissions):
+        """
+        Updates a ContestParticipation object's score, cumtime, and format_data fields from its contest submissions.
+        Unlike update_participation, implementations should not query the database nor call
+        ContestParticipation.save(), so that a whole contest can be rescored at once.
+
+        :param participation: A ContestParticipation object.
+        :param problem_submissions: The participation's submissions, as returned by get_participation_submissions.
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def get_contest_submissions(self):
+        """
+        Fetches the submissions that score_participation needs for every participation in the contest, in a single
+        query. The default implementation returns contest submissions, as get_participation_submissions does.
+
+        :return: An iterator of (participation id, submissions) pairs, ordered by participation id.
+        """
+        from judge.models import ContestSubmission
+
+        rows = ContestSubmission.objects.filter(participation__contest=self.contest) \
+            .order_by('participation_id', 'submission__date', 'submission_id') \
+            .values_list('participation_id', 'problem_id', 'points', 'submission__date', 'submission__result')
+        for participation_id, group in groupby(rows.iterator(), key=itemgetter(0)):
+            yield participation_id, group_by_problem(ContestSubmissionInfo._make(row[1:]) for row in group)
+
     def get_format_data_for_api(self, entry, problem_points, frozen=False):
         """
         Returns a sanitized copy of a single problem's format_data entry safe to expose via the ranking JSON API.
@@ -89,3 +124,44 @@ class BaseContestFormat(metaclass=ABCMeta):
         :return: A generator, where each item is an individual line.
         """
         raise NotImplementedError()
+
+
+def group_by_problem(submissions):
+    """
+    Groups a participation's contest submissions by problem.
+
+    :param submissions: An iterable of ContestSubmissionInfo, ordered by date.
+    :return: A dict mapping each attempted ContestProblem id to its ContestSubmissionInfo list, ordered by date.
+    """
+    problems = {}
+    for info in submissions:
+        problems.setdefault(info.problem_id, []).append(info)
+    return {problem_id: problems[problem_id] for problem_id in sorted(problems)}
+
+
+def get_participation_submissions(participation):
+    """
+    Fetches every contest submission of a participation in a single query.
+
+    :param participation: A ContestParticipation object.
+    :return: The submissions, grouped as by group_by_problem.
+    """
+    return group_by_problem(map(ContestSubmissionInfo._make, participation.submissions
+                                .order_by('submission__date', 'submission_id')
+                                .values_list('problem_id', 'points', 'submission__date', 'submission__result')))
+
+
+def counts_towards_penalty(submission):
+    # An IE can have a submission result of `None`
+    return submission.result is not None and submission.result not in ('IE', 'CE')
+
+
+def best_submission(submissions):
+    """
+    Finds the maximum score among a problem's submissions, and the earliest time it was reached.
+
+    :param submissions: A non-empty list of ContestSubmissionInfo, ordered by date.
+    :return: A (points, time) tuple.
+    """
+    points = max(submission.points for submission in submissions)
+    return points, next(submission.date for submission in submissions if submission.points == points)
@@ -1,14 +1,14 @@
 from django.core.exceptions import ValidationError
-from django.db.models import Max
 from django.utils.translation import gettext as _, gettext_lazy
 
-from judge.contest_format.base import BaseContestFormat
+from judge.contest_format.base import BaseContestFormat, get_participation_submissions
 from judge.contest_format.registry import register_contest_format
 
 
 @register_contest_format('default')
 class DefaultContestFormat(BaseContestFormat):
     name = gettext_lazy('Default')
+    scores_from_submissions = True
 
     @classmethod
     def validate(cls, config):
@@ -19,24 +19,26 @@ class DefaultContestFormat(BaseContestFormat):
         super(DefaultContestFormat, self).__init__(contest, config)
 
     def update_participation(self, participation):
+        self.score_participation(participation, get_participation_submissions(participation))
+        participation.save()
+
+    def score_participation(self, participation, problem_submissions):
         cumtime = 0
         points = 0
         format_data = {}
 
-        for result in participation.submissions.values('problem_id').annotate(
-                time=Max('submission__date'), points=Max('points'),
-        ):
-            dt = (result['time'] - participation.start).total_seconds()
-            if result['points']:
+        for prob, subs in problem_submissions.items():
+            problem_points = max(sub.points for sub in subs)
+            dt = (subs[-1].date - participation.start).total_seconds()
+            if problem_points:
                 cumtime += dt
-            format_data[str(result['problem_id'])] = {'time': dt, 'points': result['points']}
-            points += result['points']
+            format_data[str(prob)] = {'time': dt, 'points': problem_points}
+            points += problem_points
 
         participation.cumtime = max(cumtime, 0)
         participation.score = round(points, self.contest.points_precision)
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def get_problem_breakdown(self, participation, contest_problems):
         return [(participation.format_data or {}).get(str(contest_problem.id)) for contest_problem in contest_problems]
@@ -1,5 +1,5 @@
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _, gettext_lazy, ngettext
 
 from judge.contest_format.default import DefaultContestFormat
@@ -39,40 +39,28 @@ class ECOOContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def update_participation(self, participation):
+    @cached_property
+    def problem_points(self):
+        return dict(self.contest.contest_problems.values_list('id', 'points'))
+
+    def score_participation(self, participation, problem_submissions):
         cumtime = 0
         score = 0
         format_data = {}
 
-        submissions = participation.submissions.exclude(submission__result__in=('IE', 'CE'))
-
-        submission_counts = {
-            data['problem_id']: data['count'] for data in submissions.values('problem_id').annotate(count=Count('id'))
-        }
-        queryset = (
-            submissions
-            .values('problem_id')
-            .filter(
-                submission__date=Subquery(
-                    submissions
-                    .filter(problem_id=OuterRef('problem_id'))
-                    .order_by('-submission__date')
-                    .values('submission__date')[:1],
-                ),
-            )
-            .annotate(points=Max('points'))
-            .values_list('problem_id', 'problem__points', 'points', 'submission__date')
-        )
-
-        for problem_id, problem_points, points, date in queryset:
-            sub_cnt = submission_counts.get(problem_id, 0)
+        for problem_id, subs in problem_submissions.items():
+            subs = [sub for sub in subs if sub.result not in ('IE', 'CE')]
+            if not subs:
+                continue
 
+            date = subs[-1].date
+            points = max(sub.points for sub in subs if sub.date == date)
             dt = (date - participation.start).total_seconds()
 
             bonus = 0
             if points > 0:
                 # First AC bonus
-                if sub_cnt == 1 and points == problem_points:
+                if len(subs) == 1 and points == self.problem_points[problem_id]:
                     bonus += self.config['first_ac_bonus']
                 # Time bonus
                 if self.config['time_bonus']:
@@ -89,7 +77,6 @@ class ECOOContestFormat(DefaultContestFormat):
         participation.score = round(score, self.contest.points_precision)
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def get_short_form_display(self):
         yield _('The score on your **last** non-CE submission for each problem will be used.')
@@ -1,9 +1,33 @@
-from django.db import connection
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Min
 from django.utils.translation import gettext as _, gettext_lazy
 
+from judge.contest_format.base import group_by_problem
 from judge.contest_format.legacy_ioi import LegacyIOIContestFormat
 from judge.contest_format.registry import register_contest_format
-from judge.timezone import from_database_time
+
+BatchInfo = namedtuple('BatchInfo', 'problem_id batch points date')
+
+
+def _batch_results(filters, fields):
+    """
+    Fetches the points of each batch of the judged contest submissions whose test cases match `filters`, that is the
+    minimum points of its test cases, ordered by participation and submission date.
+
+    :param filters: Filters on SubmissionTestCase.
+    :param fields: The fields to return, as for values_list, among those that rows are grouped by and `points`.
+    """
+    from judge.models import SubmissionTestCase
+
+    return SubmissionTestCase.objects.filter(submission__status='D', **filters) \
+        .values('submission__contest__participation_id', 'submission__contest__problem_id', 'submission__date',
+                'submission_id', 'batch') \
+        .annotate(points=Min('points')) \
+        .order_by('submission__contest__participation_id', 'submission__date', 'submission_id', 'batch') \
+        .values_list(*fields)
 
 
 @register_contest_format('ioi16')
@@ -15,82 +39,51 @@ class IOIContestFormat(LegacyIOIContestFormat):
     """
 
     def update_participation(self, participation):
+        self.score_participation(participation, group_by_problem(map(BatchInfo._make, _batch_results(
+            {'submission__contest__participation': participation},
+            ('submission__contest__problem_id', 'batch', 'points', 'submission__date'),
+        ))))
+        participation.save()
+
+    def get_contest_submissions(self):
+        rows = _batch_results(
+            {'submission__contest__participation__contest': self.contest},
+            ('submission__contest__participation_id', 'submission__contest__problem_id', 'batch', 'points',
+             'submission__date'),
+        )
+        for participation_id, group in groupby(rows.iterator(), key=itemgetter(0)):
+            yield participation_id, group_by_problem(BatchInfo._make(row[1:]) for row in group)
+
+    def score_participation(self, participation, problem_submissions):
         cumtime = 0
         score = 0
         format_data = {}
 
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT q.prob,
-                       MIN(q.date) as `date`,
-                       q.batch_points
-                FROM (
-                         SELECT cp.id          as `prob`,
-                                sub.id         as `subid`,
-                                sub.date       as `date`,
-                                tc.points      as `points`,
-                                tc.batch       as `batch`,
-                                MIN(tc.points) as `batch_points`
-                         FROM judge_contestproblem cp
-                                  INNER JOIN
-                              judge_contestsubmission cs
-                              ON (cs.problem_id = cp.id AND cs.participation_id = %s)
-                                  LEFT OUTER JOIN
-                              judge_submission sub
-                              ON (sub.id = cs.submission_id AND sub.status = 'D')
-                                  INNER JOIN judge_submissiontestcase tc
-                              ON sub.id = tc.submission_id
-                         GROUP BY cp.id, tc.batch, sub.id
-                     ) q
-                         INNER JOIN (
-                    SELECT prob, batch, MAX(r.batch_points) as max_batch_points
-                    FROM (
-                             SELECT cp.id          as `prob`,
-                                    tc.batch       as `batch`,
-                                    MIN(tc.points) as `batch_points`
-                             FROM judge_contestproblem cp
-                                      INNER JOIN
-                                  judge_contestsubmission cs
-                                  ON (cs.problem_id = cp.id AND cs.participation_id = %s)
-                                      LEFT OUTER JOIN
-                                  judge_submission sub
-                                  ON (sub.id = cs.submission_id AND sub.status = 'D')
-                                      INNER JOIN judge_submissiontestcase tc
-                                  ON sub.id = tc.submission_id
-                             GROUP BY cp.id, tc.batch, sub.id
-                         ) r
-                    GROUP BY prob, batch
-                ) p
-                ON p.prob = q.prob AND (p.batch = q.batch OR p.batch is NULL AND q.batch is NULL)
-                WHERE p.max_batch_points = q.batch_points
-                GROUP BY q.prob, q.batch
-            """, (participation.id, participation.id))
-
-            for problem_id, time, subtask_points in cursor.fetchall():
-                problem_id = str(problem_id)
-                time = from_database_time(time)
+        for problem_id, batches in problem_submissions.items():
+            # The best points of each batch, and the time of the earliest submission that got them.
+            best = {}
+            for batch in batches:
+                if batch.points is not None and (batch.batch not in best or batch.points > best[batch.batch][0]):
+                    best[batch.batch] = (batch.points, batch.date)
+            if not best:
+                continue
+
+            points = 0
+            time = 0
+            for batch_points, date in best.values():
+                points += batch_points
                 if self.config['cumtime']:
-                    dt = (time - participation.start).total_seconds()
-                else:
-                    dt = 0
-
-                if format_data.get(problem_id) is None:
-                    format_data[problem_id] = {'points': 0, 'time': 0}
-                format_data[problem_id]['points'] += subtask_points
-                format_data[problem_id]['time'] = max(dt, format_data[problem_id]['time'])
-
-            for problem_data in format_data.values():
-                penalty = problem_data['time']
-                points = problem_data['points']
-                if self.config['cumtime'] and points:
-                    cumtime += penalty
-                score += points
+                    time = max((date - participation.start).total_seconds(), time)
+            format_data[str(problem_id)] = {'points': points, 'time': time}
+
+            if self.config['cumtime'] and points:
+                cumtime += time
+            score += points
 
         participation.cumtime = max(cumtime, 0)
         participation.score = round(score, self.contest.points_precision)
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def get_short_form_display(self):
         yield _('The maximum score for each problem batch will be used.')
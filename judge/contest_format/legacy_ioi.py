@@ -1,7 +1,7 @@
 from django.core.exceptions import ValidationError
-from django.db.models import Min, OuterRef, Subquery
 from django.utils.translation import gettext as _, gettext_lazy
 
+from judge.contest_format.base import best_submission
 from judge.contest_format.default import DefaultContestFormat
 from judge.contest_format.registry import register_contest_format
 
@@ -35,20 +35,14 @@ class LegacyIOIContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def update_participation(self, participation):
+    def score_participation(self, participation, problem_submissions):
         cumtime = 0
         last_submission_time = 0
         score = 0
         format_data = {}
 
-        queryset = (participation.submissions.values('problem_id')
-                                             .filter(points=Subquery(
-                                                 participation.submissions.filter(problem_id=OuterRef('problem_id'))
-                                                                          .order_by('-points').values('points')[:1]))
-                                             .annotate(time=Min('submission__date'))
-                                             .values_list('problem_id', 'time', 'points'))
-
-        for problem_id, time, points in queryset:
+        for problem_id, subs in problem_submissions.items():
+            points, time = best_submission(subs)
             if points:
                 dt = (time - participation.start).total_seconds()
                 if self.config['last_score_altering']:
@@ -65,7 +59,6 @@ class LegacyIOIContestFormat(DefaultContestFormat):
         participation.score = round(score, self.contest.points_precision)
         participation.tiebreaker = last_submission_time
         participation.format_data = format_data
-        participation.save()
 
     def get_short_form_display(self):
         yield _('The maximum score submission for each problem will be used.')
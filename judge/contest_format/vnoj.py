@@ -1,42 +1,14 @@
 from collections import namedtuple
 
 from django.core.exceptions import ValidationError
-from django.db import connection
 from django.utils.translation import gettext as _, gettext_lazy, ngettext
 
+from judge.contest_format.base import best_submission, counts_towards_penalty
 from judge.contest_format.default import DefaultContestFormat
 from judge.contest_format.registry import register_contest_format
-from judge.timezone import from_database_time, to_database_time
 
 ParticipationInfo = namedtuple('ParticipationInfo', 'cumtime score tiebreaker format_data')
 
-DEFAULT_RANKING_SQL = """
-SELECT MAX(cs.points) as `points`, (
-    SELECT MIN(csub.date)
-        FROM judge_contestsubmission ccs LEFT OUTER JOIN
-                judge_submission csub ON (csub.id = ccs.submission_id)
-        WHERE ccs.problem_id = cp.id AND ccs.participation_id = %s AND ccs.points = MAX(cs.points)
-) AS `time`, cp.id AS `prob`
-FROM judge_contestproblem cp INNER JOIN
-        judge_contestsubmission cs ON (cs.problem_id = cp.id AND cs.participation_id = %s) LEFT OUTER JOIN
-        judge_submission sub ON (sub.id = cs.submission_id)
-GROUP BY cp.id
-"""
-
-FROZEN_RANKING_SQL = """
-SELECT MAX(cs.points) as `points`, (
-    SELECT MIN(csub.date)
-        FROM judge_contestsubmission ccs LEFT OUTER JOIN
-                judge_submission csub ON (csub.id = ccs.submission_id)
-        WHERE ccs.problem_id = cp.id AND ccs.participation_id = %s AND ccs.points = MAX(cs.points) AND csub.date < %s
-) AS `time`, cp.id AS `prob`
-FROM judge_contestproblem cp INNER JOIN
-        judge_contestsubmission cs ON (cs.problem_id = cp.id AND cs.participation_id = %s) LEFT OUTER JOIN
-        judge_submission sub ON (sub.id = cs.submission_id)
-WHERE sub.date < %s
-GROUP BY cp.id
-"""
-
 
 @register_contest_format('vnoj')
 class VNOJContestFormat(DefaultContestFormat):
@@ -70,7 +42,7 @@ class VNOJContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def calculate_participation_info(self, participation, frozen=False) -> ParticipationInfo:
+    def calculate_participation_info(self, participation, problem_submissions, frozen=False) -> ParticipationInfo:
         cumtime = 0
         last = 0
         penalty = 0
@@ -79,49 +51,41 @@ class VNOJContestFormat(DefaultContestFormat):
 
         frozen_time = participation.contest.frozen_time
 
-        with connection.cursor() as cursor:
-            if not frozen:
-                cursor.execute(DEFAULT_RANKING_SQL, (participation.id, participation.id))
-            else:
-                db_time = to_database_time(frozen_time)
-                cursor.execute(FROZEN_RANKING_SQL, (participation.id, db_time,
-                                                    participation.id, db_time))
-
-            for points, time, prob in cursor.fetchall():
-                time = from_database_time(time)
-                dt = (time - participation.start).total_seconds()
-                # An IE can have a submission result of `None`
-                problem_subs = participation.submissions.exclude(submission__result__isnull=True) \
-                                            .exclude(submission__result__in=['IE', 'CE']) \
-                                            .filter(problem_id=prob)
-
-                # Compute penalty
-                if self.config['penalty']:
-                    subs = problem_subs
-                    if frozen:
-                        subs = subs.filter(submission__date__lt=frozen_time)
-
-                    if points:
-                        prev = subs.filter(submission__date__lte=time).count() - 1
-                        penalty += prev * self.config['penalty'] * 60
-                    else:
-                        # We should always display the penalty, even if the user has a score of 0
-                        prev = subs.count()
-                else:
-                    prev = 0
+        for prob, subs in problem_submissions.items():
+            problem_subs = [sub for sub in subs if counts_towards_penalty(sub)]
+            if frozen:
+                subs = [sub for sub in subs if sub.date < frozen_time]
+                if not subs:
+                    continue
+
+            points, time = best_submission(subs)
+            dt = (time - participation.start).total_seconds()
+
+            # Compute penalty
+            if self.config['penalty']:
+                subs = problem_subs
+                if frozen:
+                    subs = [sub for sub in subs if sub.date < frozen_time]
 
                 if points:
-                    cumtime += dt
-                    last = max(last, dt)
+                    prev = sum(sub.date <= time for sub in subs) - 1
+                    penalty += prev * self.config['penalty'] * 60
+                else:
+                    # We should always display the penalty, even if the user has a score of 0
+                    prev = len(subs)
+            else:
+                prev = 0
+
+            if points:
+                cumtime += dt
+                last = max(last, dt)
 
-                format_data[str(prob)] = {'time': dt, 'points': points, 'penalty': prev}
+            format_data[str(prob)] = {'time': dt, 'points': points, 'penalty': prev}
 
-                if not frozen and participation.contest.frozen_last_minutes != 0:
-                    format_data[str(prob)]['pending'] = problem_subs \
-                        .filter(submission__date__gte=frozen_time) \
-                        .count()
+            if not frozen and participation.contest.frozen_last_minutes != 0:
+                format_data[str(prob)]['pending'] = sum(sub.date >= frozen_time for sub in problem_subs)
 
-                score += points
+            score += points
 
         return ParticipationInfo(
             cumtime=max((last if self.config['LSO'] else cumtime) + penalty, 0),
@@ -130,8 +94,8 @@ class VNOJContestFormat(DefaultContestFormat):
             format_data=format_data,
         )
 
-    def update_participation(self, participation):
-        actual_info = self.calculate_participation_info(participation)
+    def score_participation(self, participation, problem_submissions):
+        actual_info = self.calculate_participation_info(participation, problem_submissions)
 
         participation.cumtime = actual_info.cumtime
         participation.score = actual_info.score
@@ -139,7 +103,7 @@ class VNOJContestFormat(DefaultContestFormat):
         format_data = actual_info.format_data
 
         if participation.contest.frozen_last_minutes != 0:
-            frozen_info = self.calculate_participation_info(participation, frozen=True)
+            frozen_info = self.calculate_participation_info(participation, problem_submissions, frozen=True)
             participation.frozen_cumtime = frozen_info.cumtime
             participation.frozen_score = frozen_info.score
             participation.frozen_tiebreaker = frozen_info.tiebreaker
@@ -155,7 +119,6 @@ class VNOJContestFormat(DefaultContestFormat):
                 format_data[prob] = new_prob_data
 
         participation.format_data = format_data
-        participation.save()
 
     def get_format_data_for_api(self, entry, problem_points, frozen=False):
         if not entry:
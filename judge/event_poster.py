@@ -1,18 +1,51 @@
 from django.conf import settings
 
-__all__ = ['last', 'post']
+__all__ = ['last', 'post', 'start_async', 'stop_async', 'async_metrics']
+
+_async_poster = None
 
 if not settings.EVENT_DAEMON_USE:
     real = False
 
-    def post(channel, message):
+    def _post(channel, message):
         return 0
 
+    def _post_batch(messages):
+        return [0] * len(messages)
+
     def last():
         return 0
 elif hasattr(settings, 'EVENT_DAEMON_AMQP'):
-    from .event_poster_amqp import last, post
+    from .event_poster_amqp import last, post as _post, post_batch as _post_batch
     real = True
 else:
-    from .event_poster_ws import last, post
+    from .event_poster_ws import last, post as _post, post_batch as _post_batch
     real = True
+
+
+def post(channel, message):
+    if _async_poster is not None:
+        return _async_poster.post(channel, message)
+    return _post(channel, message)
+
+
+def start_async(delay, max_pending):
+    """Sends the events posted from now on from a background thread, in batches. See `AsyncEventPoster`."""
+    global _async_poster
+    if real and _async_poster is None:
+        from .event_poster_async import AsyncEventPoster
+        _async_poster = AsyncEventPoster(_post_batch, delay, max_pending)
+        _async_poster.start()
+
+
+def stop_async():
+    """Sends the events that are still pending, and goes back to sending each event as it is posted."""
+    global _async_poster
+    poster, _async_poster = _async_poster, None
+    if poster is not None:
+        poster.stop()
+
+
+def async_metrics():
+    poster = _async_poster
+    return poster.metrics() if poster is not None else None
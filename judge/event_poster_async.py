@@ -0,0 +1,119 @@
+import json
+import logging
+import threading
+import time
+from itertools import islice
+
+__all__ = ['AsyncEventPoster']
+
+logger = logging.getLogger('judge.event_poster')
+
+
+class AsyncEventPoster:
+    """Sends events to the event daemon from a background thread, so that posting an event never blocks.
+
+    Events are sent in batches, at most `delay` seconds after they are posted. Posting an event that is identical
+    to one still waiting to be sent on the same channel does nothing, so that e.g. the test case results of a
+    submission that arrive in quick succession result in a single `test-case` event. Events posted while
+    `max_pending` others are waiting are dropped.
+
+    `post_batch` is called with a list of (channel, message) pairs, and should raise if they could not be sent.
+    """
+
+    def __init__(self, post_batch, delay, max_pending, max_batch=100):
+        self.post_batch = post_batch
+        self.delay = delay
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self._lock = threading.Condition()
+        self._pending = {}  # (channel, serialized message): (channel, message, time posted), oldest first
+        self._thread = None
+        self._stopping = False
+
+        self.posted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.lag = 0  # seconds the oldest event of the last batch waited before it was sent
+
+    def start(self):
+        self._thread = threading.Thread(target=self._work, name='event-poster')
+        self._thread.start()
+
+    def stop(self):
+        # Pending events are sent right away rather than dropped.
+        if self._thread is not None:
+            with self._lock:
+                self._stopping = True
+                self._lock.notify()
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'oldest': time.monotonic() - next(iter(self._pending.values()))[2] if self._pending else 0,
+                'posted': self.posted,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'sent': self.sent,
+                'failed': self.failed,
+                'lag': self.lag,
+            }
+
+    def post(self, channel, message):
+        key = channel, json.dumps(message, sort_keys=True)
+        with self._lock:
+            self.posted += 1
+            if key in self._pending:
+                self.coalesced += 1
+                return 0
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return 0
+            # Events posted by handlers that outlive stop() are sent right away, so that they are not lost.
+            if self._thread is not None and not self._stopping:
+                self._pending[key] = (channel, message, time.monotonic())
+                self._lock.notify()
+                return 0
+        self._send([(channel, message, time.monotonic())])
+        return 0
+
+    def _send(self, batch):
+        try:
+            self.post_batch([(channel, message) for channel, message, _ in batch])
+        except Exception:
+            logger.exception('Failed to post %d events', len(batch))
+            failed = True
+        else:
+            failed = False
+
+        with self._lock:
+            if failed:
+                self.failed += len(batch)
+            else:
+                self.sent += len(batch)
+            self.lag = time.monotonic() - batch[0][2]
+
+    def _next(self):
+        with self._lock:
+            while True:
+                if self._pending:
+                    wait = next(iter(self._pending.values()))[2] + self.delay - time.monotonic()
+                    if wait <= 0 or self._stopping:
+                        keys = list(islice(self._pending, self.max_batch))
+                        return [self._pending.pop(key) for key in keys]
+                elif self._stopping:
+                    return None
+                else:
+                    wait = None
+                self._lock.wait(wait)
+
+    def _work(self):
+        while True:
+            batch = self._next()
+            if batch is None:
+                break
+            self._send(batch)
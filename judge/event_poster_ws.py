@@ -5,7 +5,7 @@ import threading
 from django.conf import settings
 from websocket import WebSocketException, create_connection
 
-__all__ = ['EventPostingError', 'EventPoster', 'post', 'last']
+__all__ = ['EventPostingError', 'EventPoster', 'post', 'post_batch', 'last']
 _local = threading.local()
 
 
@@ -39,6 +39,26 @@ class EventPoster(object):
             self._connect()
             return self.post(channel, message, tries + 1)
 
+    def post_batch(self, messages, tries=0):
+        try:
+            self._conn.send(json.dumps({
+                'command': 'post-batch',
+                'messages': [{'channel': channel, 'message': message} for channel, message in messages],
+            }))
+            resp = json.loads(self._conn.recv())
+            if resp['status'] == 'error':
+                # Event daemons from before batches were supported.
+                if resp['code'] == 'bad-command':
+                    return [self.post(channel, message) for channel, message in messages]
+                raise EventPostingError(resp['code'])
+            else:
+                return resp['ids']
+        except WebSocketException:
+            if tries > 10:
+                raise
+            self._connect()
+            return self.post_batch(messages, tries + 1)
+
     def last(self, tries=0):
         try:
             self._conn.send('{"command": "last-msg"}')
@@ -71,6 +91,17 @@ def post(channel, message):
     return 0
 
 
+def post_batch(messages):
+    try:
+        return _get_poster().post_batch(messages)
+    except (WebSocketException, socket.error):
+        try:
+            del _local.poster
+        except AttributeError:
+            pass
+        raise
+
+
 def last():
     try:
         return _get_poster().last()
@@ -1,60 +1,245 @@
 import json
 import logging
+import os
 import socket
 import struct
+import threading
 import zlib
+from collections import Counter, defaultdict
+from itertools import count
 
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
+from reversion import revisions
 
 from judge import event_poster as event
+from judge.bridge.base_handler import MAX_ALLOWED_PACKET_SIZE
 from judge.judge_priority import BATCH_REJUDGE_PRIORITY, CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY, REJUDGE_PRIORITY
 
 logger = logging.getLogger('judge.judgeapi')
 size_pack = struct.Struct('!I')
 
+# Number of submissions to reset and send to the bridge at once in batch rejudges.
+REJUDGE_BATCH_SIZE = 1000
+# Largest uncompressed size of one batch frame. The bridge drops connections sending anything over
+# MAX_ALLOWED_PACKET_SIZE, so large batches are split over several frames.
+BATCH_FRAME_SIZE = MAX_ALLOWED_PACKET_SIZE // 2
+
 
 def _post_update_submission(submission, done=False):
     if submission.problem.is_public:
         event.post('submissions', {'type': 'done-submission' if done else 'update-submission',
                                    'id': submission.id,
-                                   'contest': submission.contest_key,
+                                   'contest': submission.contest_object_id,
                                    'user': submission.user_id, 'problem': submission.problem_id,
                                    'status': submission.status, 'language': submission.language.key,
                                    'organizations':
-                                   [x[0] for x in submission.user.organizations.get_queryset().values_list('id')],
+                                   list(submission.user.organizations.values_list('id', flat=True)),
                                    })
 
 
-def judge_request(packet, reply=True):
-    sock = socket.create_connection(settings.BRIDGED_DJANGO_CONNECT or
-                                    settings.BRIDGED_DJANGO_ADDRESS[0])
+def _bridge_address():
+    return settings.BRIDGED_DJANGO_CONNECT or settings.BRIDGED_DJANGO_ADDRESS[0]
 
+
+def _encode_packet(packet):
     output = json.dumps(packet, separators=(',', ':'))
     output = zlib.compress(output.encode('utf-8'))
+    return size_pack.pack(len(output)) + output
+
+
+def _read_packet(reader):
+    input = reader.read(size_pack.size)
+    if len(input) < size_pack.size:
+        return None
+    length = size_pack.unpack(input)[0]
+    input = reader.read(length)
+    if len(input) < length:
+        return None
+    return json.loads(zlib.decompress(input).decode('utf-8'))
+
+
+class BridgeUnavailable(Exception):
+    pass
+
+
+class BridgeConnection:
+    """A long-lived connection to the bridge, shared by all threads of a process.
+
+    Every request carries a request ID, which the bridge echoes back in its response,
+    so any number of requests can be in flight at the same time.
+    """
+
+    reply_timeout = 60
+    # Sending holds the lock of the connection, so a bridge that stops reading must not block every thread for long.
+    send_timeout = 10
+
+    def __init__(self, address):
+        self.sock = socket.create_connection(address, timeout=self.send_timeout)
+        self.pid = os.getpid()
+        self.closed = False
+        self.request_ids = count(1)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.reader = threading.Thread(target=self._read_forever, name='bridge-connection', daemon=True)
+        self.reader.start()
+
+    def read(self, size):
+        """Reads `size` bytes for _read_packet, or less if the connection is closed. Reads wait for as long as needed,
+        the socket's timeout is only meant for sends."""
+        data = bytearray()
+        while len(data) < size:
+            try:
+                chunk = self.sock.recv(size - len(data))
+            except socket.timeout:
+                if self.closed:
+                    break
+                continue
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    def _read_forever(self):
+        try:
+            while True:
+                packet = _read_packet(self)
+                if packet is None:
+                    break
+                waiter = self.pending.pop(packet.get('request-id'), None)
+                if waiter is not None:
+                    waiter.append(packet.get('response'))
+                    waiter[0].set()
+        except (OSError, ValueError, zlib.error):
+            # Once closed, the socket may be gone from under a read in progress.
+            if not self.closed:
+                logger.exception('Error reading from bridge connection')
+        finally:
+            self.close()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        # Wake up everyone still waiting, they will find no response.
+        for waiter in pending.values():
+            waiter[0].set()
+
+    def request(self, packet, reply=True):
+        request_id = next(self.request_ids)
+        waiter = [threading.Event()]
+        data = _encode_packet(dict(packet, **{'request-id': request_id}))
+        with self.lock:
+            if self.closed:
+                raise BridgeUnavailable('bridge connection is closed')
+            if reply:
+                self.pending[request_id] = waiter
+            try:
+                self.sock.sendall(data)
+            except OSError as e:
+                error = e
+            else:
+                error = None
+
+        if error is not None:
+            # We may have sent part of a packet, so the connection is unusable.
+            self.close()
+            raise BridgeUnavailable('failed to send request to bridge') from error
+        if not reply:
+            return None
+        if not waiter[0].wait(self.reply_timeout):
+            self.close()
+            raise BridgeUnavailable('bridge did not respond in time')
+        if len(waiter) < 2:
+            raise BridgeUnavailable('bridge connection closed before responding')
+        return waiter[1]
+
+
+_bridge_connection = None
+_bridge_connection_lock = threading.Lock()
+
+
+def _get_bridge_connection():
+    global _bridge_connection
+    with _bridge_connection_lock:
+        connection = _bridge_connection
+        # A connection inherited from a parent process (e.g. after a prefork) cannot be used.
+        if connection is None or connection.closed or connection.pid != os.getpid():
+            try:
+                connection = _bridge_connection = BridgeConnection(_bridge_address())
+            except OSError as e:
+                _bridge_connection = None
+                raise BridgeUnavailable('failed to connect to bridge') from e
+        return connection
+
+
+def close_bridge_connection():
+    global _bridge_connection
+    with _bridge_connection_lock:
+        if _bridge_connection is not None:
+            _bridge_connection.close()
+            _bridge_connection = None
+
+
+def _one_shot_judge_request(packet, reply=True):
+    sock = socket.create_connection(_bridge_address(), timeout=BridgeConnection.reply_timeout)
+
     writer = sock.makefile('wb')
-    writer.write(size_pack.pack(len(output)))
-    writer.write(output)
+    writer.write(_encode_packet(packet))
     writer.close()
 
     if reply:
         reader = sock.makefile('rb', -1)
-        input = reader.read(size_pack.size)
-        if not input:
-            raise ValueError('Judge did not respond')
-        length = size_pack.unpack(input)[0]
-        input = reader.read(length)
-        if not input:
-            raise ValueError('Judge did not respond')
+        result = _read_packet(reader)
         reader.close()
         sock.close()
-
-        result = json.loads(zlib.decompress(input).decode('utf-8'))
+        if result is None:
+            raise ValueError('Judge did not respond')
         return result
 
 
+def judge_request(packet, reply=True):
+    if settings.BRIDGED_DJANGO_PERSISTENT_CONNECTION:
+        try:
+            return _get_bridge_connection().request(packet, reply)
+        except BridgeUnavailable:
+            # The bridge probably restarted. All requests are idempotent, so just try again on a fresh connection,
+            # the next request will attempt to reestablish the persistent connection.
+            logger.warning('Persistent connection to bridge failed, falling back to one-shot connection',
+                           exc_info=True)
+    return _one_shot_judge_request(packet, reply)
+
+
+def judge_request_batch(packets):
+    """Sends many packets to the bridge in one frame, and returns the list of responses."""
+    return judge_request({'name': 'batch', 'packets': packets})['responses']
+
+
+def _batch_frames(packets):
+    """Splits packets into lists that fit in a batch frame of at most BATCH_FRAME_SIZE bytes before compression,
+    which is never smaller. A packet too large for any frame gets one of its own."""
+    frame, frame_size = [], 0
+    for packet in packets:
+        size = len(json.dumps(packet, separators=(',', ':'))) + 1
+        if frame and frame_size + size > BATCH_FRAME_SIZE:
+            yield frame
+            frame, frame_size = [], 0
+        frame.append(packet)
+        frame_size += size
+    if frame:
+        yield frame
+
+
 def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=None):
-    from .models import ContestSubmission, Submission, SubmissionTestCase
+    from .models import ContestSubmission, Problem, Submission, SubmissionTestCase
 
     updates = {'time': None, 'memory': None, 'points': None, 'result': None, 'case_points': 0, 'case_total': 0,
                'error': None, 'rejudged_date': timezone.now() if rejudge or batch_rejudge else None, 'status': 'QU'}
@@ -78,6 +263,8 @@ def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=No
     # while already queued, but that does not lead to data corruption.
     if not Submission.objects.filter(id=submission.id).exclude(status__in=('P', 'G')).update(**updates):
         return False
+    if submission.result == 'AC' and not submission.user.is_unlisted:
+        Problem.update_submission_counts(submission.problem_id, accepted=-1)
 
     SubmissionTestCase.objects.filter(submission_id=submission.id).delete()
 
@@ -113,6 +300,116 @@ def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=No
     return success
 
 
+def batch_rejudge_submissions(submission_ids, rejudge_user=None):
+    """Rejudges many submissions at once, at batch rejudge priority.
+
+    This is equivalent to calling `submission.judge(rejudge=True, batch_rejudge=True)` on every submission, except
+    that the submissions are reset with a handful of set-based queries and sent to the bridge in a single request.
+    Locked submissions and submissions being judged are skipped. Returns the number of queued submissions.
+    """
+    from .models import Contest, ContestParticipation, ContestSubmission, Problem, Profile, Submission, \
+        SubmissionTestCase
+
+    now = timezone.now()
+    with transaction.atomic():
+        submissions = list(Submission.objects.select_for_update().filter(id__in=submission_ids)
+                           .exclude(status__in=('P', 'G')).exclude(locked_after__lt=now).order_by('id'))
+        if not submissions:
+            return 0
+        ids = [submission.id for submission in submissions]
+
+        with revisions.create_revision(manage_manually=True):
+            if rejudge_user:
+                revisions.set_user(rejudge_user)
+            revisions.set_comment('Rejudged')
+            for submission in submissions:
+                revisions.add_to_revision(submission)
+
+        accepted = Counter(Submission.objects.filter(id__in=ids, result='AC', user__is_unlisted=False)
+                           .values_list('problem_id', flat=True))
+        Submission.objects.filter(id__in=ids).update(
+            time=None, memory=None, points=None, result=None, case_points=0, case_total=0, error=None,
+            rejudged_date=now, status='QU',
+        )
+        for problem_id, problem_accepted in accepted.items():
+            Problem.update_submission_counts(problem_id, accepted=-problem_accepted)
+
+        # See judge_submission for why is_pretested is set here, only for contest submissions.
+        contest_submissions = list(
+            ContestSubmission.objects.filter(submission_id__in=ids)
+            .values_list('submission_id', 'problem__contest__run_pretests_only', 'problem__is_pretested',
+                         'participation__virtual', 'participation__contest_id'),
+        )
+        pretested = defaultdict(list)
+        for id, run_pretests_only, is_pretested, _, _ in contest_submissions:
+            pretested[run_pretests_only and is_pretested].append(id)
+        for is_pretested, pretested_ids in pretested.items():
+            Submission.objects.filter(id__in=pretested_ids).update(is_pretested=is_pretested)
+
+        SubmissionTestCase.objects.filter(submission_id__in=ids).delete()
+
+    contests = {}
+    banned_contests = {}
+    for id, _, _, virtual, contest_id in contest_submissions:
+        contests[id] = contest_id
+        if virtual in (ContestParticipation.LIVE, ContestParticipation.SPECTATE):
+            banned_contests[id] = contest_id
+    banned_judges = defaultdict(list)
+    for contest_id, judge_name in (Contest.banned_judges.through.objects
+                                   .filter(contest_id__in=set(banned_contests.values()))
+                                   .values_list('contest_id', 'judge__name')):
+        banned_judges[contest_id].append(judge_name)
+
+    data = list(Submission.objects.filter(id__in=ids).order_by('id').values_list(
+        'id', 'problem__code', 'language__key', 'source__source', 'problem__is_public', 'user_id', 'problem_id',
+    ))
+    failed = [row[0] for row in data if row[3] is None]
+    if failed:
+        logger.error('Cannot rejudge submissions without source: %s', failed)
+        data = [row for row in data if row[3] is not None]
+    packets = [{
+        'name': 'submission-request',
+        'submission-id': id,
+        'problem-id': problem_code,
+        'language': language_key,
+        'source': source,
+        'judge-id': None,
+        'banned-judges': banned_judges.get(banned_contests.get(id), []),
+        'priority': BATCH_REJUDGE_PRIORITY,
+    } for id, problem_code, language_key, source, _, _, _ in data]
+
+    received = set()
+    for frame in _batch_frames(packets):
+        try:
+            responses = judge_request_batch(frame)
+        except BaseException:
+            # Frames sent before this one are queued, none of the rest are.
+            logger.exception('Failed to send batch request to judge')
+            break
+        received.update(
+            packet['submission-id'] for packet, response in zip(frame, responses)
+            if response and response.get('name') == 'submission-received' and
+            response.get('submission-id') == packet['submission-id']
+        )
+
+    failed += [packet['submission-id'] for packet in packets if packet['submission-id'] not in received]
+    if failed:
+        Submission.objects.filter(id__in=failed).update(status='IE', result='IE')
+    failed = set(failed)
+
+    public = [row for row in data if row[4]]
+    organizations = defaultdict(list)
+    for profile_id, organization_id in (Profile.organizations.through.objects
+                                        .filter(profile_id__in={row[5] for row in public})
+                                        .values_list('profile_id', 'organization_id')):
+        organizations[profile_id].append(organization_id)
+    for id, _, language_key, _, _, user_id, problem_id in public:
+        event.post('submissions', {'type': 'update-submission', 'id': id, 'contest': contests.get(id),
+                                   'user': user_id, 'problem': problem_id, 'status': 'IE' if id in failed else 'QU',
+                                   'language': language_key, 'organizations': organizations[user_id]})
+    return len(ids) - len(failed)
+
+
 def disconnect_judge(judge, force=False):
     judge_request({'name': 'disconnect-judge', 'judge-id': judge.name, 'force': force}, reply=False)
 
@@ -121,6 +418,14 @@ def update_disable_judge(judge):
     judge_request({'name': 'disable-judge', 'judge-id': judge.name, 'is-disabled': judge.is_disabled})
 
 
+def post_grading_metrics():
+    return judge_request({'name': 'post-grading-metrics'}).get('metrics')
+
+
+def event_metrics():
+    return judge_request({'name': 'event-metrics'}).get('metrics')
+
+
 def abort_submission(submission):
     from .models import Submission
     # We only want to try to abort a submission if it's still grading, otherwise this can lead to fully graded
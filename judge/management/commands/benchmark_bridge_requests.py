@@ -0,0 +1,87 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from judge import judgeapi
+from judge.bridge.django_handler import DjangoHandler
+from judge.bridge.server import Server
+from judge.judge_priority import DEFAULT_PRIORITY
+
+
+class NullJudgeList:
+    """Accepts every submission without judging it, so that only the Django-bridge round trips are measured."""
+
+    def __init__(self):
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def check_priority(self, priority):
+        return True
+
+    def judge(self, *args):
+        with self.lock:
+            self.received += 1
+
+
+def submission_packet(id):
+    return {
+        'name': 'submission-request',
+        'submission-id': id,
+        'problem-id': 'aplusb',
+        'language': 'PY3',
+        'source': 'print(sum(map(int, input().split())))',
+        'judge-id': None,
+        'banned-judges': [],
+        'priority': DEFAULT_PRIORITY,
+    }
+
+
+class Command(BaseCommand):
+    help = 'measure how many submissions per second can be sent to the bridge through each connection mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=5000, help='number of submissions to send')
+        parser.add_argument('--threads', type=int, default=8, help='number of concurrent sending threads')
+        parser.add_argument('--batch-size', type=int, default=100, help='submissions per batch packet')
+
+    def run(self, name, func, count):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        print('%-12s %d submissions in %.3fs (%.0f submissions/s)' % (name, count, elapsed, count / elapsed))
+
+    def handle(self, *args, **options):
+        judges = NullJudgeList()
+        server = Server([('127.0.0.1', 0)], partial(DjangoHandler, judges=judges))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address = server.servers[0].server_address
+
+        count = options['submissions']
+        threads = options['threads']
+        batch_size = options['batch_size']
+
+        def send_each(persistent):
+            with override_settings(BRIDGED_DJANGO_CONNECT=address, BRIDGED_DJANGO_PERSISTENT_CONNECTION=persistent):
+                with ThreadPoolExecutor(threads) as executor:
+                    for response in executor.map(judgeapi.judge_request, map(submission_packet, range(count))):
+                        assert response['name'] == 'submission-received'
+
+        def send_batches():
+            with override_settings(BRIDGED_DJANGO_CONNECT=address, BRIDGED_DJANGO_PERSISTENT_CONNECTION=True):
+                for start in range(0, count, batch_size):
+                    packets = list(map(submission_packet, range(start, min(start + batch_size, count))))
+                    for response in judgeapi.judge_request_batch(packets):
+                        assert response['name'] == 'submission-received'
+
+        try:
+            self.run('one-shot', partial(send_each, False), count)
+            self.run('persistent', partial(send_each, True), count)
+            self.run('batched', send_batches, count)
+        finally:
+            judgeapi.close_bridge_connection()
+            server.shutdown()
+        print('Bridge received %d submissions' % judges.received)
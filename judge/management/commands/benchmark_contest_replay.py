@@ -0,0 +1,50 @@
+import gzip
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from judge.models import Contest
+from judge.views.contests import build_contest_replay_data, read_contest_replay_columns, \
+    write_contest_replay_columns, write_contest_replay_data
+
+
+class Command(BaseCommand):
+    help = "compare the size and parse time of a contest's JSON and columnar replay data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('contest', help='key of the contest to write replay data for')
+        parser.add_argument('--repeat', type=int, default=5, help='number of times to parse each file')
+
+    def report(self, name, filepath, build_time, parse, repeat):
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            with open(filepath, 'rb') as f:
+                parse(f)
+        parse_time = (time.perf_counter() - start) / repeat
+        print('%-8s %10d bytes (%d gzipped), built in %.3fs, parsed in %.3fs' % (
+            name, len(content), len(gzip.compress(content)), build_time, parse_time,
+        ))
+
+    def handle(self, *args, **options):
+        try:
+            contest = Contest.objects.get(key=options['contest'])
+        except Contest.DoesNotExist:
+            raise CommandError('No contest with key "%s".' % options['contest'])
+        if contest.csv_ranking == Contest.HAS_GHOST_PARTICIPATION:
+            raise CommandError('Contests with ghost participations only have JSON replay data.')
+
+        start = time.perf_counter()
+        json_path, _ = write_contest_replay_data(contest, build_contest_replay_data(contest))
+        json_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns_path, _ = write_contest_replay_columns(contest)
+        columns_time = time.perf_counter() - start
+
+        print('Replay data for %s in %s' % (contest.key, os.path.dirname(json_path)))
+        self.report('JSON', json_path, json_time, json.load, options['repeat'])
+        self.report('columnar', columns_path, columns_time, read_contest_replay_columns, options['repeat'])
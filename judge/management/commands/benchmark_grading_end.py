@@ -0,0 +1,105 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from judge.bridge.judge_handler import GradingResult, JudgeHandler
+from judge.models import Language, Problem, ProblemGroup, Profile, Submission, SubmissionTestCase
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'measure how long the bridge takes to aggregate test case results when grading ends; ' \
+           'all changes are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=20, help='number of submissions to grade')
+        parser.add_argument('--test-cases', type=int, default=500, help='number of test cases per submission')
+
+    def make_handler(self):
+        server = SimpleNamespace(asynchronous=True, server_address=None)
+        return JudgeHandler(Mock(), ('127.0.0.1', 0), server, Mock())
+
+    def grade(self, handler, submission, test_cases):
+        handler.on_grading_begin({'submission-id': submission.id, 'pretested': False})
+        for position in range(1, test_cases + 1):
+            if position % 10 == 1:
+                handler.on_batch_begin({'submission-id': submission.id})
+            handler.on_test_case({
+                'name': 'test-case-status',
+                'submission-id': submission.id,
+                'cases': [{
+                    'position': position, 'status': position % 3 and 1, 'time': 0.01, 'memory': position,
+                    'points': position % 2, 'total-points': 1, 'output': '',
+                }],
+            })
+            if position % 10 == 0:
+                handler.on_batch_end({'submission-id': submission.id})
+
+    def report(self, name, elapsed, queries, count):
+        print('%-14s %.2fms and %.1f queries per submission' % (name, elapsed / count * 1000, queries / count))
+
+    def measure_aggregation(self, name, submissions, func):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for submission in submissions:
+                func(submission)
+            elapsed = time.perf_counter() - start
+        self.report(name, elapsed, len(queries), len(submissions))
+
+    def measure_grading_end(self, name, submissions, test_cases, saw_test_cases):
+        elapsed = 0
+        queries = 0
+        handler = self.make_handler()
+        for submission in submissions:
+            self.grade(handler, submission, test_cases)
+            # Writing the last buffered test cases is not part of the aggregation.
+            handler._flush_test_cases()
+            end_handler = handler if saw_test_cases else self.make_handler()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                end_handler.on_grading_end({'submission-id': submission.id})
+                elapsed += time.perf_counter() - start
+            queries += len(captured)
+        self.report(name, elapsed, queries, len(submissions))
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                group = ProblemGroup.objects.create(name='benchmark_end', full_name='benchmark_end')
+                problem = Problem.objects.create(code='benchmark_end', name='benchmark_end', description='',
+                                                 time_limit=1, memory_limit=65536, points=1, group=group)
+                profile = Profile.objects.create(user=User.objects.create(username='benchmark_end'))
+                submissions = [
+                    Submission.objects.create(user=profile, problem=problem, language=Language.get_python3(),
+                                              status='P')
+                    for _ in range(options['submissions'])
+                ]
+                handler = self.make_handler()
+                for submission in submissions:
+                    self.grade(handler, submission, options['test_cases'])
+                handler._flush_test_cases()
+
+                def python_loop(submission):
+                    result = GradingResult()
+                    for case in SubmissionTestCase.objects.filter(submission=submission):
+                        result.add(case)
+
+                # Aggregation alone, the way grading-end used to do it and with the grouped query it falls back to.
+                self.measure_aggregation('python loop', submissions, python_loop)
+                self.measure_aggregation('grouped query', submissions,
+                                         lambda submission: GradingResult.from_database(submission.id))
+
+                # The whole of grading-end, with and without the results the handler saw during grading.
+                self.measure_grading_end('in memory', submissions, options['test_cases'], True)
+                self.measure_grading_end('from database', submissions, options['test_cases'], False)
+                raise Rollback()
+        except Rollback:
+            pass
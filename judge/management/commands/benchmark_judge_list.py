@@ -0,0 +1,112 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from judge.bridge.judge_list import JudgeList
+from judge.judge_priority import BATCH_REJUDGE_PRIORITY, CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY, \
+    REJUDGE_PRIORITY
+
+
+class BenchmarkJudge:
+    def __init__(self, name, tier, problems, executors):
+        self.name = name
+        self.tier = tier
+        self.load = 0
+        self.is_disabled = False
+        self.problems = problems
+        self.executors = executors
+        self._working = False
+
+    @property
+    def working(self):
+        return bool(self._working)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self.problems and executor in self.executors and \
+            ((not judge_id and not self.is_disabled) or self.name == judge_id)
+
+    def get_current_submission(self):
+        return self._working or None
+
+    def submit(self, id, problem, language, source):
+        self._working = id
+
+    def disconnect(self, force=False):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'replay a synthetic submission backlog through the bridge judge queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=10000, help='number of queued submissions')
+        parser.add_argument('--judges', type=int, default=50, help='number of judges')
+        parser.add_argument('--problems', type=int, default=1000, help='number of distinct problems')
+        parser.add_argument('--languages', type=int, default=30, help='number of distinct languages')
+        parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+    def make_judges(self, rng, judges, problems, languages):
+        result = []
+        for i in range(judges):
+            problem_share, executor_share = rng.uniform(0.3, 0.9), rng.uniform(0.5, 1)
+            # Judges are heterogeneous: each one supports a random share of the problems and languages,
+            # and a few of them are in a higher (backup) tier.
+            result.append(BenchmarkJudge(
+                name='judge%d' % i,
+                tier=0 if i % 10 else 1,
+                problems={problem for problem in problems if rng.random() < problem_share},
+                executors={language for language in languages if rng.random() < executor_share},
+            ))
+        return result
+
+    def make_submissions(self, rng, count, problems, languages, judges):
+        priorities = [CONTEST_SUBMISSION_PRIORITY] * 3 + [DEFAULT_PRIORITY] * 5 + \
+            [REJUDGE_PRIORITY, BATCH_REJUDGE_PRIORITY]
+        for id in range(1, count + 1):
+            # Popular problems and languages get most of the traffic.
+            problem = problems[min(int(rng.paretovariate(1.2)) - 1, len(problems) - 1)]
+            language = languages[min(int(rng.paretovariate(1.5)) - 1, len(languages) - 1)]
+            judge_id = rng.choice(judges).name if rng.random() < 0.01 else None
+            banned_judges = [rng.choice(judges).name] if rng.random() < 0.05 else []
+            yield id, problem, language, 'source', judge_id, rng.choice(priorities), banned_judges
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        problems = ['problem%d' % i for i in range(options['problems'])]
+        languages = ['lang%d' % i for i in range(options['languages'])]
+        judges = self.make_judges(rng, options['judges'], problems, languages)
+
+        # The synthetic backlog should never trigger the long queue alert.
+        with override_settings(VNOJ_LONG_QUEUE_ALERT_THRESHOLD=-1):
+            judge_list = JudgeList()
+            for judge in judges:
+                judge_list.register(judge)
+
+            start = time.perf_counter()
+            for submission in self.make_submissions(rng, options['submissions'], problems, languages, judges):
+                judge_list.judge(*submission)
+            queue_time = time.perf_counter() - start
+            queued = len(judge_list.node_map)
+            print('Queued %d submissions (%d waiting) in %.3fs' % (options['submissions'], queued, queue_time))
+
+            latencies = []
+            while True:
+                busy = [judge for judge in judges if judge.working]
+                if not busy:
+                    break
+                judge = rng.choice(busy)
+                start = time.perf_counter()
+                judge_list.on_judge_free(judge, judge.get_current_submission())
+                latencies.append(time.perf_counter() - start)
+
+        total = sum(latencies)
+        latencies.sort()
+        print('Freed judges %d times in %.3fs (%.0f/s), %d submissions left undispatchable' %
+              (len(latencies), total, len(latencies) / total if total else 0, len(judge_list.node_map)))
+        if latencies:
+            print('Latency per freed judge: mean %.1fus, p50 %.1fus, p99 %.1fus, max %.1fus' % (
+                total / len(latencies) * 1e6, latencies[len(latencies) // 2] * 1e6,
+                latencies[int(len(latencies) * 0.99)] * 1e6, latencies[-1] * 1e6,
+            ))
@@ -0,0 +1,101 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from judge.models import Contest, ContestParticipation, Organization, Profile
+from judge.scoreboard import _ranking_rows
+
+BATCH_SIZE = 1000
+RANKING_ANNOTATIONS = ('_org_short_name', '_org_slug', '_badge_mini', '_badge_name')
+
+
+class Rollback(Exception):
+    pass
+
+
+def subquery_ranking_rows(queryset):
+    """How ranking rows looked up the user's organization before it was denormalized onto the profile."""
+    org_qs = Organization.objects.filter(member=OuterRef('user'), is_unlisted=False).order_by('name')
+    return queryset.annotate(
+        _org_short_name=Subquery(org_qs.values('short_name')[:1]),
+        _org_slug=Subquery(org_qs.values('slug')[:1]),
+        _badge_mini=F('user__display_badge__mini'),
+        _badge_name=F('user__display_badge__name'),
+    ).values(*_ranking_rows(queryset).query.values_select, *RANKING_ANNOTATIONS)
+
+
+class Command(BaseCommand):
+    help = 'compare query plans and times for contest ranking rows; all changes are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=10000, help='number of participations')
+        parser.add_argument('--organizations', type=int, default=50, help='number of organizations')
+        parser.add_argument('--repeat', type=int, default=5, help='number of times to fetch the rows')
+
+    def create_contest(self, options):
+        rng = random.Random(0)
+        now = timezone.now()
+        contest = Contest.objects.create(key='benchmark_ranking', name='benchmark_ranking', description='',
+                                         start_time=now - timezone.timedelta(hours=5), end_time=now)
+        Organization.objects.bulk_create([
+            Organization(name='benchmark_ranking_%d' % i, slug='benchmark_ranking_%d' % i, short_name='bench%d' % i,
+                         about='', is_unlisted=i % 10 == 0)
+            for i in range(options['organizations'])
+        ])
+        organizations = list(Organization.objects.filter(slug__startswith='benchmark_ranking_')
+                                                 .values_list('id', flat=True))
+
+        # bulk_create does not return primary keys on MySQL.
+        User.objects.bulk_create([User(username='benchmark_ranking_%d' % i) for i in range(options['participants'])],
+                                 batch_size=BATCH_SIZE)
+        users = User.objects.filter(username__startswith='benchmark_ranking_').values_list('id', flat=True)
+        Profile.objects.bulk_create([Profile(user_id=id) for id in users], batch_size=BATCH_SIZE)
+        profiles = Profile.objects.filter(user__username__startswith='benchmark_ranking_')
+        profile_ids = list(profiles.values_list('id', flat=True))
+
+        # Most users are in one or two organizations.
+        Profile.organizations.through.objects.bulk_create([
+            Profile.organizations.through(profile_id=profile, organization_id=organization, sort_value=i)
+            for profile in profile_ids
+            for i, organization in enumerate(rng.sample(organizations, rng.choice((0, 1, 1, 1, 2, 2, 3))))
+        ], batch_size=BATCH_SIZE)
+        Profile.update_primary_organizations(profiles)
+
+        ContestParticipation.objects.bulk_create([
+            ContestParticipation(contest=contest, user_id=id, score=rng.randrange(1000))
+            for id in profile_ids
+        ], batch_size=BATCH_SIZE)
+        return contest
+
+    def measure(self, name, queryset, repeat):
+        print('%s:' % name)
+        print(queryset.explain())
+        start = time.perf_counter()
+        for _ in range(repeat):
+            rows = list(queryset)
+        elapsed = (time.perf_counter() - start) / repeat
+        print('%d rows in %.3fs on average\n' % (len(rows), elapsed))
+        return rows
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                start = time.perf_counter()
+                contest = self.create_contest(options)
+                print('Created contest with %d participations in %.3fs\n' % (
+                    contest.users.count(), time.perf_counter() - start,
+                ))
+
+                queryset = contest.users.filter(virtual__gt=ContestParticipation.SPECTATE)
+                old = self.measure('correlated subqueries', subquery_ranking_rows(queryset), options['repeat'])
+                new = self.measure('primary organization', _ranking_rows(queryset), options['repeat'])
+                if sorted(old, key=lambda row: row['id']) != sorted(new, key=lambda row: row['id']):
+                    print('Rows differ!')
+                raise Rollback()
+        except Rollback:
+            pass
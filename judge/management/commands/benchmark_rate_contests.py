@@ -0,0 +1,76 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from judge.models import Contest, ContestParticipation, Profile, Rating
+from judge.ratings import rate_contest, rate_contests
+
+BATCH_SIZE = 1000
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'measure how long re-rating a series of synthetic contests takes; all changes are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contests', type=int, default=50, help='number of rated contests')
+        parser.add_argument('--users', type=int, default=5000, help='number of users taking part in the contests')
+        parser.add_argument('--participants', type=int, default=1000, help='number of participants per contest')
+
+    def create_contests(self, options):
+        rng = random.Random(0)
+        now = timezone.now()
+
+        # bulk_create does not return primary keys on MySQL.
+        User.objects.bulk_create([User(username='benchmark_rating_%d' % i) for i in range(options['users'])],
+                                 batch_size=BATCH_SIZE)
+        users = User.objects.filter(username__startswith='benchmark_rating_').values_list('id', flat=True)
+        Profile.objects.bulk_create([Profile(user_id=id) for id in users], batch_size=BATCH_SIZE)
+        profiles = list(Profile.objects.filter(user__username__startswith='benchmark_rating_')
+                        .values_list('id', flat=True))
+
+        contests = []
+        for i in range(options['contests']):
+            end_time = now - timezone.timedelta(days=options['contests'] - i)
+            contest = Contest.objects.create(key='benchmark_rating_%d' % i, name='benchmark_rating_%d' % i,
+                                             description='', start_time=end_time - timezone.timedelta(hours=3),
+                                             end_time=end_time, is_rated=True, rate_all=True)
+            ContestParticipation.objects.bulk_create([
+                ContestParticipation(contest=contest, user_id=id, score=rng.randrange(1000),
+                                     cumtime=rng.randrange(10000))
+                for id in rng.sample(profiles, min(options['participants'], len(profiles)))
+            ], batch_size=BATCH_SIZE)
+            contests.append(contest)
+        return contests
+
+    def measure(self, name, func):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        print('%-11s %d ratings in %.3fs (%d queries)' % (name, Rating.objects.count(), elapsed, len(queries)))
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                contests = self.create_contests(options)
+
+                def one_by_one():
+                    for contest in contests:
+                        rate_contest(contest)
+                self.measure('one-by-one', one_by_one)
+
+                def batch():
+                    rate_contests(contests, stale_ratings=Rating.objects.filter(contest__in=contests))
+                self.measure('batch', batch)
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,50 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from judge import ratings
+from judge.ratings import MEAN_INIT, recalculate_ratings_numpy, recalculate_ratings_python, tie_ranker
+
+
+class Command(BaseCommand):
+    help = 'compare the pure Python and NumPy rating engines on synthetic contests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000],
+                            help='numbers of rated participants')
+        parser.add_argument('--scores', type=int, default=0,
+                            help='number of distinct scores, or 0 for no ties')
+        parser.add_argument('--history', type=int, default=30, help='maximum number of past ratings per participant')
+        parser.add_argument('--skip-python', action='store_true', help='only run the NumPy engine')
+
+    def generate(self, n, options):
+        rng = random.Random(n)
+        users = []
+        for _ in range(n):
+            times = rng.randint(0, options['history'])
+            score = rng.randrange(options['scores']) if options['scores'] else rng.random()
+            users.append((score, MEAN_INIT if not times else rng.gauss(MEAN_INIT, 300), times,
+                          [rng.gauss(MEAN_INIT, 400) for _ in range(times)]))
+        users.sort(key=lambda user: -user[0])
+        ranking = list(tie_ranker(users, key=lambda user: user[0]))
+        return ranking, [user[1] for user in users], [user[2] for user in users], [user[3] for user in users]
+
+    def measure(self, name, n, func, args):
+        start = time.perf_counter()
+        mean, performance = func(*args)[-2:]
+        print('%-6s %6d participants in %.3fs' % (name, n, time.perf_counter() - start))
+        return mean, performance
+
+    def handle(self, *args, **options):
+        if ratings.np is None:
+            raise CommandError('NumPy is not installed')
+
+        for n in options['sizes']:
+            inputs = self.generate(n, options)
+            numpy_result = self.measure('numpy', n, recalculate_ratings_numpy, inputs)
+            if not options['skip_python']:
+                python_result = self.measure('python', n, recalculate_ratings_python, inputs)
+                print('maximum difference: %.3g' % max(
+                    abs(a - b) for x, y in zip(numpy_result, python_result) for a, b in zip(x, y)
+                ))
@@ -0,0 +1,88 @@
+import threading
+import time
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from judge.bridge.django_handler import DjangoHandler
+from judge.bridge.server import Server
+from judge.judgeapi import REJUDGE_BATCH_SIZE, batch_rejudge_submissions, close_bridge_connection
+from judge.management.commands.benchmark_bridge_requests import NullJudgeList
+from judge.models import Language, Problem, ProblemGroup, Profile, Submission, SubmissionSource, SubmissionTestCase
+from judge.utils.iterator import chunk
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'measure rejudge throughput on synthetic submissions; all changes are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=100000, help='number of submissions to rejudge')
+        parser.add_argument('--test-cases', type=int, default=10, help='number of test cases per submission')
+        parser.add_argument('--sample', type=int, default=2000,
+                            help='number of submissions to rejudge one by one, for comparison')
+
+    def create_submissions(self, count, test_cases):
+        group = ProblemGroup.objects.create(name='benchmark_rejudge', full_name='benchmark_rejudge')
+        problem = Problem.objects.create(code='benchmark_rejudge', name='benchmark_rejudge', description='',
+                                         time_limit=1, memory_limit=65536, points=1, group=group)
+        profile = Profile.objects.create(user=User.objects.create(username='benchmark_rejudge'))
+        language = Language.get_python3()
+
+        ids = []
+        for size in chunk(range(count), REJUDGE_BATCH_SIZE):
+            Submission.objects.bulk_create([
+                Submission(user=profile, problem=problem, language=language, status='D', result='AC', points=1,
+                           case_points=test_cases, case_total=test_cases)
+                for _ in size
+            ])
+            # bulk_create does not return primary keys on MySQL.
+            batch_ids = list(Submission.objects.filter(problem=problem).order_by('-id')
+                             .values_list('id', flat=True)[:len(size)])
+            SubmissionSource.objects.bulk_create([SubmissionSource(submission_id=id, source='') for id in batch_ids])
+            SubmissionTestCase.objects.bulk_create([
+                SubmissionTestCase(submission_id=id, case=case, status='AC', time=0.1, memory=1024, points=1, total=1)
+                for id in batch_ids for case in range(1, test_cases + 1)
+            ])
+            ids += batch_ids
+        return problem, sorted(ids)
+
+    def report(self, name, count, elapsed):
+        print('%-10s %d submissions in %.3fs (%.0f submissions/s)' % (name, count, elapsed, count / elapsed))
+
+    def handle(self, *args, **options):
+        judges = NullJudgeList()
+        server = Server([('127.0.0.1', 0)], partial(DjangoHandler, judges=judges))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            with override_settings(BRIDGED_DJANGO_CONNECT=server.servers[0].server_address), transaction.atomic():
+                start = time.perf_counter()
+                problem, ids = self.create_submissions(options['submissions'], options['test_cases'])
+                print('Created %d submissions in %.3fs' % (len(ids), time.perf_counter() - start))
+
+                sample = ids[:options['sample']]
+                start = time.perf_counter()
+                for submission in Submission.objects.filter(id__in=sample):
+                    submission.judge(rejudge=True, batch_rejudge=True)
+                self.report('one-by-one', len(sample), time.perf_counter() - start)
+
+                Submission.objects.filter(problem=problem).update(status='D')
+                start = time.perf_counter()
+                rejudged = 0
+                for batch in chunk(ids, REJUDGE_BATCH_SIZE):
+                    rejudged += batch_rejudge_submissions(batch)
+                self.report('batched', rejudged, time.perf_counter() - start)
+                raise Rollback()
+        except Rollback:
+            pass
+        finally:
+            close_bridge_connection()
+            server.shutdown()
+        print('Bridge received %d submissions' % judges.received)
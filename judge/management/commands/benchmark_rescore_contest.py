@@ -0,0 +1,131 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from judge.contest_format import formats
+from judge.models import Contest, ContestParticipation, ContestProblem, ContestSubmission, Language, Problem, \
+    ProblemGroup, Profile, Submission
+from judge.utils.iterator import chunk
+
+BATCH_SIZE = 1000
+
+
+class Rollback(Exception):
+    pass
+
+
+class ProgressReporter:
+    def __init__(self, total):
+        self.total = total
+        self._done = 0
+
+    @property
+    def done(self):
+        return self._done
+
+    @done.setter
+    def done(self, value):
+        self._done = value
+        print('\r%d/%d participations' % (value, self.total), end='', flush=True)
+
+
+class Command(BaseCommand):
+    help = 'measure how long rescoring a synthetic contest takes; all changes are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', default='icpc', choices=sorted(formats), help='contest format to rescore')
+        parser.add_argument('--participants', type=int, default=5000, help='number of participations')
+        parser.add_argument('--problems', type=int, default=12, help='number of contest problems')
+        parser.add_argument('--submissions', type=int, default=20, help='number of submissions per participation')
+        parser.add_argument('--sample', type=int, default=500,
+                            help='number of participations to rescore one by one, for comparison')
+
+    def create_contest(self, options):
+        rng = random.Random(0)
+        now = timezone.now()
+        contest = Contest.objects.create(key='benchmark_rescore', name='benchmark_rescore', description='',
+                                         start_time=now - timezone.timedelta(hours=5), end_time=now,
+                                         frozen_last_minutes=60, format_name=options['format'])
+        group = ProblemGroup.objects.create(name='benchmark_rescore', full_name='benchmark_rescore')
+        contest_problems = {}
+        for order in range(options['problems']):
+            code = 'benchmark_rescore_%d' % order
+            problem = Problem.objects.create(code=code, name=code, description='', time_limit=1,
+                                             memory_limit=65536, points=1, group=group)
+            contest_problems[problem.id] = ContestProblem.objects.create(contest=contest, problem=problem,
+                                                                         points=100, order=order)
+
+        # bulk_create does not return primary keys on MySQL.
+        User.objects.bulk_create([User(username='benchmark_rescore_%d' % i) for i in range(options['participants'])],
+                                 batch_size=BATCH_SIZE)
+        users = User.objects.filter(username__startswith='benchmark_rescore_').values_list('id', flat=True)
+        Profile.objects.bulk_create([Profile(user_id=id) for id in users], batch_size=BATCH_SIZE)
+        profiles = Profile.objects.filter(user__username__startswith='benchmark_rescore_').values_list('id', flat=True)
+        ContestParticipation.objects.bulk_create([ContestParticipation(contest=contest, user_id=id) for id in profiles],
+                                                 batch_size=BATCH_SIZE)
+        participations = dict(contest.users.values_list('user_id', 'id'))
+
+        language = Language.get_python3()
+        problem_ids = list(contest_problems)
+        for users in chunk(list(participations) * options['submissions'], BATCH_SIZE):
+            Submission.objects.bulk_create([
+                Submission(user_id=user, problem_id=rng.choice(problem_ids), language=language, status='D',
+                           result=result, points=rng.choice((0, 30, 100)) if result == 'AC' else 0)
+                for user, result in zip(users, rng.choices(('AC', 'WA', 'TLE', 'CE'), k=len(users)))
+            ])
+
+        # Submissions are all created at the same time, so spread them out over the contest.
+        submissions = Submission.objects.filter(problem_id__in=problem_ids)
+        ids = list(submissions.values_list('id', flat=True))
+        for slot in range(20):
+            for batch in chunk(ids[slot::20], BATCH_SIZE):
+                Submission.objects.filter(id__in=batch) \
+                                  .update(date=contest.start_time + timezone.timedelta(minutes=15 * slot))
+
+        for rows in chunk(submissions.values_list('id', 'user_id', 'problem_id', 'points').iterator(), BATCH_SIZE):
+            ContestSubmission.objects.bulk_create([
+                ContestSubmission(submission_id=id, participation_id=participations[user],
+                                  problem=contest_problems[problem], points=points)
+                for id, user, problem, points in rows
+            ])
+        return contest
+
+    def measure(self, name, count, func):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        print('%-11s %d participations in %.3fs (%.0f participations/s, %.1f queries per participation)' %
+              (name, count, elapsed, count / elapsed, len(queries) / count))
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                start = time.perf_counter()
+                contest = self.create_contest(options)
+                print('Created contest with %d participations and %d submissions in %.3fs' % (
+                    contest.users.count(), ContestSubmission.objects.filter(participation__contest=contest).count(),
+                    time.perf_counter() - start,
+                ))
+
+                sample = list(contest.users.all()[:options['sample']])
+
+                def one_by_one():
+                    for participation in sample:
+                        participation.recompute_results()
+                self.measure('one-by-one', len(sample), one_by_one)
+
+                total = contest.users.count()
+
+                def bulk():
+                    contest.recompute_results(progress=ProgressReporter(total))
+                    print()
+                self.measure('bulk', total, bulk)
+                raise Rollback()
+        except Rollback:
+            pass
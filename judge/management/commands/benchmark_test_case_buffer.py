@@ -0,0 +1,71 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from judge.bridge.judge_handler import JudgeHandler
+from judge.models import Language, Problem, ProblemGroup, Profile, Submission
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'count the database queries the bridge makes while grading synthetic submissions, ' \
+           'with and without test case buffering; all changes are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=20, help='number of submissions to grade')
+        parser.add_argument('--test-cases', type=int, default=200, help='number of test cases per submission')
+
+    def grade(self, handler, submission, test_cases):
+        handler.on_grading_begin({'submission-id': submission.id, 'pretested': False})
+        for position in range(1, test_cases + 1):
+            handler.on_test_case({
+                'name': 'test-case-status',
+                'submission-id': submission.id,
+                'cases': [{
+                    'position': position, 'status': 0, 'time': 0.01, 'memory': 1024,
+                    'points': 1, 'total-points': 1, 'output': '',
+                }],
+            })
+        handler.on_grading_end({'submission-id': submission.id})
+
+    def run(self, name, submissions, test_cases, buffer_size):
+        server = SimpleNamespace(asynchronous=True, server_address=None)
+        handler = JudgeHandler(Mock(), ('127.0.0.1', 0), server, Mock())
+
+        with override_settings(BRIDGED_JUDGE_TEST_CASE_BUFFER_SIZE=buffer_size), \
+                CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for submission in submissions:
+                self.grade(handler, submission, test_cases)
+            elapsed = time.perf_counter() - start
+
+        print('%-10s %.1f queries per submission, %.1fms per submission' % (
+            name, len(queries) / len(submissions), elapsed / len(submissions) * 1000,
+        ))
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                group = ProblemGroup.objects.create(name='benchmark_buffer', full_name='benchmark_buffer')
+                problem = Problem.objects.create(code='benchmark_buffer', name='benchmark_buffer', description='',
+                                                 time_limit=1, memory_limit=65536, points=1, group=group)
+                profile = Profile.objects.create(user=User.objects.create(username='benchmark_buffer'))
+                submissions = [
+                    Submission.objects.create(user=profile, problem=problem, language=Language.get_python3(),
+                                              status='P')
+                    for _ in range(options['submissions'])
+                ]
+
+                self.run('unbuffered', submissions, options['test_cases'], 1)
+                self.run('buffered', submissions, options['test_cases'], 100)
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from judge.models import Problem
+
+
+class Command(BaseCommand):
+    help = 'recount the submissions, accepted submissions and solvers of problems'
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help='only rebuild the statistics of these problems')
+
+    def handle(self, *args, **options):
+        problems = Problem.objects.defer('description').order_by('id')
+        if options['codes']:
+            problems = problems.filter(code__in=options['codes'])
+
+        total = problems.count()
+        drifted = 0
+        for problem in problems.iterator():
+            problem._updating_stats_only = True
+            if problem.update_stats():
+                drifted += 1
+                self.stdout.write(f'Fixed statistics of {problem.code}')
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {total} problems, {drifted} had drifted.'))
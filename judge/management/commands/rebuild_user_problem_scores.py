@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from judge.models import Profile, UserProblemScore
+from judge.utils.iterator import chunk
+
+
+class Command(BaseCommand):
+    help = 'rebuild the best score of every user on every problem from their submissions, ' \
+           'then recalculate their points'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='only rebuild the scores of these users')
+        parser.add_argument('--batch-size', type=int, default=1000, help='number of users to rebuild at once')
+        parser.add_argument('--no-recalculate', action='store_false', dest='recalculate',
+                            help='do not recalculate points after rebuilding')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.order_by('id')
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+
+        total = profiles.count()
+        self.stdout.write(f'Rebuilding scores of {total} users...')
+
+        done = 0
+        for ids in chunk(profiles.values_list('id', flat=True).iterator(), options['batch_size']):
+            UserProblemScore.rebuild(user_ids=ids)
+            if options['recalculate']:
+                for profile in Profile.objects.filter(id__in=ids):
+                    profile._updating_stats_only = True
+                    profile.calculate_points()
+            done += len(ids)
+            self.stdout.write(f'{done}/{total} users')
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -9,6 +9,11 @@ class Command(BaseCommand):
                             help='if specified, run a monitor to automatically update problems')
         parser.add_argument('--problem-storage-globs', nargs='*', default=[],
                             help='globs to monitor for problem updates')
+        parser.add_argument('--asyncio', action='store_true', default=False,
+                            help='if specified, serve all connections from an asyncio event loop '
+                                 'instead of using a thread per connection')
+        parser.add_argument('--workers', type=int, default=32,
+                            help='number of threads handling packets for each server when using --asyncio')
 
     def handle(self, *args, **options):
-        judge_daemon(options['monitor'], options['problem_storage_globs'])
+        judge_daemon(options['monitor'], options['problem_storage_globs'], options['asyncio'], options['workers'])
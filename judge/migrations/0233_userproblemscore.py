@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0232_organization_problem_tag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProblemScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.FloatField(verbose_name='best points')),
+                ('is_accepted', models.BooleanField(default=False, verbose_name='accepted')),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_scores', to='judge.problem', verbose_name='problem')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='problem_scores', to='judge.profile', verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'user problem score',
+                'verbose_name_plural': 'user problem scores',
+                'unique_together': {('user', 'problem')},
+            },
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO judge_userproblemscore (user_id, problem_id, points, is_accepted)
+            SELECT user_id, problem_id, MAX(points), MAX(result = 'AC')
+            FROM judge_submission
+            WHERE points IS NOT NULL
+            GROUP BY user_id, problem_id
+        """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0233_userproblemscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='ac_count',
+            field=models.IntegerField(default=0, verbose_name='number of accepted submissions'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='submission_count',
+            field=models.IntegerField(default=0, verbose_name='number of submissions'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE judge_problem problem
+                INNER JOIN (
+                    SELECT sub.problem_id,
+                           COUNT(*) AS submission_count,
+                           SUM(sub.result = 'AC') AS ac_count,
+                           COUNT(DISTINCT CASE WHEN sub.result = 'AC' THEN sub.user_id END) AS user_count
+                    FROM judge_submission sub
+                    INNER JOIN judge_profile profile ON (profile.id = sub.user_id)
+                    WHERE NOT profile.is_unlisted
+                    GROUP BY sub.problem_id
+                ) stats ON problem.id = stats.problem_id
+            SET problem.submission_count = stats.submission_count,
+                problem.ac_count = stats.ac_count,
+                problem.user_count = stats.user_count
+        """,
+            migrations.RunSQL.noop,
+        ),
+    ]
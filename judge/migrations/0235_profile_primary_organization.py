@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0234_problem_submission_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='primary_organization',
+            field=models.ForeignKey(editable=False, help_text='The listed organization displayed beside the user name, kept in sync with the organizations.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='judge.organization', verbose_name='primary organization'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE judge_profile profile
+            SET profile.primary_organization_id = (
+                SELECT org.id
+                FROM judge_organization org
+                INNER JOIN judge_profile_organizations po ON (po.organization_id = org.id)
+                WHERE po.profile_id = profile.id AND NOT org.is_unlisted
+                ORDER BY org.name
+                LIMIT 1
+            )
+        """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,6 +1,7 @@
 import hashlib
 import hmac
 from datetime import date, timedelta
+from functools import partial
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
@@ -20,7 +21,8 @@ from judge import contest_format
 from judge.models.problem import Problem
 from judge.models.profile import Organization, Profile
 from judge.models.submission import Submission
-from judge.ratings import rate_contest
+from judge.ratings import rate_contests
+from judge.utils.iterator import chunk
 from judge.utils.unicode import utf8bytes
 
 __all__ = ['Contest', 'ContestTag', 'ContestAnnouncement', 'ContestParticipation', 'ContestProblem',
@@ -586,13 +588,57 @@ class Contest(models.Model):
 
         return queryset
 
+    def recompute_results(self, batch_size=1000, progress=None):
+        format = self.format
+        participations = self.users.order_by('id')
+        if not format.scores_from_submissions:
+            rescored = 0
+            for participation in participations.iterator():
+                participation.recompute_results()
+                rescored += 1
+                if progress is not None and rescored % 10 == 0:
+                    progress.done = rescored
+            return rescored
+
+        # Both queries are ordered by participation, so that each participation's submissions can be taken in turn.
+        submissions = format.get_contest_submissions()
+        participation_id, next_submissions = next(submissions, (None, {}))
+
+        rescored = 0
+        for batch in chunk(participations.iterator(), batch_size):
+            for participation in batch:
+                while participation_id is not None and participation_id < participation.id:
+                    participation_id, next_submissions = next(submissions, (None, {}))
+
+                problem_submissions = {}
+                if participation_id == participation.id:
+                    problem_submissions = next_submissions
+                    participation_id, next_submissions = next(submissions, (None, {}))
+
+                format.score_participation(participation, problem_submissions)
+                if participation.is_disqualified:
+                    participation.score = -9999
+                    participation.cumtime = 0
+                    participation.tiebreaker = 0
+
+            ContestParticipation.objects.bulk_update(batch, [
+                'score', 'cumtime', 'tiebreaker', 'frozen_score', 'frozen_cumtime', 'frozen_tiebreaker', 'format_data',
+            ])
+            rescored += len(batch)
+            if progress is not None:
+                progress.done = rescored
+
+        # bulk_update does not send signals, so the scoreboard cannot follow the participations one by one.
+        from judge.scoreboard import invalidate_scoreboard
+        transaction.on_commit(partial(invalidate_scoreboard, self.id))
+        return rescored
+    recompute_results.alters_data = True
+
     def rate(self):
-        with transaction.atomic():
-            Rating.objects.filter(contest__end_time__range=(self.end_time, self._now)).delete()
-            for contest in Contest.objects.filter(
-                is_rated=True, end_time__range=(self.end_time, self._now),
-            ).order_by('end_time'):
-                rate_contest(contest)
+        rate_contests(
+            Contest.objects.filter(is_rated=True, end_time__range=(self.end_time, self._now)),
+            stale_ratings=Rating.objects.filter(contest__end_time__range=(self.end_time, self._now)),
+        )
 
     class Meta:
         permissions = (
@@ -8,7 +8,8 @@ from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django.db import models, transaction
-from django.db.models import CASCADE, Exists, F, FilteredRelation, OuterRef, Q, SET_NULL
+from django.db.models import CASCADE, Case, Exists, ExpressionWrapper, F, FilteredRelation, FloatField, OuterRef, Q, \
+    SET_NULL, Value, When
 from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils import timezone
@@ -229,6 +230,8 @@ class Problem(models.Model):
                                help_text=_('Plain-text, shown in meta description tag, e.g. for social media.'))
     user_count = models.IntegerField(verbose_name=_('number of users'), default=0,
                                      help_text=_('The number of users who solved the problem.'))
+    submission_count = models.IntegerField(verbose_name=_('number of submissions'), default=0)
+    ac_count = models.IntegerField(verbose_name=_('number of accepted submissions'), default=0)
     ac_rate = models.FloatField(verbose_name=_('solve rate'), default=0)
     is_full_markup = models.BooleanField(verbose_name=_('allow full markdown access'), default=False)
     submission_source_visibility_mode = models.CharField(verbose_name=_('submission source visibility'), max_length=1,
@@ -504,18 +507,46 @@ class Problem(models.Model):
         return self.submission_source_visibility_mode
 
     def update_stats(self):
+        # The statistics are normally kept up to date with update_submission_counts, so this only
+        # saves them if they have drifted, and returns whether they had.
         all_queryset = self.submission_set.filter(user__is_unlisted=False)
         ac_queryset = all_queryset.filter(result='AC')
-        self.user_count = ac_queryset.values('user').distinct().count()
-        submissions = all_queryset.count()
-        if submissions:
-            self.ac_rate = 100.0 * ac_queryset.count() / submissions
-        else:
-            self.ac_rate = 0
-        self.save()
+        stats = {
+            'user_count': ac_queryset.values('user').distinct().count(),
+            'submission_count': all_queryset.count(),
+            'ac_count': ac_queryset.count(),
+        }
+        stats['ac_rate'] = 100.0 * stats['ac_count'] / stats['submission_count'] if stats['submission_count'] else 0
+        if all(getattr(self, field) == value for field, value in stats.items()):
+            return False
+        for field, value in stats.items():
+            setattr(self, field, value)
+        self.save(update_fields=list(stats))
+        return True
 
     update_stats.alters_data = True
 
+    @classmethod
+    def update_submission_counts(cls, problem_id, submissions=0, accepted=0, users=0):
+        """Adjusts the statistics of a problem by the given number of submissions, accepted submissions
+        and users who solved it, all by listed users."""
+        if not (submissions or accepted or users):
+            return
+        submission_count = F('submission_count') + submissions
+        ac_count = F('ac_count') + accepted
+        # MySQL evaluates assignments in order and against the columns already assigned, so ac_rate has to come first
+        # for it to see the same old counts as other databases.
+        cls.objects.filter(id=problem_id).update(
+            ac_rate=Case(
+                When(submission_count__gt=-submissions,
+                     then=ExpressionWrapper(Value(100.0) * ac_count / submission_count, output_field=FloatField())),
+                default=Value(0.0),
+            ),
+            submission_count=submission_count,
+            ac_count=ac_count,
+            user_count=F('user_count') + users,
+        )
+
     def _get_limits(self, key):
         global_limit = getattr(self, key)
         limits = {limit['language_id']: (limit['language__name'], limit[key])
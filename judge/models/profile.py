@@ -11,7 +11,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.db import models
-from django.db.models import Max, Sum
+from django.db.models import OuterRef, Subquery, Sum
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.encoding import force_bytes
@@ -261,6 +261,10 @@ class Profile(models.Model):
     display_badge = models.ForeignKey(Badge, verbose_name=_('display badge'), null=True, on_delete=models.SET_NULL)
     organizations = SortedManyToManyField(Organization, verbose_name=_('organization'), blank=True,
                                           related_name='members', related_query_name='member')
+    primary_organization = models.ForeignKey(Organization, verbose_name=_('primary organization'), null=True,
+                                             on_delete=models.SET_NULL, related_name='+', editable=False,
+                                             help_text=_('The listed organization displayed beside the user name, '
+                                                         'kept in sync with the organizations.'))
     display_rank = models.CharField(max_length=10, default='user', verbose_name=_('display rank'),
                                     choices=settings.VNOJ_DISPLAY_RANKS)
     mute = models.BooleanField(verbose_name=_('comment mute'), help_text=_('Some users are at their best when silent.'),
@@ -341,6 +345,18 @@ class Profile(models.Model):
         orgs = self.organizations.all()
         return orgs[0] if orgs else None
 
+    def update_primary_organization(self):
+        self.primary_organization_id = self.organizations.filter(is_unlisted=False).order_by('name') \
+                                           .values_list('id', flat=True).first()
+        Profile.objects.filter(id=self.id).update(primary_organization=self.primary_organization_id)
+
+    @classmethod
+    def update_primary_organizations(cls, profiles):
+        """Recomputes `primary_organization` for a queryset of profiles: their first listed organization by name."""
+        profiles.update(primary_organization=Subquery(
+            Organization.objects.filter(member=OuterRef('id'), is_unlisted=False).order_by('name').values('id')[:1],
+        ))
+
     @cached_property
     def username(self):
         return self.user.username
@@ -390,20 +406,13 @@ class Profile(models.Model):
 
     _pp_table = [pow(settings.DMOJ_PP_STEP, i) for i in range(settings.DMOJ_PP_ENTRIES)]
 
-    def calculate_points(self, table=_pp_table):
+    def calculate_points(self, table=_pp_table, update_organizations=True):
         from judge.models import Problem
-        public_problems = Problem.get_public_problems()
-        data = (
-            public_problems.filter(submission__user=self, submission__points__isnull=False)
-                           .annotate(max_points=Max('submission__points')).order_by('-max_points')
-                           .values_list('max_points', flat=True).filter(max_points__gt=0)
-        )
+        scores = self.problem_scores.filter(problem__in=Problem.get_public_problems())
+        data = scores.filter(points__gt=0).order_by('-points').values_list('points', flat=True)
         bonus_function = settings.DMOJ_PP_BONUS_FUNCTION
         points = sum(data)
-        problems = (
-            public_problems.filter(submission__user=self, submission__result='AC')
-            .values('id').distinct().count()
-        )
+        problems = scores.filter(is_accepted=True).count()
         pp = sum(x * y for x, y in zip(table, data)) + bonus_function(problems)
         if not float_compare_equal(self.points, points) or \
            problems != self.problem_count or \
@@ -412,8 +421,9 @@ class Profile(models.Model):
             self.problem_count = problems
             self.performance_points = pp
             self.save(update_fields=['points', 'problem_count', 'performance_points'])
-            for org in self.organizations.get_queryset():
-                org.calculate_points()
+            if update_organizations:
+                for org in self.organizations.get_queryset():
+                    org.calculate_points()
         return points
 
     calculate_points.alters_data = True
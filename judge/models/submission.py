@@ -3,7 +3,9 @@ import hmac
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Max, Q, Value
+from django.db.models.functions import Greatest
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.functional import cached_property
@@ -16,7 +18,7 @@ from judge.models.profile import Profile
 from judge.models.runtime import Language
 from judge.utils.unicode import utf8bytes
 
-__all__ = ['SUBMISSION_RESULT', 'Submission', 'SubmissionSource', 'SubmissionTestCase']
+__all__ = ['SUBMISSION_RESULT', 'Submission', 'SubmissionSource', 'SubmissionTestCase', 'UserProblemScore']
 
 SUBMISSION_RESULT = (
     ('AC', _('Accepted')),
@@ -171,7 +173,7 @@ class Submission(models.Model):
 
         return False
 
-    def update_contest(self):
+    def update_contest(self, recompute=True):
         try:
             contest = self.contest
         except AttributeError:
@@ -186,7 +188,8 @@ class Submission(models.Model):
             contest.points = 0
 
         contest.save()
-        contest.participation.recompute_results()
+        if recompute:
+            contest.participation.recompute_results()
 
     update_contest.alters_data = True
 
@@ -334,3 +337,86 @@ class SubmissionTestCase(models.Model):
         unique_together = ('submission', 'case')
         verbose_name = _('submission test case')
         verbose_name_plural = _('submission test cases')
+
+
+class UserProblemScore(models.Model):
+    """The best points of a user on a problem, and whether they solved it, over all of their submissions.
+
+    Kept up to date as submissions are graded so that performance points can be computed from this table instead
+    of aggregating over the whole submission history of a user.
+    """
+
+    user = models.ForeignKey(Profile, verbose_name=_('user'), related_name='problem_scores', on_delete=models.CASCADE)
+    problem = models.ForeignKey(Problem, verbose_name=_('problem'), related_name='user_scores',
+                                on_delete=models.CASCADE)
+    points = models.FloatField(verbose_name=_('best points'))
+    is_accepted = models.BooleanField(verbose_name=_('accepted'), default=False)
+
+    # Both of these return the change in whether the user solved the problem: 1 if they just did, -1 if they no
+    # longer have, and 0 otherwise.
+
+    @classmethod
+    def update_from_submission(cls, submission):
+        if submission.rejudged_date is not None:
+            # A rejudge may lower the points of what used to be the best submission.
+            return cls.recompute(submission.user_id, submission.problem_id)
+        if submission.points is None:
+            return 0
+
+        points = Greatest('points', Value(submission.points))
+        scores = cls.objects.filter(user_id=submission.user_id, problem_id=submission.problem_id)
+        if submission.result == 'AC':
+            if scores.filter(is_accepted=False).update(points=points, is_accepted=True):
+                return 1
+            if scores.update(points=points):
+                return 0
+        elif scores.update(points=points):
+            return 0
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=submission.user_id, problem_id=submission.problem_id,
+                                   points=submission.points, is_accepted=submission.result == 'AC')
+        except IntegrityError:
+            # Another submission of the same user to the same problem got here first.
+            return cls.update_from_submission(submission)
+        return int(submission.result == 'AC')
+
+    @classmethod
+    def recompute(cls, user_id, problem_id):
+        scores = cls.objects.filter(user_id=user_id, problem_id=problem_id)
+        was_accepted = scores.filter(is_accepted=True).exists()
+        data = Submission.objects.filter(user_id=user_id, problem_id=problem_id, points__isnull=False) \
+            .aggregate(points=Max('points'), accepted=Count('id', filter=Q(result='AC')))
+        if data['points'] is None:
+            scores.delete()
+        else:
+            cls.objects.update_or_create(user_id=user_id, problem_id=problem_id, defaults={
+                'points': data['points'], 'is_accepted': data['accepted'] > 0,
+            })
+        return int(bool(data['accepted'])) - int(was_accepted)
+
+    @classmethod
+    def rebuild(cls, user_ids=None, problem_ids=None, batch_size=1000):
+        scores = cls.objects.all()
+        submissions = Submission.objects.filter(points__isnull=False)
+        if user_ids is not None:
+            scores = scores.filter(user_id__in=user_ids)
+            submissions = submissions.filter(user_id__in=user_ids)
+        if problem_ids is not None:
+            scores = scores.filter(problem_id__in=problem_ids)
+            submissions = submissions.filter(problem_id__in=problem_ids)
+
+        with transaction.atomic():
+            scores.delete()
+            data = submissions.values_list('user_id', 'problem_id').order_by() \
+                .annotate(best=Max('points'), accepted=Count('id', filter=Q(result='AC')))
+            cls.objects.bulk_create((
+                cls(user_id=user_id, problem_id=problem_id, points=points, is_accepted=accepted > 0)
+                for user_id, problem_id, points, accepted in data.iterator()
+            ), batch_size=batch_size)
+
+    class Meta:
+        unique_together = ('user', 'problem')
+        verbose_name = _('user problem score')
+        verbose_name_plural = _('user problem scores')
@@ -8,7 +8,8 @@ from django.utils import timezone
 from django.utils.encoding import force_bytes
 
 from judge.models import Profile
-from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation
+from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation, \
+    create_organization
 
 
 class OrganizationTestCase(CommonDataMixin, TestCase):
@@ -53,6 +54,37 @@ class ProfileTestCase(CommonDataMixin, TestCase):
         self.assertIsNone(self.users['superuser'].profile.organization)
         self.assertEqual(self.profile.organization, self.organizations['open'])
 
+    def test_primary_organization(self):
+        def primary_organization():
+            return Profile.objects.get(id=self.profile.id).primary_organization
+
+        self.assertIsNone(Profile.objects.get(id=self.users['superuser'].profile.id).primary_organization)
+        self.assertEqual(primary_organization(), self.organizations['open'])
+
+        first = create_organization(name='a_first', is_unlisted=False)
+        self.profile.organizations.add(first)
+        self.assertEqual(self.profile.primary_organization, first)
+        self.assertEqual(primary_organization(), first)
+
+        first.is_unlisted = True
+        first.save()
+        self.assertEqual(primary_organization(), self.organizations['open'])
+
+        self.profile.organizations.remove(self.organizations['open'])
+        self.assertIsNone(primary_organization())
+
+        other = create_organization(name='b_other', is_unlisted=False)
+        other.members.add(self.profile)
+        self.assertEqual(primary_organization(), other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertIsNone(primary_organization())
+
+        first.is_unlisted = False
+        first.save()
+        self.assertEqual(primary_organization(), first)
+
     def test_calculate_points(self):
         self.profile.calculate_points()
 
@@ -1,8 +1,16 @@
+import base64
+import os
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from judge.models import ContestSubmission, Language, Submission, SubmissionSource
+from judge.bridge.base_handler import MAX_ALLOWED_PACKET_SIZE
+from judge.judge_priority import BATCH_REJUDGE_PRIORITY
+from judge.judgeapi import _encode_packet, batch_rejudge_submissions
+from judge.models import ContestSubmission, Language, Submission, SubmissionSource, \
+    SubmissionTestCase as SubmissionTestCaseModel, UserProblemScore
 from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation, \
     create_contest_problem, create_problem, create_user
 
@@ -189,3 +197,183 @@ class SubmissionTestCase(CommonDataMixin, TestCase):
             },
         }
         self._test_object_methods_with_users(self.ie_submission, data)
+
+
+class BatchRejudgeTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+
+        problem = create_problem(code='batch_rejudge')
+        self.submissions = []
+        for status, locked_after in (('D', None), ('D', None), ('G', None),
+                                     ('D', timezone.now() - timezone.timedelta(days=1))):
+            submission = Submission.objects.create(
+                user=self.users['normal'].profile,
+                problem=problem,
+                language=Language.get_python3(),
+                result='WA',
+                status=status,
+                points=0,
+                case_points=0,
+                case_total=1,
+                locked_after=locked_after,
+            )
+            SubmissionSource.objects.create(submission=submission, source='')
+            SubmissionTestCaseModel.objects.create(submission=submission, case=1, status='WA', points=0, total=1)
+            self.submissions.append(submission)
+
+    def rejudge(self, responses):
+        with patch('judge.judgeapi.judge_request_batch', side_effect=responses) as judge_request_batch:
+            rejudged = batch_rejudge_submissions([submission.id for submission in self.submissions])
+        return rejudged, judge_request_batch
+
+    def test_only_graded_unlocked_submissions_are_rejudged(self):
+        def responses(packets):
+            return [{'name': 'submission-received', 'submission-id': packet['submission-id']} for packet in packets]
+
+        rejudged, judge_request_batch = self.rejudge(responses)
+        self.assertEqual(rejudged, 2)
+
+        packets = judge_request_batch.call_args.args[0]
+        self.assertEqual([packet['submission-id'] for packet in packets],
+                         [submission.id for submission in self.submissions[:2]])
+        self.assertTrue(all(packet['priority'] == BATCH_REJUDGE_PRIORITY for packet in packets))
+
+        for submission, status, test_cases in zip(self.submissions, ('QU', 'QU', 'G', 'D'), (0, 0, 1, 1)):
+            submission.refresh_from_db()
+            self.assertEqual(submission.status, status)
+            self.assertEqual(submission.test_cases.count(), test_cases)
+        self.assertIsNone(self.submissions[0].result)
+        self.assertIsNotNone(self.submissions[0].rejudged_date)
+
+    def make_sources_large(self):
+        for submission in self.submissions[:2]:
+            # Incompressible, so that two sources take more than MAX_ALLOWED_PACKET_SIZE.
+            SubmissionSource.objects.filter(submission=submission).update(
+                source=base64.b64encode(os.urandom(3 * 1024 * 1024)).decode('ascii'),
+            )
+
+    def test_large_batches_are_split(self):
+        self.make_sources_large()
+
+        def responses(packets):
+            self.assertLess(len(_encode_packet({'name': 'batch', 'packets': packets})), MAX_ALLOWED_PACKET_SIZE)
+            return [{'name': 'submission-received', 'submission-id': packet['submission-id']} for packet in packets]
+
+        rejudged, judge_request_batch = self.rejudge(responses)
+        self.assertEqual(rejudged, 2)
+        self.assertEqual([[packet['submission-id'] for packet in call.args[0]]
+                          for call in judge_request_batch.call_args_list],
+                         [[submission.id] for submission in self.submissions[:2]])
+
+    def test_failure_after_first_frame(self):
+        self.make_sources_large()
+        rejudged, _ = self.rejudge([
+            [{'name': 'submission-received', 'submission-id': self.submissions[0].id}],
+            OSError(),
+        ])
+        self.assertEqual(rejudged, 1)
+
+        for submission, status in zip(self.submissions, ('QU', 'IE')):
+            submission.refresh_from_db()
+            self.assertEqual(submission.status, status)
+
+    def test_update_events_carry_contest_id(self):
+        problem = create_problem(code='batch_rejudge_public', is_public=True)
+        contest = create_contest(key='batch_rejudge')
+        submission = Submission.objects.create(
+            user=self.users['normal'].profile,
+            problem=problem,
+            language=Language.get_python3(),
+            contest_object=contest,
+            result='WA',
+            status='D',
+        )
+        SubmissionSource.objects.create(submission=submission, source='')
+        ContestSubmission.objects.create(
+            submission=submission,
+            problem=create_contest_problem(problem=problem, contest=contest),
+            participation=create_contest_participation(contest=contest, user='normal'),
+        )
+
+        def responses(packets):
+            return [{'name': 'submission-received', 'submission-id': packet['submission-id']} for packet in packets]
+
+        with patch('judge.judgeapi.judge_request_batch', side_effect=responses), \
+                patch('judge.judgeapi.event.post') as post:
+            self.assertEqual(batch_rejudge_submissions([submission.id]), 1)
+        post.assert_called_once()
+        self.assertEqual(post.call_args.args[1]['contest'], contest.id)
+
+    def test_bridge_failure_marks_internal_error(self):
+        rejudged, _ = self.rejudge(OSError)
+        self.assertEqual(rejudged, 0)
+
+        for submission in self.submissions[:2]:
+            submission.refresh_from_db()
+            self.assertEqual(submission.status, 'IE')
+
+
+class UserProblemScoreTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+        self.profile = self.users['normal'].profile
+        self.problems = [
+            create_problem(code='score_public_%d' % i, is_public=True, points=10, partial=True) for i in range(2)
+        ]
+
+    def grade(self, problem, points, result, rejudged=False):
+        submission = Submission.objects.create(
+            user=self.profile, problem=problem, language=Language.get_python3(), status='D', result=result,
+            points=points, rejudged_date=timezone.now() if rejudged else None,
+        )
+        UserProblemScore.update_from_submission(submission)
+        return submission
+
+    def get_score(self, problem):
+        return UserProblemScore.objects.filter(user=self.profile, problem=problem).values_list(
+            'points', 'is_accepted').first()
+
+    def test_update_from_submission(self):
+        problem = self.problems[0]
+        self.grade(problem, 4, 'PAC')
+        self.assertEqual(self.get_score(problem), (4, False))
+        self.grade(problem, 10, 'AC')
+        self.assertEqual(self.get_score(problem), (10, True))
+        self.grade(problem, 2, 'WA')
+        self.assertEqual(self.get_score(problem), (10, True))
+
+    def test_rejudge_lowers_score(self):
+        problem = self.problems[0]
+        self.grade(problem, 4, 'PAC')
+        submission = self.grade(problem, 10, 'AC')
+
+        submission.points = 0
+        submission.result = 'WA'
+        submission.rejudged_date = timezone.now()
+        submission.save()
+        UserProblemScore.update_from_submission(submission)
+        self.assertEqual(self.get_score(problem), (4, False))
+
+        submission.delete()
+        Submission.objects.filter(problem=problem).delete()
+        self.assertIsNone(self.get_score(problem))
+
+    def test_rebuild(self):
+        self.grade(self.problems[0], 4, 'PAC')
+        self.grade(self.problems[0], 10, 'AC')
+        self.grade(self.problems[1], 3, 'WA')
+        incremental = sorted(UserProblemScore.objects.values_list('user', 'problem', 'points', 'is_accepted'))
+
+        UserProblemScore.rebuild(user_ids=[self.profile.id])
+        self.assertEqual(sorted(UserProblemScore.objects.values_list('user', 'problem', 'points', 'is_accepted')),
+                         incremental)
+
+    def test_calculate_points(self):
+        self.grade(self.problems[0], 10, 'AC')
+        self.grade(self.problems[1], 3, 'WA')
+        self.profile.calculate_points()
+        self.assertEqual(self.profile.points, 13)
+        self.assertEqual(self.profile.problem_count, 1)
@@ -32,15 +32,13 @@ def get_pp_breakdown(user, start=0, end=settings.DMOJ_PP_ENTRIES):
                 SELECT judge_problem.id problem_id,
                        judge_problem.name problem_name,
                        judge_problem.code problem_code,
-                       MAX(judge_submission.points) AS max_points
-                FROM judge_problem
-                INNER JOIN judge_submission ON (judge_problem.id = judge_submission.problem_id)
+                       judge_userproblemscore.points AS max_points
+                FROM judge_userproblemscore
+                INNER JOIN judge_problem ON (judge_problem.id = judge_userproblemscore.problem_id)
                 WHERE (judge_problem.is_public AND
                        NOT judge_problem.is_organization_private AND
-                       judge_submission.points IS NOT NULL AND
-                       judge_submission.user_id = %s)
-                GROUP BY judge_problem.id
-                HAVING MAX(judge_submission.points) > 0.0
+                       judge_userproblemscore.points > 0.0 AND
+                       judge_userproblemscore.user_id = %s)
             ) AS max_points_table
             {join_type} judge_submission ON (
                 judge_submission.problem_id = max_points_table.problem_id AND
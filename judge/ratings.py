@@ -1,12 +1,24 @@
+import uuid
 from bisect import bisect
+from collections import defaultdict, deque
+from functools import partial
+from itertools import chain
 from math import pi, sqrt, tanh
 from operator import attrgetter, itemgetter
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, OuterRef, Subquery
-from django.db.models.functions import Coalesce
+from django.db.models import Count, Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
+from judge.utils.iterator import chunk
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 BETA2 = 328.33 ** 2
 RATING_INIT = 1200      # Newcomer's rating when applying the rating floor/ceiling
@@ -18,6 +30,12 @@ VAR_PER_CONTEST = 1219.047619 * (BETA2 / 212**2)
 VAR_LIM = (sqrt(VAR_PER_CONTEST**2 + 4 * BETA2 * VAR_PER_CONTEST) - VAR_PER_CONTEST) / 2
 SD_LIM = sqrt(VAR_LIM)
 TANH_C = sqrt(3) / pi
+# Number of tanh terms the NumPy engine evaluates at once, to bound its memory usage.
+NUMPY_BLOCK_SIZE = 1 << 20
+RATING_BATCH_SIZE = 1000
+RATING_INPUTS_KEY = 'contest_rating_inputs:%d:%s'
+# Changes whenever ratings are written, since they are part of the inputs of every later contest.
+RATING_HISTORY_VERSION_KEY = 'contest_rating_history_version'
 
 
 def tie_ranker(iterable, key=attrgetter('points')):
@@ -76,7 +94,42 @@ def get_var(times_ranked, cache=[VAR_INIT]):
     return cache[times_ranked]
 
 
+def get_history_limit(min_weight):
+    """Returns how many of the most recent performances can have a weight of at least min_weight in the mean.
+
+    The weights of older performances are smaller still, and they are left out of the mean.
+    """
+    if not min_weight:
+        return None
+    # A performance is weighted the most when its owner has no other history, since the variance is larger then.
+    limit = 0
+    weight = 1.
+    while True:
+        h_var = get_var(limit + 1)
+        weight *= (h_var / (h_var + VAR_PER_CONTEST)) ** 2
+        if weight < min_weight:
+            return limit
+        limit += 1
+
+
 def recalculate_ratings(ranking, old_mean, times_ranked, historical_p):
+    limit = get_history_limit(settings.VNOJ_RATING_HISTORY_MIN_WEIGHT)
+    if limit is not None:
+        historical_p = [h[:limit] for h in historical_p]
+
+    if np is not None and settings.VNOJ_RATING_NUMPY and len(ranking) >= 2:
+        new_mean, new_p = recalculate_ratings_numpy(ranking, old_mean, times_ranked, historical_p)
+        return get_new_rating(new_mean, times_ranked), new_mean, new_p
+    return recalculate_ratings_python(ranking, old_mean, times_ranked, historical_p)
+
+
+def get_new_rating(new_mean, times_ranked):
+    # Display a slightly lower rating to incentivize participation.
+    # As times_ranked increases, new_rating converges to new_mean.
+    return [max(1, round(m - (sqrt(get_var(t + 1)) - SD_LIM))) for m, t in zip(new_mean, times_ranked)]
+
+
+def recalculate_ratings_python(ranking, old_mean, times_ranked, historical_p):
     n = len(ranking)
     new_p = [0.] * n
     new_mean = [0.] * n
@@ -124,7 +177,6 @@ def recalculate_ratings(ranking, old_mean, times_ranked, historical_p):
                 h_var = get_var(times_ranked[i] + 1 - j)
                 k = h_var / (h_var + gamma2)
                 w = w_prev * k**2
-                # Future optimization: If j is around 20, then w < 1e-3 and it is possible to break early.
                 tanh_terms.append((h, sqrt(BETA2) * TANH_C, w))
                 w_prev = w
                 w_sum += w / BETA2
@@ -132,62 +184,326 @@ def recalculate_ratings(ranking, old_mean, times_ranked, historical_p):
             p0 = eval_tanhs(tanh_terms[1:], old_mean[i]) / w0 + old_mean[i]
             new_mean[i] = solve(tanh_terms, w0 * p0, lin_factor=w0)
 
-    # Display a slightly lower rating to incentivize participation.
-    # As times_ranked increases, new_rating converges to new_mean.
-    new_rating = [max(1, round(m - (sqrt(get_var(t + 1)) - SD_LIM))) for m, t in zip(new_mean, times_ranked)]
+    return get_new_rating(new_mean, times_ranked), new_mean, new_p
 
-    return new_rating, new_mean, new_p
 
+def np_eval_tanhs(tanh_terms, x):
+    """Evaluates `eval_tanhs` at every point of x.
+
+    tanh_terms is a tuple of arrays (mu, wt / sd, 2 * sd). If they are one-dimensional, every point is evaluated
+    with the same terms; otherwise row i of the terms is used for x[i].
+    """
+    mu, scale, sd2 = tanh_terms
+    shared = mu.ndim == 1
+    step = max(1, NUMPY_BLOCK_SIZE // mu.shape[-1])
+    y = np.empty_like(x)
+    for start in range(0, len(x), step):
+        rows = slice(start, start + step)
+        if shared:
+            terms = tanh_terms
+        else:
+            terms = mu[rows], scale[rows], sd2[rows]
+        y[rows] = (terms[1] * np.tanh((x[rows, None] - terms[0]) / terms[2])).sum(axis=1)
+    return y
+
+
+def np_solve(tanh_terms, y_tg, lin_factor, L, R):
+    """Runs `solve` for every target in y_tg at once, each within its own bounds (L[i], R[i])."""
+    n = len(y_tg)
+    L, R = L.astype(float), R.astype(float)
+    Ly, Ry = np.full(n, np.nan), np.full(n, np.nan)
+    result = np.full(n, np.nan)
+    lin_factor = np.broadcast_to(lin_factor, (n,))
+
+    def evaluate(rows, x):
+        if tanh_terms[0].ndim == 1:
+            terms = tanh_terms
+        else:
+            terms = tuple(t[rows] for t in tanh_terms)
+        return lin_factor[rows] * x + np_eval_tanhs(terms, x)
+
+    active = np.flatnonzero(R - L > 2)
+    while len(active):
+        x = (L[active] + R[active]) / 2
+        y = evaluate(active, x)
+        target = y_tg[active]
+        above, below = y > target, y < target
+        R[active[above]], Ry[active[above]] = x[above], y[above]
+        L[active[below]], Ly[active[below]] = x[below], y[below]
+        result[active[y == target]] = x[y == target]
+        active = active[(above | below) & (R[active] - L[active] > 2)]
+
+    # Use linear interpolation to be slightly more accurate.
+    rows = np.flatnonzero(np.isnan(result))
+    missing = rows[np.isnan(Ly[rows])]
+    Ly[missing] = evaluate(missing, L[missing])
+    missing = rows[np.isnan(Ry[rows])]
+    Ry[missing] = evaluate(missing, R[missing])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (y_tg - Ly) / (Ry - Ly)
+    interpolated = np.where(y_tg <= Ly, L, np.where(y_tg >= Ry, R, L * (1 - ratio) + R * ratio))
+    result[rows] = interpolated[rows]
+    return result
+
+
+def recalculate_ratings_numpy(ranking, old_mean, times_ranked, historical_p):
+    """Computes the same means and performances as `recalculate_ratings_python`, up to floating point error."""
+    ranking = np.asarray(ranking, dtype=float)
+    old_mean = np.asarray(old_mean, dtype=float)
+    times_ranked = np.asarray(times_ranked, dtype=int)
+    n = len(ranking)
+
+    var = np.array([get_var(t) for t in range(times_ranked.max() + 2)])
+    delta = TANH_C * np.sqrt(var[times_ranked] + VAR_PER_CONTEST + BETA2)
+
+    # Participants with the same prior, e.g. all newcomers, contribute the same term, so only evaluate it once.
+    (mu, d), count = np.unique(np.stack([old_mean, delta]), axis=1, return_counts=True)
+    p_tanh_terms = mu, count / d, 2 * d
+
+    # Tied participants have the same performance, so only solve once for each distinct rank.
+    ranks, rank_idx = np.unique(ranking, return_inverse=True)
+    order = np.argsort(ranking, kind='stable')
+    inv_delta = np.concatenate(([0.], np.cumsum(1. / delta[order])))
+    beaten_by = inv_delta[np.searchsorted(ranking[order], ranks, side='left')]
+    beats = inv_delta[-1] - inv_delta[np.searchsorted(ranking[order], ranks, side='right')]
+    y_tg = beats - beaten_by
+
+    # Calculate performance. Like divconq, solve for the middle of every interval between ranks that are already
+    # solved, using the fact that performance is non-increasing in rank; but solve a whole level at once.
+    m = len(ranks)
+    perf = np.empty(m)
+    ends = np.unique([0, m - 1])
+    perf[ends] = np_solve(p_tanh_terms, y_tg[ends], 0, np.full(len(ends), VALID_RANGE[0]),
+                          np.full(len(ends), VALID_RANGE[1]))
+    i, j = np.array([0]), np.array([m - 1])
+    while True:
+        split = j - i > 1
+        i, j = i[split], j[split]
+        if not len(i):
+            break
+        k = (i + j) // 2
+        perf[k] = np_solve(p_tanh_terms, y_tg[k], 0, perf[j], perf[i])
+        i, j = np.concatenate((i, k)), np.concatenate((k, j))
+    new_p = perf[rank_idx]
+
+    # Calculate mean, with the history of each participant in a row, padded with terms of weight 0.
+    width = 1 + max(map(len, historical_p))
+    h = np.zeros((n, width))
+    h[:, 0] = new_p
+    lengths = np.empty(n, dtype=int)
+    for idx, history in enumerate(historical_p):
+        h[idx, 1:len(history) + 1] = history
+        lengths[idx] = len(history) + 1
+    columns = np.arange(width)
+    gamma2 = np.where(columns > 0, VAR_PER_CONTEST, 0)
+    h_var = var[np.maximum(times_ranked[:, None] + 1 - columns, 0)]
+    w = np.cumprod((h_var / (h_var + gamma2)) ** 2, axis=1)
+    w[columns >= lengths[:, None]] = 0
+    w0 = 1. / var[times_ranked + 1] - w.sum(axis=1) / BETA2
+
+    sd = sqrt(BETA2) * TANH_C
+    scale = w / sd
+    sd2 = np.full((n, width), 2 * sd)
+    history_scale = scale.copy()
+    history_scale[:, 0] = 0
+    p0 = np_eval_tanhs((h, history_scale, sd2), old_mean) / w0 + old_mean
+    new_mean = np_solve((h, scale, sd2), w0 * p0, w0, np.full(n, VALID_RANGE[0]), np.full(n, VALID_RANGE[1]))
+
+    return new_mean.tolist(), new_p.tolist()
+
+
+class RatingHistory:
+    __slots__ = ('rating', 'mean', 'times', 'performances')
+
+    def __init__(self, limit=None):
+        self.rating = None
+        self.mean = MEAN_INIT
+        self.times = 0
+        # The most recent performances, oldest first.
+        self.performances = deque(maxlen=limit)
+
+    def add(self, rating, mean, performance):
+        self.rating = rating
+        self.mean = mean
+        self.times += 1
+        self.performances.append(performance)
+
+
+def load_standings(contest_ids):
+    """Returns the live participations of each contest, best first."""
+    from judge.models import ContestParticipation, ContestSubmission
+
+    standings = defaultdict(list)
+    for participation in ContestParticipation.objects.filter(contest_id__in=contest_ids, virtual=0) \
+            .order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker') \
+            .annotate(has_submissions=Exists(ContestSubmission.objects.filter(participation=OuterRef('id')))) \
+            .values('id', 'contest_id', 'user_id', 'score', 'cumtime', 'tiebreaker', 'is_disqualified',
+                    'has_submissions'):
+        standings[participation['contest_id']].append(participation)
+    return standings
+
+
+def load_rating_history(user_ids, before=None):
+    """Returns the RatingHistory of each user, from the contests that end before the given time if any."""
+    from judge.models import Rating
+
+    limit = get_history_limit(settings.VNOJ_RATING_HISTORY_MIN_WEIGHT)
+    history = defaultdict(partial(RatingHistory, limit))
+    for users in chunk(sorted(user_ids), RATING_BATCH_SIZE):
+        queryset = Rating.objects.filter(user_id__in=users)
+        if before is not None:
+            queryset = queryset.filter(contest__end_time__lt=before)
+        # Only load the performances that count towards the mean, and the latest rating.
+        queryset = queryset.annotate(
+            times=Window(Count('id'), partition_by=F('user_id')),
+            recency=Window(RowNumber(), partition_by=F('user_id'), order_by=F('contest__end_time').desc()),
+        )
+        if limit is not None:
+            queryset = queryset.filter(recency__lte=max(limit, 1))
+        for user_id, rating, mean, performance, times in queryset.order_by('contest__end_time') \
+                .values_list('user_id', 'rating', 'mean', 'performance', 'times'):
+            h = history[user_id]
+            h.add(rating, mean, performance)
+            h.times = times
+    return history
+
+
+def get_rated_participations(contest, standings, history, rate_exclude):
+    rated = []
+    for participation in standings:
+        last_rating = history[participation['user_id']].rating
+        if last_rating is None:
+            last_rating = RATING_INIT
+        if participation['user_id'] in rate_exclude:
+            continue
+        if not contest.rate_all and not participation['has_submissions']:
+            continue
+        if not contest.rate_disqualified and participation['is_disqualified']:
+            continue
+        if contest.rating_floor is not None and last_rating < contest.rating_floor:
+            continue
+        if contest.rating_ceiling is not None and last_rating > contest.rating_ceiling:
+            continue
+        rated.append(participation)
+    return rated
+
+
+def rate_participations(participations, history):
+    """Returns the rank, rating, mean and performance of each of the participations, best first."""
+    user_history = [history[participation['user_id']] for participation in participations]
+    ranking = list(tie_ranker(participations, key=itemgetter('score', 'cumtime', 'tiebreaker')))
+    rating, mean, performance = recalculate_ratings(
+        ranking,
+        [h.mean for h in user_history],
+        [h.times for h in user_history],
+        [list(reversed(h.performances)) for h in user_history],
+    )
+    return list(zip(ranking, rating, mean, performance))
+
+
+def rate_contests(contests, stale_ratings=None):
+    """Rates contests in order of their end time, each with the ratings of the contests before it.
+
+    The standings of all contests and the rating history of all their participants are loaded at once, and kept
+    up to date in memory as the contests are rated. The ratings and the resulting `Profile.rating` are then written
+    in bulk.
+
+    If given, stale_ratings are deleted first. They must include every rating of the contests to rate, and of
+    any contest that ends after them.
+    """
+    from judge.models import Contest, Profile, Rating
+    from judge.scoreboard import invalidate_scoreboard
+
+    contests = sorted(contests, key=attrgetter('end_time'))
+    contest_ids = [contest.id for contest in contests]
 
-def rate_contest(contest):
-    from judge.models import Rating, Profile
-
-    rating_subquery = Rating.objects.filter(user=OuterRef('user'))
-    rating_sorted = rating_subquery.order_by('-contest__end_time')
-    users = contest.users.order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker') \
-        .annotate(submissions=Count('submission'),
-                  last_rating=Coalesce(Subquery(rating_sorted.values('rating')[:1]), RATING_INIT),
-                  last_mean=Coalesce(Subquery(rating_sorted.values('mean')[:1]), MEAN_INIT),
-                  times=Coalesce(Subquery(rating_subquery.order_by().values('user_id')
-                                          .annotate(count=Count('id')).values('count')), 0)) \
-        .exclude(user_id__in=contest.rate_exclude.all()) \
-        .filter(virtual=0).values('id', 'user_id', 'score', 'cumtime', 'tiebreaker', 'last_mean', 'times')
-    if not contest.rate_all:
-        users = users.filter(submissions__gt=0)
-    if not contest.rate_disqualified:
-        users = users.filter(is_disqualified=False)
-    if contest.rating_floor is not None:
-        users = users.exclude(last_rating__lt=contest.rating_floor)
-    if contest.rating_ceiling is not None:
-        users = users.exclude(last_rating__gt=contest.rating_ceiling)
-
-    users = list(users)
-    participation_ids = list(map(itemgetter('id'), users))
-    user_ids = list(map(itemgetter('user_id'), users))
-    ranking = list(tie_ranker(users, key=itemgetter('score', 'cumtime', 'tiebreaker')))
-    old_mean = list(map(itemgetter('last_mean'), users))
-    times_ranked = list(map(itemgetter('times'), users))
-    historical_p = [[] for _ in users]
-
-    user_id_to_idx = {uid: i for i, uid in enumerate(user_ids)}
-    for h in Rating.objects.filter(user_id__in=user_ids) \
-            .order_by('-contest__end_time') \
-            .values('user_id', 'performance'):
-        idx = user_id_to_idx[h['user_id']]
-        historical_p[idx].append(h['performance'])
-
-    rating, mean, performance = recalculate_ratings(ranking, old_mean, times_ranked, historical_p)
-
-    now = timezone.now()
-    ratings = [Rating(user_id=i, contest=contest, rating=r, mean=m, performance=perf,
-                      last_rated=now, participation_id=pid, rank=z)
-               for i, pid, r, m, perf, z in zip(user_ids, participation_ids, rating, mean, performance, ranking)]
     with transaction.atomic():
-        Rating.objects.bulk_create(ratings)
+        # Profiles whose rating may change, and scoreboards that show those ratings.
+        user_ids = set()
+        invalidated = set(contest_ids)
+        if stale_ratings is not None:
+            for user_id, contest_id in stale_ratings.values_list('user_id', 'contest_id'):
+                user_ids.add(user_id)
+                invalidated.add(contest_id)
+            stale_ratings.delete()
+
+        rate_exclude = defaultdict(set)
+        for contest_id, profile_id in Contest.rate_exclude.through.objects.filter(contest_id__in=contest_ids) \
+                .values_list('contest_id', 'profile_id'):
+            rate_exclude[contest_id].add(profile_id)
+
+        standings = load_standings(contest_ids)
+        user_ids.update(participation['user_id'] for participation in chain.from_iterable(standings.values()))
+        history = load_rating_history(user_ids)
+
+        now = timezone.now()
+        ratings = []
+        for contest in contests:
+            participations = get_rated_participations(contest, standings[contest.id], history,
+                                                      rate_exclude[contest.id])
+            for participation, (z, r, m, perf) in zip(participations, rate_participations(participations, history)):
+                history[participation['user_id']].add(r, m, perf)
+                ratings.append(Rating(user_id=participation['user_id'], contest=contest, rating=r, mean=m,
+                                      performance=perf, last_rated=now, participation_id=participation['id'], rank=z))
+
+        Rating.objects.bulk_create(ratings, batch_size=RATING_BATCH_SIZE)
+        Profile.objects.bulk_update([Profile(id=user_id, rating=history[user_id].rating) for user_id in user_ids],
+                                    ['rating'], batch_size=RATING_BATCH_SIZE)
+
+    # Scoreboards show the rating each participant got from the contest.
+    for contest_id in invalidated:
+        transaction.on_commit(partial(invalidate_scoreboard, contest_id))
+    # Any contest after these may be rated with different histories now.
+    transaction.on_commit(partial(cache.delete, RATING_HISTORY_VERSION_KEY))
 
-        Profile.objects.filter(contest_history__contest=contest, contest_history__virtual=0).update(
-            rating=Subquery(Rating.objects.filter(user=OuterRef('id'))
-                            .order_by('-contest__end_time').values('rating')[:1]))
+
+def rate_contest(contest):
+    rate_contests([contest])
+
+
+def _rating_inputs_key(contest_id):
+    version = cache.get(RATING_HISTORY_VERSION_KEY)
+    if version is None:
+        cache.add(RATING_HISTORY_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(RATING_HISTORY_VERSION_KEY)
+    return RATING_INPUTS_KEY % (contest_id, version)
+
+
+def get_rating_inputs(contest):
+    """Returns the standings of the contest, and the rating history of its participants before it.
+
+    These are cached, since they do not depend on who is rated.
+    """
+    key = _rating_inputs_key(contest.id)
+    inputs = cache.get(key)
+    if inputs is None:
+        standings = load_standings([contest.id])[contest.id]
+        history = load_rating_history({participation['user_id'] for participation in standings},
+                                      before=contest.end_time)
+        inputs = standings, dict(history)
+        cache.set(key, inputs, settings.VNOJ_RATING_PREVIEW_TIMEOUT)
+    return inputs
+
+
+def invalidate_rating_inputs(contest_id):
+    cache.delete(_rating_inputs_key(contest_id))
+
+
+def preview_contest_ratings(contest, rate_exclude=None):
+    """Returns the ratings that rating the contest would give, without saving anything.
+
+    The contest is rated as it is set up, except that rate_exclude, if given, replaces its excluded users.
+    Returns (participation, rank, old rating, rating, mean, performance) for each rated participation, best first.
+    """
+    if rate_exclude is None:
+        rate_exclude = contest.rate_exclude.values_list('id', flat=True)
+    standings, history = get_rating_inputs(contest)
+    history = defaultdict(partial(RatingHistory, get_history_limit(settings.VNOJ_RATING_HISTORY_MIN_WEIGHT)),
+                          history)
+    participations = get_rated_participations(contest, standings, history, set(rate_exclude))
+    return [(participation, rank, history[participation['user_id']].rating, rating, mean, performance)
+            for participation, (rank, rating, mean, performance)
+            in zip(participations, rate_participations(participations, history))]
 
 
 RATING_LEVELS = ['Newbie', 'Pupil', 'Specialist', 'Expert', 'Candidate Master', 'Master', 'International Master',
@@ -0,0 +1,654 @@
+import operator
+import time
+from bisect import bisect_left, bisect_right, insort
+from functools import reduce, wraps
+from itertools import chain
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+
+from judge import event_poster as event
+from judge.models import Contest, ContestParticipation, ContestSubmission, Profile
+
+SCOREBOARD_KEY = 'contest_scoreboard:%d'
+# The parts of a scoreboard, by epoch and participation id, block id or version.
+SCOREBOARD_ROW_KEY = 'contest_scoreboard_row:%s:%d'
+SCOREBOARD_BLOCK_KEY = 'contest_scoreboard_block:%s:%s'
+SCOREBOARD_CHANGE_KEY = 'contest_scoreboard_change:%s:%d'
+# Changed participations are queued under consecutive numbers, the last of which is kept under the first key.
+SCOREBOARD_QUEUE_KEY = 'contest_scoreboard_queue:%d'
+SCOREBOARD_QUEUED_KEY = 'contest_scoreboard_queue:%d:%d'
+# Held while applying the queue. Others only queue their participations for the holder to apply.
+SCOREBOARD_LOCK_KEY = 'contest_scoreboard_lock:%d'
+SCOREBOARD_LOCK_TIMEOUT = 10
+# Most participations applied at once.
+SCOREBOARD_BATCH_SIZE = 100
+# Number of keys in a block of an order when it is built. Blocks are split when they grow to twice that.
+SCOREBOARD_BLOCK_SIZE = 256
+
+
+def _serialize_user(row, user_url_tpl, org_url_tpl):
+    """Serialize the user/profile portion of a participation row into a JSON-safe dict."""
+    username = row['user__user__username']
+    display_name = row['user__username_display_override'] or username
+    org_short_name = row['_org_short_name']
+    org_slug = row['_org_slug']
+    badge_mini = row['_badge_mini']
+    badge_name = row['_badge_name']
+
+    return {
+        'username': username,
+        'display_name': display_name,
+        'name': row['user__user__first_name'],
+        'css_class': Profile.get_user_css_class(row['user__display_rank'], row['user__rating']),
+        'url': user_url_tpl.replace('__USERNAME__', username),
+        'organization': {
+            'short_name': org_short_name,
+            'url': org_url_tpl.replace('__SLUG__', org_slug),
+        } if org_short_name else None,
+        'badge': {
+            'mini': badge_mini,
+            'name': badge_name,
+        } if badge_mini else None,
+    }
+
+
+def _serialize_format_data(contest, problems, raw_format_data, frozen):
+    """Transform raw format_data into an API-safe dict keyed by problem id."""
+    result = {}
+    for prob in problems:
+        pid = str(prob.id)
+        raw = (raw_format_data or {}).get(pid)
+        if raw is not None:
+            result[pid] = contest.format.get_format_data_for_api(raw, prob.points, frozen)
+    return result
+
+
+def _ranking_rows(queryset):
+    return queryset.annotate(
+        _org_short_name=F('user__primary_organization__short_name'),
+        _org_slug=F('user__primary_organization__slug'),
+        _badge_mini=F('user__display_badge__mini'),
+        _badge_name=F('user__display_badge__name'),
+    ).values(
+        'id', 'score', 'frozen_score', 'cumtime', 'frozen_cumtime',
+        'tiebreaker', 'frozen_tiebreaker', 'is_disqualified', 'virtual',
+        'format_data',
+        'user_id', 'user__display_rank', 'user__rating',
+        'user__username_display_override',
+        'user__user__username', 'user__user__first_name',
+        'rating__rating',
+        '_org_short_name', '_org_slug', '_badge_mini', '_badge_name',
+    )
+
+
+def _participation_json(contest, problems, row, user, frozen):
+    return {
+        'id': row['id'],
+        'score': float(row['frozen_score'] if frozen else row['score']),
+        'cumtime': float(row['frozen_cumtime'] if frozen else row['cumtime']),
+        'tiebreaker': float(row['frozen_tiebreaker'] if frozen else row['tiebreaker']),
+        'is_disqualified': row['is_disqualified'],
+        'virtual': row['virtual'],
+        'rating': row['rating__rating'],
+        'user': user,
+        'format_data': _serialize_format_data(contest, problems, row['format_data'], frozen),
+    }
+
+
+def _url_templates():
+    # Pre-compute URL templates once to avoid per-row reverse() overhead.
+    return reverse('user_page', args=['__USERNAME__']), reverse('organization_home', args=['__SLUG__'])
+
+
+def make_contest_ranking_json(contest, problems, queryset, frozen=False):
+    user_url_tpl, org_url_tpl = _url_templates()
+    return [
+        _participation_json(contest, problems, row, _serialize_user(row, user_url_tpl, org_url_tpl), frozen)
+        for row in _ranking_rows(queryset)
+    ]
+
+
+def add_ranks_to_participation_json(participations):
+    rank = 0
+    delta = 1
+    last_key = None
+    for p in participations:
+        key = (p['is_disqualified'], p['score'], p['cumtime'], p['tiebreaker'])
+        if key != last_key:
+            rank += delta
+            delta = 0
+        delta += 1
+        p['rank'] = rank
+        last_key = key
+
+
+def _positions(keys):
+    """Maps each participation id in a list of sorted scoreboard keys to its (rank, position)."""
+    positions = {}
+    rank = 0
+    last_key = None
+    for position, key in enumerate(keys):
+        # Scoreboard keys start with the same fields that add_ranks_to_participation_json ranks by.
+        if key[:4] != last_key:
+            rank = position + 1
+            last_key = key[:4]
+        positions[key[-1]] = (rank, position)
+    return positions
+
+
+def _ranked_participations(queryset, frozen, show_virtual):
+    """Orders the participations in a queryset that are on a ranking like the scoreboard does."""
+    prefix = 'frozen_' if frozen else ''
+    submission_count = ContestSubmission.objects.filter(participation=OuterRef('id')).order_by() \
+                                                .values('participation').annotate(count=Count('id')).values('count')
+    if show_virtual:
+        queryset = queryset.filter(virtual__gt=ContestParticipation.SPECTATE)
+    else:
+        queryset = queryset.filter(virtual=ContestParticipation.LIVE)
+    return queryset.annotate(submission_count=Coalesce(Subquery(submission_count), 0)).order_by(
+        'is_disqualified', '-%sscore' % prefix, '%scumtime' % prefix, '%stiebreaker' % prefix,
+        '-submission_count', 'id',
+    )
+
+
+def _ranked_before(key, frozen):
+    """Returns a filter for the participations ordered before a scoreboard key by _ranked_participations."""
+    prefix = 'frozen_' if frozen else ''
+    fields = ('is_disqualified', prefix + 'score', prefix + 'cumtime', prefix + 'tiebreaker', 'submission_count', 'id')
+    # Scores and submission counts are negated in keys, to sort in descending order.
+    values = (key[0], -key[1], key[2], key[3], -key[4], key[5])
+    lookups = ('lt', 'gt', 'lt', 'lt', 'gt', 'lt')
+
+    before = []
+    equal = Q()
+    for field, value, lookup in zip(fields, values, lookups):
+        before.append(equal & Q(**{'%s__%s' % (field, lookup): value}))
+        equal &= Q(**{field: value})
+    return reduce(operator.or_, before)
+
+
+class ScoreboardEvicted(Exception):
+    """Part of a cached scoreboard is gone from the cache."""
+
+
+def _rebuild_if_evicted(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except ScoreboardEvicted:
+            self._rebuild()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class MaterializedScoreboard:
+    """
+    The full ranking of a contest, serialized once and kept in order as its participations change.
+
+    Every row holds its JSON for both the live and the frozen scoreboard, and has a place in the order of each,
+    with and without virtual participations, so that a view only has to rank rows. Rescoring a participation moves
+    just its own row.
+
+    The scoreboard itself only holds an index of each order. Rows, and the sorted keys of each order split into
+    blocks, are cached under keys of their own, so that moving a row only reads and writes that row and the blocks
+    it leaves and enters, and a part of the ranking can be served without reading the rest. Blocks are never
+    changed once cached: a changed block is cached under a new id, so that the index always matches the blocks it
+    points to.
+
+    Each change bumps the version and is remembered for a while, so that a client holding the ranking at an
+    earlier version can be sent just the rows that changed and the rank shifts they caused.
+    """
+
+    def __init__(self, contest, problems):
+        self.contest_id = contest.id
+        self.problems = problems
+        # Versions only mean something within the scoreboard they come from; a rebuilt scoreboard starts over.
+        self.epoch = uuid4().hex[:8]
+        self.version = 0
+        # Number of the last participation taken from the contest's queue.
+        self.applied = 0
+        # Largest id of a participation given a row. Any other participation without a row is new.
+        self.last_participation_id = 0
+        self.built = time.time()
+        # (frozen, show_virtual): [first key, number of keys, block id] for each block of the sorted keys
+        self.indexes = {(frozen, show_virtual): [] for frozen in (False, True) for show_virtual in (False, True)}
+        self._reset()
+
+    def _reset(self):
+        # Rows and blocks read from the cache or yet to be written to it, by participation and block id.
+        self._rows = {}
+        self._blocks = {}
+        self._new_rows = set()
+        self._new_blocks = set()
+        self._new_changes = {}
+
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items() if not name.startswith('_')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    @staticmethod
+    def _sort_key(data, submission_count):
+        # Same order as the ranking querysets, with the id to make it total.
+        return data['is_disqualified'], -data['score'], data['cumtime'], data['tiebreaker'], -submission_count, \
+            data['id']
+
+    @classmethod
+    def build(cls, contest):
+        problems = list(contest.contest_problems.only('id', 'points').order_by('order'))
+        scoreboard = cls(contest, problems)
+        # Participations queued from now on may have changed after they were read below.
+        scoreboard.applied = _queue_length(contest.id)
+        submission_counts = dict(
+            ContestSubmission.objects.filter(participation__contest=contest).values('participation_id')
+                             .annotate(count=Count('id')).values_list('participation_id', 'count'),
+        )
+        queryset = contest.users.filter(virtual__gt=ContestParticipation.SPECTATE)
+        orders = {order: [] for order in scoreboard.indexes}
+        for data, submission_count in scoreboard._serialize(contest, queryset, submission_counts):
+            for order, key in scoreboard._add(data, submission_count):
+                orders[order].append(key)
+            scoreboard.last_participation_id = max(scoreboard.last_participation_id, data[False]['id'])
+        for order, keys in orders.items():
+            keys.sort()
+            scoreboard.indexes[order] = [scoreboard._new_block(keys[i:i + SCOREBOARD_BLOCK_SIZE])
+                                         for i in range(0, len(keys), SCOREBOARD_BLOCK_SIZE)]
+        return scoreboard
+
+    def _serialize(self, contest, queryset, submission_counts):
+        user_url_tpl, org_url_tpl = _url_templates()
+        for row in _ranking_rows(queryset):
+            user = _serialize_user(row, user_url_tpl, org_url_tpl)
+            data = {frozen: _participation_json(contest, self.problems, row, user, frozen) for frozen in (False, True)}
+            yield data, submission_counts.get(row['id'], 0)
+
+    @staticmethod
+    def _orders_of(row):
+        """Returns the orders a row has a place in, with its key in each."""
+        data, keys = row
+        show_virtual = (True, False) if data[False]['virtual'] == ContestParticipation.LIVE else (True,)
+        return [((frozen, virtual), keys[frozen]) for frozen in (False, True) for virtual in show_virtual]
+
+    def _timeout(self):
+        # All the parts of a scoreboard expire with it, a fixed time after it was built, which bounds how stale the
+        # names and organizations on it can get.
+        return max(int(self.built + settings.VNOJ_CONTEST_SCOREBOARD_TIMEOUT - time.time()), 1)
+
+    def _fetch(self, loaded, key_format, ids, required=True):
+        missing = [id for id in ids if id not in loaded]
+        if missing:
+            keys = {key_format % (self.epoch, id): id for id in missing}
+            for key, value in cache.get_many(list(keys)).items():
+                loaded[keys[key]] = value
+        if required and any(id not in loaded for id in ids):
+            raise ScoreboardEvicted()
+        return [loaded.get(id) for id in ids]
+
+    def _fetch_rows(self, participation_ids, required=True):
+        return self._fetch(self._rows, SCOREBOARD_ROW_KEY, participation_ids, required)
+
+    def _fetch_keys(self, block_ids):
+        return self._fetch(self._blocks, SCOREBOARD_BLOCK_KEY, block_ids)
+
+    def _new_block(self, keys):
+        block_id = uuid4().hex[:12]
+        self._blocks[block_id] = keys
+        self._new_blocks.add(block_id)
+        return [keys[0], len(keys), block_id]
+
+    def _locate(self, order, key):
+        """Returns the index of the block of an order that holds a key, or would if it were inserted."""
+        return max(bisect_right([first for first, count, block_id in self.indexes[order]], key) - 1, 0)
+
+    def _insert(self, order, key):
+        index = self.indexes[order]
+        if not index:
+            index.append(self._new_block([key]))
+            return
+        i = self._locate(order, key)
+        keys = list(self._fetch_keys([index[i][2]])[0])
+        insort(keys, key)
+        if len(keys) > 2 * SCOREBOARD_BLOCK_SIZE:
+            index[i:i + 1] = [self._new_block(keys[:SCOREBOARD_BLOCK_SIZE]),
+                              self._new_block(keys[SCOREBOARD_BLOCK_SIZE:])]
+        else:
+            index[i] = self._new_block(keys)
+
+    def _delete(self, order, key):
+        """Removes a key from an order, returning whether it was there."""
+        index = self.indexes[order]
+        if not index:
+            return False
+        i = self._locate(order, key)
+        keys = list(self._fetch_keys([index[i][2]])[0])
+        position = bisect_left(keys, key)
+        if position == len(keys) or keys[position] != key:
+            return False
+        del keys[position]
+        if keys:
+            index[i] = self._new_block(keys)
+        else:
+            del index[i]
+        return True
+
+    def _position(self, order, key):
+        """Returns the number of keys in an order that are smaller than `key`."""
+        index = self.indexes[order]
+        if not index:
+            return 0
+        i = self._locate(order, key)
+        return sum(count for first, count, block_id in index[:i]) + bisect_left(self._fetch_keys([index[i][2]])[0], key)
+
+    def _keys(self, order):
+        return list(chain.from_iterable(self._fetch_keys([block_id for first, count, block_id in self.indexes[order]])))
+
+    def _add(self, data, submission_count):
+        keys = {frozen: self._sort_key(data[frozen], submission_count) for frozen in (False, True)}
+        row = (data, keys)
+        self._rows[data[False]['id']] = row
+        self._new_rows.add(data[False]['id'])
+        return self._orders_of(row)
+
+    def refresh(self, contest, participation_ids):
+        """Reloads participations' rows from the database, moving them to their new places."""
+        rows = dict(zip(participation_ids, self._fetch_rows(participation_ids, required=False)))
+        queryset = contest.users.filter(id__in=participation_ids, virtual__gt=ContestParticipation.SPECTATE)
+        submission_counts = dict(
+            ContestSubmission.objects.filter(participation_id__in=participation_ids).values('participation_id')
+                             .annotate(count=Count('id')).values_list('participation_id', 'count'),
+        )
+        serialized = {data[False]['id']: (data, submission_count)
+                      for data, submission_count in self._serialize(contest, queryset, submission_counts)}
+
+        # Participations get increasing ids, so one without a row is new if its id is larger than any on the
+        # scoreboard. Otherwise its row was evicted, and its keys can't be found to be removed. A participation
+        # committed out of order is taken for evicted too, which only costs a rebuild.
+        if any(rows[id] is None and id <= self.last_participation_id for id in serialized):
+            raise ScoreboardEvicted()
+        self.last_participation_id = max([self.last_participation_id, *serialized])
+
+        for participation_id in participation_ids:
+            row = rows[participation_id]
+            removed = row is not None and any([self._delete(order, key) for order, key in self._orders_of(row)])
+            if not removed and participation_id not in serialized:
+                continue
+            if participation_id in serialized:
+                for order, key in self._add(*serialized[participation_id]):
+                    self._insert(order, key)
+            self.version += 1
+            # Enough of the old row to tell where it used to be.
+            self._new_changes[self.version] = (participation_id,
+                                               (row[1], row[0][False]['virtual']) if removed else None)
+
+    def save(self, replace=True):
+        """
+        Caches the rows, blocks and changes written since the scoreboard was read, and then the scoreboard itself,
+        unless `replace` is False and another one is already cached. Returns whether the scoreboard was cached.
+        """
+        timeout = self._timeout()
+        values = {SCOREBOARD_ROW_KEY % (self.epoch, id): self._rows[id] for id in self._new_rows}
+        indexed = {block_id for index in self.indexes.values() for first, count, block_id in index}
+        values.update({SCOREBOARD_BLOCK_KEY % (self.epoch, id): self._blocks[id] for id in self._new_blocks & indexed})
+        values.update({SCOREBOARD_CHANGE_KEY % (self.epoch, version): change
+                       for version, change in self._new_changes.items()})
+        cache.set_many(values, timeout)
+        self._new_rows.clear()
+        self._new_blocks.clear()
+        self._new_changes.clear()
+        if replace:
+            cache.set(SCOREBOARD_KEY % self.contest_id, self, timeout)
+            return True
+        return cache.add(SCOREBOARD_KEY % self.contest_id, self, timeout)
+
+    def _rebuild(self):
+        scoreboard = MaterializedScoreboard.build(Contest.objects.get(id=self.contest_id))
+        scoreboard.save()
+        self.__dict__.update(scoreboard.__dict__)
+
+    @_rebuild_if_evicted
+    def participations(self, frozen, show_virtual):
+        keys = self._keys((frozen, show_virtual))
+        # Rows are shared with the scoreboard, so copy them before adding ranks.
+        participations = [dict(row[0][frozen]) for row in self._fetch_rows([key[-1] for key in keys])]
+        add_ranks_to_participation_json(participations)
+        return participations
+
+    def _key(self, participation_id, order):
+        """Returns the key of a participation in an order, or None if it is not in it."""
+        row = self._fetch_rows([participation_id], required=False)[0]
+        if row is None:
+            return None
+        key = dict(self._orders_of(row)).get(order)
+        if key is None:
+            return None
+        index = self.indexes[order]
+        keys = self._fetch_keys([index[self._locate(order, key)][2]])[0] if index else []
+        position = bisect_left(keys, key)
+        return key if position < len(keys) and keys[position] == key else None
+
+    def _slice(self, order, offset, limit):
+        """Returns `limit` keys of an order from `offset` on, reading only the blocks they are in."""
+        block_ids = []
+        skip = offset
+        start = 0
+        for first, count, block_id in self.indexes[order]:
+            if start + count > offset and start < offset + limit:
+                if not block_ids:
+                    skip = offset - start
+                block_ids.append(block_id)
+            start += count
+        return list(chain.from_iterable(self._fetch_keys(block_ids)))[skip:skip + limit]
+
+    @_rebuild_if_evicted
+    def window(self, frozen, show_virtual, offset, limit, queryset=None, around=None):
+        """
+        Returns the number of rows in the ranking, optionally narrowed down to the participations in `queryset`, the
+        offset of the window and `limit` rows from there on. If the participation `around` is among the rows, the window
+        is centered on it instead of starting at `offset`. Rows keep the rank they have in the full ranking.
+
+        Only the rows in the window are read. A narrowed down ranking is windowed by the database.
+        """
+        order = frozen, show_virtual
+        key = None if around is None else self._key(around, order)
+        if queryset is None:
+            total = sum(count for first, count, block_id in self.indexes[order])
+            if key is not None:
+                offset = max(self._position(order, key) - limit // 2, 0)
+            keys = self._slice(order, offset, limit)
+        else:
+            queryset = _ranked_participations(queryset, frozen, show_virtual)
+            total = queryset.count()
+            if key is not None and queryset.filter(id=around).exists():
+                offset = max(queryset.filter(_ranked_before(key, frozen)).count() - limit // 2, 0)
+            participation_ids = list(queryset.values_list('id', flat=True)[offset:offset + limit])
+            # Participations queued to be added to the scoreboard are left out until they are.
+            keys = [row[1][frozen] for row in self._fetch_rows(participation_ids, required=False) if row is not None]
+
+        participations = []
+        last_key = None
+        for key, row in zip(keys, self._fetch_rows([key[-1] for key in keys])):
+            # The rank is one more than the number of rows ranked strictly before this one, i.e. before the first
+            # key starting with the same fields that add_ranks_to_participation_json ranks by.
+            if key[:4] != last_key:
+                rank = self._position(order, key[:4]) + 1
+                last_key = key[:4]
+            participations.append(dict(row[0][frozen], rank=rank))
+        return total, offset, participations
+
+    def version_token(self, frozen, show_virtual):
+        """Identifies the ranking returned by `participations` with the same arguments, for use with `delta`."""
+        return '%s.%d.%d.%d' % (self.epoch, self.version, frozen, show_virtual)
+
+    @_rebuild_if_evicted
+    def delta(self, since, frozen, show_virtual):
+        """
+        Returns what changed in the ranking since the version token `since`: the rows of rescored participations,
+        the new rank and position of every row that has either changed, and the ids of removed participations.
+
+        Returns None if the changes since then are not known, in which case the client needs the full ranking.
+        """
+        try:
+            epoch, version, since_frozen, since_virtual = since.split('.')
+            version = int(version)
+        except ValueError:
+            return None
+        if (epoch, since_frozen, since_virtual) != (self.epoch, str(int(frozen)), str(int(show_virtual))) or \
+                not self.version - settings.VNOJ_CONTEST_SCOREBOARD_HISTORY <= version <= self.version:
+            return None
+
+        change_keys = [SCOREBOARD_CHANGE_KEY % (self.epoch, v) for v in range(version + 1, self.version + 1)]
+        changes = cache.get_many(change_keys)
+        if len(changes) < len(change_keys):
+            return None
+
+        # Where each participation changed since then was before its first change.
+        previous = {}
+        for participation_id, old in map(changes.get, change_keys):
+            previous.setdefault(participation_id, old)
+
+        current = self._keys((frozen, show_virtual))
+        old = [key for key in current if key[-1] not in previous]
+        old += [keys[frozen] for keys, virtual in filter(None, previous.values())
+                if show_virtual or virtual == ContestParticipation.LIVE]
+        old.sort()
+
+        old_positions = _positions(old)
+        new_positions = _positions(current)
+        updated = []
+        moved = []
+        for participation_id, (rank, position) in new_positions.items():
+            if participation_id in previous:
+                updated.append(dict(self._fetch_rows([participation_id])[0][0][frozen], rank=rank))
+            elif old_positions[participation_id] == (rank, position):
+                continue
+            moved.append([participation_id, rank, position])
+
+        return {
+            'version': self.version_token(frozen, show_virtual),
+            'count': len(current),
+            'updated': updated,
+            'moved': moved,
+            'removed': [participation_id for participation_id in previous if participation_id not in new_positions],
+        }
+
+
+def _queue_length(contest_id):
+    return cache.get(SCOREBOARD_QUEUE_KEY % contest_id, 0)
+
+
+def _enqueue(contest_id, participation_id):
+    key = SCOREBOARD_QUEUE_KEY % contest_id
+    while True:
+        cache.add(key, 0, None)
+        try:
+            number = cache.incr(key)
+        except ValueError:
+            # The counter was evicted in the meantime.
+            continue
+        break
+    cache.set(SCOREBOARD_QUEUED_KEY % (contest_id, number), participation_id, settings.VNOJ_CONTEST_SCOREBOARD_TIMEOUT)
+
+
+def _has_queued(contest_id):
+    scoreboard = cache.get(SCOREBOARD_KEY % contest_id)
+    if scoreboard is None:
+        return False
+    return cache.get(SCOREBOARD_QUEUED_KEY % (contest_id, scoreboard.applied + 1)) is not None or \
+        _queue_length(contest_id) < scoreboard.applied
+
+
+def _apply_queue(contest_id):
+    """
+    Takes the next participations off the contest's queue and moves their rows in the cached scoreboard.
+    Must be called with the contest's scoreboard lock held.
+    """
+    scoreboard = cache.get(SCOREBOARD_KEY % contest_id)
+    if scoreboard is None:
+        return
+    length = _queue_length(contest_id)
+    if length < scoreboard.applied:
+        # The queue was evicted, along with the participations in it.
+        invalidate_scoreboard(contest_id)
+        return
+
+    numbers = range(scoreboard.applied + 1, min(length, scoreboard.applied + SCOREBOARD_BATCH_SIZE) + 1)
+    queued = cache.get_many([SCOREBOARD_QUEUED_KEY % (contest_id, number) for number in numbers])
+    participation_ids = []
+    for number in numbers:
+        # Stop at a participation that is counted, but not queued yet.
+        if SCOREBOARD_QUEUED_KEY % (contest_id, number) not in queued:
+            break
+        participation_ids.append(queued[SCOREBOARD_QUEUED_KEY % (contest_id, number)])
+        scoreboard.applied = number
+    if not participation_ids:
+        return
+
+    contest = Contest.objects.filter(id=contest_id).first()
+    if contest is None:
+        invalidate_scoreboard(contest_id)
+        return
+    version = scoreboard.version
+    try:
+        scoreboard.refresh(contest, list(dict.fromkeys(participation_ids)))
+    except ScoreboardEvicted:
+        invalidate_scoreboard(contest_id)
+        return
+
+    current = cache.get(SCOREBOARD_KEY % contest_id)
+    # The scoreboard may have been invalidated in the meantime.
+    if current is None or (current.epoch, current.version) != (scoreboard.epoch, version):
+        return
+    scoreboard.save()
+    cache.delete_many(list(queued))
+
+    if scoreboard.version != version:
+        event.post('contest_%d' % contest_id, {
+            'type': 'ranking',
+            'version': '%s.%d' % (scoreboard.epoch, scoreboard.version),
+        })
+
+
+def _apply_queued(contest_id):
+    """Applies the contest's queue to its cached scoreboard, unless someone else is already doing so."""
+    key = SCOREBOARD_LOCK_KEY % contest_id
+    while _has_queued(contest_id):
+        if not cache.add(key, True, SCOREBOARD_LOCK_TIMEOUT):
+            # Whoever holds the lock looks at the queue again once they release it.
+            return
+        try:
+            _apply_queue(contest_id)
+        finally:
+            cache.delete(key)
+
+
+def get_scoreboard(contest):
+    scoreboard = cache.get(SCOREBOARD_KEY % contest.id)
+    if scoreboard is not None:
+        return scoreboard
+
+    scoreboard = MaterializedScoreboard.build(contest)
+    if scoreboard.save(replace=False):
+        # Participations that changed while the scoreboard was being built may not be part of it yet.
+        _apply_queued(contest.id)
+    return scoreboard
+
+
+def update_scoreboard(contest_id, participation_id):
+    """
+    Queues a participation to be moved in the contest's cached scoreboard after it has been rescored, created or
+    deleted, and applies the queue unless that is already being done. Should be called once the change is committed.
+    """
+    _enqueue(contest_id, participation_id)
+    _apply_queued(contest_id)
+
+
+def invalidate_scoreboard(contest_id):
+    cache.delete(SCOREBOARD_KEY % contest_id)
@@ -1,5 +1,6 @@
 import errno
 import os
+from functools import partial
 from typing import Optional
 
 from django.conf import settings
@@ -7,15 +8,17 @@ from django.contrib.flatpages.models import FlatPage
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.db import transaction
-from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from registration.models import RegistrationProfile
 from registration.signals import user_registered
 
 from judge.caching import finished_submission
-from judge.models import BlogPost, Comment, Contest, ContestAnnouncement, ContestProblem, ContestSubmission, \
-    EFFECTIVE_MATH_ENGINES, Judge, Language, License, MiscConfig, Organization, Problem, Profile, Submission, \
-    WebAuthnCredential
+from judge.models import BlogPost, Comment, Contest, ContestAnnouncement, ContestParticipation, ContestProblem, \
+    ContestSubmission, EFFECTIVE_MATH_ENGINES, Judge, Language, License, MiscConfig, Organization, Problem, Profile, \
+    Submission, UserProblemScore, WebAuthnCredential
+from judge.ratings import invalidate_rating_inputs
+from judge.scoreboard import invalidate_scoreboard, update_scoreboard
 from judge.tasks import on_new_comment
 from judge.views.register import RegistrationView
 
@@ -82,10 +85,18 @@ def contest_update(sender, instance, **kwargs):
     cache.delete_many(['generated-meta-contest:%d' % instance.id] +
                       [make_template_fragment_key('contest_html', (instance.id, engine))
                        for engine in EFFECTIVE_MATH_ENGINES])
+    # The format, its config and the freeze all change how scoreboard rows are serialized.
+    transaction.on_commit(partial(invalidate_scoreboard, instance.id))
+
+
+@receiver(post_save, sender=ContestProblem)
+def contest_problem_update(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_scoreboard, instance.contest_id))
 
 
 @receiver(post_delete, sender=ContestProblem)
 def contest_problem_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_scoreboard, instance.contest_id))
     # `contest_object` is the `Contest` object indirectly associated with the `Submission` object
     # `contest` is the `ContestSubmission` object associated with the `Submission` object
     Submission.objects.filter(contest_object=instance.contest, contest__isnull=True).update(contest_object=None)
@@ -126,13 +137,28 @@ def post_update(sender, instance, **kwargs):
                        for engine in EFFECTIVE_MATH_ENGINES])
 
 
+@receiver(post_save, sender=Submission)
+def submission_create(sender, instance, created, **kwargs):
+    if created and not instance.user.is_unlisted:
+        Problem.update_submission_counts(instance.problem_id, submissions=1)
+
+
 @receiver(post_delete, sender=Submission)
 def submission_delete(sender, instance, **kwargs):
     finished_submission(instance)
+    users = UserProblemScore.recompute(instance.user_id, instance.problem_id)
     instance.user._updating_stats_only = True
     instance.user.calculate_points()
-    instance.problem._updating_stats_only = True
-    instance.problem.update_stats()
+    if not instance.user.is_unlisted:
+        Problem.update_submission_counts(instance.problem_id, submissions=-1,
+                                         accepted=-int(instance.result == 'AC'), users=users)
+
+
+@receiver(post_save, sender=ContestParticipation)
+@receiver(post_delete, sender=ContestParticipation)
+def contest_participation_update(sender, instance, **kwargs):
+    transaction.on_commit(partial(update_scoreboard, instance.contest_id, instance.id))
+    transaction.on_commit(partial(invalidate_rating_inputs, instance.contest_id))
 
 
 @receiver(post_delete, sender=ContestSubmission)
@@ -143,9 +169,19 @@ def contest_submission_delete(sender, instance, **kwargs):
 
 
 @receiver(post_save, sender=Organization)
-def organization_update(sender, instance, **kwargs):
+def organization_update(sender, instance, update_fields=None, **kwargs):
     cache.delete_many([make_template_fragment_key('organization_html', (instance.id, engine))
                        for engine in EFFECTIVE_MATH_ENGINES])
+    # Points and member counts are saved on their own all the time, and don't affect anyone's primary organization.
+    if update_fields is None or {'name', 'is_unlisted'} & set(update_fields):
+        Profile.update_primary_organizations(instance.members.all())
+
+
+@receiver(pre_delete, sender=Organization)
+def organization_delete(sender, instance, **kwargs):
+    # By post_delete, the members are no longer related to the organization.
+    members = list(instance.members.values_list('id', flat=True))
+    transaction.on_commit(lambda: Profile.update_primary_organizations(Profile.objects.filter(id__in=members)))
 
 
 @receiver(m2m_changed, sender=Organization.admins.through)
@@ -177,7 +213,17 @@ def flatpage_update(sender, instance, **kwargs):
 
 
 @receiver(m2m_changed, sender=Profile.organizations.through)
-def profile_organization_update(sender, instance, action, **kwargs):
+def profile_organization_update(sender, instance, action, reverse, **kwargs):
+    if reverse:
+        # The profiles in pk_set were added to or removed from the organization instance.
+        if action == 'post_remove' or action == 'post_add':
+            Profile.update_primary_organizations(Profile.objects.filter(pk__in=kwargs.get('pk_set') or set()))
+        elif action == 'post_clear':
+            Profile.update_primary_organizations(Profile.objects.filter(primary_organization=instance))
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.on_user_changes()
+        return
+
     orgs_to_be_updated = []
     if action == 'pre_clear':
         orgs_to_be_updated = instance.organizations.get_queryset()
@@ -186,6 +232,8 @@ def profile_organization_update(sender, instance, action, **kwargs):
         orgs_to_be_updated = Organization.objects.filter(pk__in=pks)
     for org in orgs_to_be_updated:
         org.on_user_changes()
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        instance.update_primary_organization()
 
 
 @receiver(post_save, sender=ContestAnnouncement)
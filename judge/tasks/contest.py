@@ -24,16 +24,9 @@ logger = logging.getLogger('judge.celery')
 @shared_task(bind=True)
 def rescore_contest(self, contest_key):
     contest = Contest.objects.get(key=contest_key)
-    participations = contest.users
-
-    rescored = 0
-    with Progress(self, participations.count(), stage=_('Recalculating contest scores')) as p:
-        for participation in participations.iterator():
-            participation.recompute_results()
-            rescored += 1
-            if rescored % 10 == 0:
-                p.done = rescored
-    return rescored
+
+    with Progress(self, contest.users.count(), stage=_('Recalculating contest scores')) as p:
+        return contest.recompute_results(progress=p)
 
 
 @shared_task(bind=True)
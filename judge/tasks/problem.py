@@ -5,7 +5,7 @@ from django.utils import timezone
 from judge.models import Problem
 from judge.utils.problems import fast_delete_problem
 
-__all__ = ('problem_garbage_collect',)
+__all__ = ('problem_garbage_collect', 'reconcile_problem_stats')
 
 
 @shared_task
@@ -16,3 +16,12 @@ def problem_garbage_collect():
         if timezone.now() > end:
             break
         fast_delete_problem(problem)
+
+
+@shared_task
+def reconcile_problem_stats():
+    drifted = 0
+    for problem in Problem.objects.defer('description').iterator():
+        problem._updating_stats_only = True
+        drifted += problem.update_stats()
+    return drifted
@@ -4,8 +4,10 @@ from django.core.cache import cache
 from django.utils import timezone
 from django.utils.translation import gettext as _
 
-from judge.models import Problem, Profile, Submission
+from judge.judgeapi import REJUDGE_BATCH_SIZE, batch_rejudge_submissions
+from judge.models import Problem, Profile, Submission, UserProblemScore
 from judge.utils.celery import Progress
+from judge.utils.iterator import chunk
 
 __all__ = ('apply_submission_filter', 'rejudge_problem_filter', 'rescore_problem')
 
@@ -31,11 +33,9 @@ def rejudge_problem_filter(self, problem_id, id_range=None, languages=None, resu
 
     rejudged = 0
     with Progress(self, queryset.count()) as p:
-        for submission in queryset.iterator():
-            submission.judge(rejudge=True, batch_rejudge=True, rejudge_user=user)
-            rejudged += 1
-            if rejudged % 10 == 0:
-                p.done = rejudged
+        for ids in chunk(queryset.order_by('id').values_list('id', flat=True).iterator(), REJUDGE_BATCH_SIZE):
+            rejudged += batch_rejudge_submissions(ids, rejudge_user=user)
+            p.did(len(ids))
     return rejudged
 
 
@@ -56,6 +56,7 @@ def rescore_problem(self, problem_id):
             rescored += 1
             if rescored % 10 == 0:
                 p.done = rescored
+    UserProblemScore.rebuild(problem_ids=[problem_id])
 
     with Progress(self, submissions.values('user_id').distinct().count(), stage=_('Recalculating user points')) as p:
         users = 0
@@ -0,0 +1,221 @@
+import socket
+import threading
+import zlib
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from judge.bridge.async_server import AsyncServer
+from judge.bridge.base_handler import MAX_ALLOWED_PACKET_SIZE, ZlibPacketHandler, size_pack
+
+
+def frame(data):
+    compressed = zlib.compress(data.encode('utf-8'))
+    return size_pack.pack(len(compressed)) + compressed
+
+
+class StubHandler(ZlibPacketHandler):
+    """Echoes packets back, and records what happened to it for the tests to look at."""
+
+    instances = []
+    timeout_on_connect = None
+
+    def __init__(self, request, client_address, server):
+        super().__init__(request, client_address, server)
+        self.packets = []
+        self.timed_out = threading.Event()
+        self.disconnected = threading.Event()
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+        self.instances.append(self)
+
+    def on_connect(self):
+        self.timeout = self.timeout_on_connect
+
+    def on_packet(self, data):
+        self.unblocked.wait(5)
+        self.packets.append(data)
+        self.send(data)
+
+    def on_timeout(self):
+        self.timed_out.set()
+
+    def on_disconnect(self):
+        self.disconnected.set()
+
+
+class AsyncServerTestCase(SimpleTestCase):
+    def setUp(self):
+        StubHandler.instances = []
+        StubHandler.proxies = []
+        StubHandler.timeout_on_connect = None
+        self.server = AsyncServer([('127.0.0.1', 0)], StubHandler, max_workers=4)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.server._started.wait(5)
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.server.shutdown()
+        self.thread.join(5)
+
+    def connect(self):
+        sock = socket.create_connection(self.server.server_addresses[0], timeout=5)
+        self.sockets.append(sock)
+        return sock
+
+    def handler(self):
+        for _ in range(500):
+            if StubHandler.instances:
+                return StubHandler.instances[0]
+            threading.Event().wait(0.01)
+        self.fail('no connection was handled')
+
+    def recv_exactly(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                self.fail('connection closed')
+            data += chunk
+        return data
+
+    def recv_packet(self, sock):
+        size = size_pack.unpack(self.recv_exactly(sock, size_pack.size))[0]
+        return zlib.decompress(self.recv_exactly(sock, size)).decode('utf-8')
+
+    def assertClosed(self, sock):
+        self.assertEqual(sock.recv(1), b'')
+
+    def test_framing(self):
+        sock = self.connect()
+        # Several packets in one write, and one packet split over several writes.
+        sock.sendall(frame('one') + frame('two'))
+        split = frame('three')
+        sock.sendall(split[:2])
+        threading.Event().wait(0.05)
+        sock.sendall(split[2:7])
+        threading.Event().wait(0.05)
+        sock.sendall(split[7:])
+        self.assertEqual([self.recv_packet(sock) for _ in range(3)], ['one', 'two', 'three'])
+        self.assertEqual(self.handler().packets, ['one', 'two', 'three'])
+
+    def test_proxy_header(self):
+        StubHandler.proxies = ['127.0.0.1']
+        sock = self.connect()
+        sock.sendall(b'PROXY TCP4 192.0.2.1 198.51.100.1 1234 9999\r\n' + frame('hello'))
+        self.assertEqual(self.recv_packet(sock), 'hello')
+        handler = self.handler()
+        self.assertEqual(handler.client_address, ('192.0.2.1', '1234'))
+        self.assertEqual(handler.server_address, ('198.51.100.1', '9999'))
+
+    def test_proxy_header_from_untrusted_address(self):
+        sock = self.connect()
+        sock.sendall(b'PROXY TCP4 192.0.2.1 198.51.100.1 1234 9999\r\n' + frame('hello'))
+        # Without a trusted proxy, the header is taken as the size of a (far too large) first packet.
+        self.assertClosed(sock)
+        self.assertTrue(self.handler().disconnected.wait(5))
+        self.assertEqual(self.handler().packets, [])
+
+    def test_too_large_packet(self):
+        sock = self.connect()
+        sock.sendall(frame('hello') + size_pack.pack(MAX_ALLOWED_PACKET_SIZE + 1))
+        self.assertEqual(self.recv_packet(sock), 'hello')
+        self.assertClosed(sock)
+        self.assertTrue(self.handler().disconnected.wait(5))
+
+    def test_zlib_error(self):
+        sock = self.connect()
+        sock.sendall(size_pack.pack(5) + b'hello')
+        self.assertClosed(sock)
+        self.assertTrue(self.handler().disconnected.wait(5))
+
+    def test_timeout(self):
+        StubHandler.timeout_on_connect = 0.2
+        sock = self.connect()
+        sock.sendall(frame('hello'))
+        self.assertEqual(self.recv_packet(sock), 'hello')
+        handler = self.handler()
+        self.assertTrue(handler.timed_out.wait(5))
+        self.assertClosed(sock)
+        self.assertTrue(handler.disconnected.wait(5))
+
+    def test_timeout_before_first_packet(self):
+        StubHandler.timeout_on_connect = 0.2
+        sock = self.connect()
+        self.assertClosed(sock)
+        # A client that never sent anything is not using the protocol, so it is not reported as timed out.
+        handler = self.handler()
+        self.assertTrue(handler.disconnected.wait(5))
+        self.assertFalse(handler.timed_out.is_set())
+
+    def test_backpressure(self):
+        with mock.patch('judge.bridge.async_server.MAX_PENDING_PACKETS', 4):
+            sock = self.connect()
+            sock.sendall(frame('first'))
+            self.assertEqual(self.recv_packet(sock), 'first')
+            handler = self.handler()
+            handler.unblocked.clear()
+
+            sock.sendall(b''.join(frame(str(i)) for i in range(20)))
+            protocol = handler.request.protocol
+            for _ in range(500):
+                if protocol._paused:
+                    break
+                threading.Event().wait(0.01)
+            self.assertTrue(protocol._paused)
+
+            handler.unblocked.set()
+            self.assertEqual([self.recv_packet(sock) for _ in range(20)], [str(i) for i in range(20)])
+            self.assertFalse(protocol._paused)
+
+    def test_disconnect(self):
+        sock = self.connect()
+        sock.sendall(frame('hello'))
+        self.assertEqual(self.recv_packet(sock), 'hello')
+        sock.close()
+        self.assertTrue(self.handler().disconnected.wait(5))
+
+    def test_call_periodically(self):
+        calls = []
+        done = threading.Event()
+
+        def job():
+            calls.append(None)
+            if len(calls) == 3:
+                done.set()
+
+        self.connect()
+        periodic = self.handler().server.call_periodically(0.01, job)
+        self.assertTrue(done.wait(5))
+        periodic.cancel()
+        threading.Event().wait(0.1)
+        count = len(calls)
+        threading.Event().wait(0.1)
+        self.assertEqual(len(calls), count)
+
+    def test_call_periodically_stops_on_error(self):
+        calls = []
+
+        def job():
+            calls.append(None)
+            raise ValueError()
+
+        self.connect()
+        self.handler().server.call_periodically(0.01, job)
+        threading.Event().wait(0.2)
+        self.assertEqual(len(calls), 1)
+
+    def test_call_later(self):
+        called = threading.Event()
+        cancelled = threading.Event()
+
+        self.connect()
+        listener = self.handler().server
+        listener.call_later(0.05, cancelled.set).cancel()
+        listener.call_later(0.05, called.set)
+        self.assertTrue(called.wait(5))
+        threading.Event().wait(0.1)
+        self.assertFalse(cancelled.is_set())
@@ -0,0 +1,503 @@
+import random
+
+from django.db import connection
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.test import TestCase
+from django.utils import timezone
+
+from judge.contest_format import AtCoderContestFormat, DefaultContestFormat, ECOOContestFormat, ICPCContestFormat, \
+    IOIContestFormat, LegacyIOIContestFormat, VNOJContestFormat
+from judge.contest_format.vnoj import ParticipationInfo
+from judge.models import ContestParticipation, ContestSubmission, Language, Submission, SubmissionTestCase
+from judge.models.tests.util import create_contest, create_contest_participation, create_contest_problem, \
+    create_problem, create_user
+from judge.timezone import from_database_time, to_database_time
+
+RANKING_SQL = """
+SELECT MAX(cs.points) as `points`, (
+    SELECT MIN(csub.date)
+        FROM judge_contestsubmission ccs LEFT OUTER JOIN
+                judge_submission csub ON (csub.id = ccs.submission_id)
+        WHERE ccs.problem_id = cp.id AND ccs.participation_id = %s AND ccs.points = MAX(cs.points)
+) AS `time`, cp.id AS `prob`
+FROM judge_contestproblem cp INNER JOIN
+        judge_contestsubmission cs ON (cs.problem_id = cp.id AND cs.participation_id = %s) LEFT OUTER JOIN
+        judge_submission sub ON (sub.id = cs.submission_id)
+GROUP BY cp.id
+"""
+
+FROZEN_RANKING_SQL = """
+SELECT MAX(cs.points) as `points`, (
+    SELECT MIN(csub.date)
+        FROM judge_contestsubmission ccs LEFT OUTER JOIN
+                judge_submission csub ON (csub.id = ccs.submission_id)
+        WHERE ccs.problem_id = cp.id AND ccs.participation_id = %s AND ccs.points = MAX(cs.points) AND csub.date < %s
+) AS `time`, cp.id AS `prob`
+FROM judge_contestproblem cp INNER JOIN
+        judge_contestsubmission cs ON (cs.problem_id = cp.id AND cs.participation_id = %s) LEFT OUTER JOIN
+        judge_submission sub ON (sub.id = cs.submission_id)
+WHERE sub.date < %s
+GROUP BY cp.id
+"""
+
+IOI_RANKING_SQL = """
+SELECT q.prob,
+       MIN(q.date) as `date`,
+       q.batch_points
+FROM (
+         SELECT cp.id          as `prob`,
+                sub.id         as `subid`,
+                sub.date       as `date`,
+                tc.points      as `points`,
+                tc.batch       as `batch`,
+                MIN(tc.points) as `batch_points`
+         FROM judge_contestproblem cp
+                  INNER JOIN
+              judge_contestsubmission cs
+              ON (cs.problem_id = cp.id AND cs.participation_id = %s)
+                  LEFT OUTER JOIN
+              judge_submission sub
+              ON (sub.id = cs.submission_id AND sub.status = 'D')
+                  INNER JOIN judge_submissiontestcase tc
+              ON sub.id = tc.submission_id
+         GROUP BY cp.id, tc.batch, sub.id
+     ) q
+         INNER JOIN (
+    SELECT prob, batch, MAX(r.batch_points) as max_batch_points
+    FROM (
+             SELECT cp.id          as `prob`,
+                    tc.batch       as `batch`,
+                    MIN(tc.points) as `batch_points`
+             FROM judge_contestproblem cp
+                      INNER JOIN
+                  judge_contestsubmission cs
+                  ON (cs.problem_id = cp.id AND cs.participation_id = %s)
+                      LEFT OUTER JOIN
+                  judge_submission sub
+                  ON (sub.id = cs.submission_id AND sub.status = 'D')
+                      INNER JOIN judge_submissiontestcase tc
+                  ON sub.id = tc.submission_id
+             GROUP BY cp.id, tc.batch, sub.id
+         ) r
+    GROUP BY prob, batch
+) p
+ON p.prob = q.prob AND (p.batch = q.batch OR p.batch is NULL AND q.batch is NULL)
+WHERE p.max_batch_points = q.batch_points
+GROUP BY q.prob, q.batch
+"""
+
+
+def penalized_submissions(participation, prob):
+    return participation.submissions.exclude(submission__result__isnull=True) \
+                                    .exclude(submission__result__in=['IE', 'CE']) \
+                                    .filter(problem_id=prob)
+
+
+def ranking_rows(participation):
+    with connection.cursor() as cursor:
+        cursor.execute(RANKING_SQL, (participation.id, participation.id))
+        return [(points, from_database_time(time), prob) for points, time, prob in cursor.fetchall()]
+
+
+class QueryDefaultContestFormat(DefaultContestFormat):
+    """The aggregate query implementation that the single pass version must agree with."""
+
+    def update_participation(self, participation):
+        cumtime = points = 0
+        format_data = {}
+
+        for result in participation.submissions.values('problem_id').annotate(
+                time=Max('submission__date'), points=Max('points'),
+        ):
+            dt = (result['time'] - participation.start).total_seconds()
+            if result['points']:
+                cumtime += dt
+            format_data[str(result['problem_id'])] = {'time': dt, 'points': result['points']}
+            points += result['points']
+
+        participation.cumtime = max(cumtime, 0)
+        participation.score = round(points, self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+        participation.save()
+
+
+class QueryECOOContestFormat(ECOOContestFormat):
+    """The aggregate query implementation that the single pass version must agree with."""
+
+    def update_participation(self, participation):
+        cumtime = score = 0
+        format_data = {}
+
+        submissions = participation.submissions.exclude(submission__result__in=('IE', 'CE'))
+        submission_counts = {
+            data['problem_id']: data['count'] for data in submissions.values('problem_id').annotate(count=Count('id'))
+        }
+        queryset = (
+            submissions.values('problem_id')
+            .filter(submission__date=Subquery(
+                submissions.filter(problem_id=OuterRef('problem_id'))
+                .order_by('-submission__date').values('submission__date')[:1],
+            ))
+            .annotate(points=Max('points'))
+            .values_list('problem_id', 'problem__points', 'points', 'submission__date')
+        )
+
+        for problem_id, problem_points, points, date in queryset:
+            dt = (date - participation.start).total_seconds()
+            bonus = 0
+            if points > 0:
+                if submission_counts.get(problem_id, 0) == 1 and points == problem_points:
+                    bonus += self.config['first_ac_bonus']
+                if self.config['time_bonus']:
+                    bonus += (participation.end_time - date).total_seconds() // 60 // self.config['time_bonus']
+            format_data[str(problem_id)] = {'time': dt, 'points': points, 'bonus': bonus}
+
+        for data in format_data.values():
+            if self.config['cumtime']:
+                cumtime += data['time']
+            score += data['points'] + data['bonus']
+
+        participation.cumtime = max(cumtime, 0)
+        participation.score = round(score, self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+        participation.save()
+
+
+class QueryLegacyIOIContestFormat(LegacyIOIContestFormat):
+    """The aggregate query implementation that the single pass version must agree with."""
+
+    def update_participation(self, participation):
+        cumtime = last_submission_time = score = 0
+        format_data = {}
+
+        queryset = (participation.submissions.values('problem_id')
+                                             .filter(points=Subquery(
+                                                 participation.submissions.filter(problem_id=OuterRef('problem_id'))
+                                                                          .order_by('-points').values('points')[:1]))
+                                             .annotate(time=Min('submission__date'))
+                                             .values_list('problem_id', 'time', 'points'))
+
+        for problem_id, time, points in queryset:
+            if points:
+                dt = (time - participation.start).total_seconds()
+                if self.config['last_score_altering']:
+                    last_submission_time = max(last_submission_time, dt)
+                if self.config['cumtime']:
+                    cumtime += dt
+            else:
+                dt = 0
+
+            format_data[str(problem_id)] = {'points': points, 'time': dt}
+            score += points
+
+        participation.cumtime = max(cumtime, 0) if self.config['cumtime'] else last_submission_time
+        participation.score = round(score, self.contest.points_precision)
+        participation.tiebreaker = last_submission_time
+        participation.format_data = format_data
+        participation.save()
+
+
+class QueryIOIContestFormat(IOIContestFormat):
+    """The aggregate query implementation that the single pass version must agree with."""
+
+    def update_participation(self, participation):
+        cumtime = score = 0
+        format_data = {}
+
+        with connection.cursor() as cursor:
+            cursor.execute(IOI_RANKING_SQL, (participation.id, participation.id))
+            for problem_id, time, subtask_points in cursor.fetchall():
+                problem_id = str(problem_id)
+                dt = (from_database_time(time) - participation.start).total_seconds() if self.config['cumtime'] else 0
+                if format_data.get(problem_id) is None:
+                    format_data[problem_id] = {'points': 0, 'time': 0}
+                format_data[problem_id]['points'] += subtask_points
+                format_data[problem_id]['time'] = max(dt, format_data[problem_id]['time'])
+
+        for problem_data in format_data.values():
+            if self.config['cumtime'] and problem_data['points']:
+                cumtime += problem_data['time']
+            score += problem_data['points']
+
+        participation.cumtime = max(cumtime, 0)
+        participation.score = round(score, self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+        participation.save()
+
+
+class QueryICPCContestFormat(ICPCContestFormat):
+    """The per-problem query implementation that the single pass version must agree with."""
+
+    def update_participation(self, participation):
+        cumtime = last = penalty = score = 0
+        frozen_cumtime = frozen_last = frozen_penalty = frozen_score = 0
+        frozen_time = participation.contest.frozen_time
+        format_data = {}
+
+        for points, time, prob in ranking_rows(participation):
+            dt_second = (time - participation.start).total_seconds()
+            dt = int(dt_second // 60)
+            is_frozen_sub = (participation.is_frozen and time >= frozen_time)
+
+            frozen_points = 0
+            frozen_tries = 0
+            if self.config['penalty']:
+                subs = penalized_submissions(participation, prob)
+                if points:
+                    tries = subs.filter(submission__date__lte=time).count()
+                    penalty += (tries - 1) * self.config['penalty']
+                    if not is_frozen_sub:
+                        frozen_penalty += (tries - 1) * self.config['penalty']
+                        frozen_tries = tries
+                    else:
+                        frozen_tries = subs.count()
+                else:
+                    tries = subs.count()
+                    frozen_tries = tries
+                    time = subs.aggregate(time=Max('submission__date'))['time']
+                    is_frozen_sub = (participation.is_frozen and time and time >= frozen_time)
+            else:
+                tries = 0
+
+            if points:
+                cumtime += dt
+                last = max(last, dt)
+                score += points
+
+                if not is_frozen_sub:
+                    frozen_points = points
+                    frozen_cumtime += dt
+                    frozen_last = max(frozen_last, dt)
+                    frozen_score += points
+
+            format_data[str(prob)] = {
+                'time': dt_second, 'points': points, 'frozen_points': frozen_points,
+                'tries': tries, 'frozen_tries': frozen_tries, 'is_frozen': is_frozen_sub,
+            }
+
+        participation.cumtime = max(cumtime + penalty, 0)
+        participation.score = round(score, self.contest.points_precision)
+        participation.tiebreaker = last
+        participation.frozen_cumtime = max(frozen_cumtime + frozen_penalty, 0)
+        participation.frozen_score = round(frozen_score, self.contest.points_precision)
+        participation.frozen_tiebreaker = frozen_last
+        participation.format_data = format_data
+        participation.save()
+
+
+class QueryAtCoderContestFormat(AtCoderContestFormat):
+    """The per-problem query implementation that the single pass version must agree with."""
+
+    def update_participation(self, participation):
+        cumtime = penalty = points = 0
+        format_data = {}
+
+        for score, time, prob in ranking_rows(participation):
+            dt = (time - participation.start).total_seconds()
+            if self.config['penalty']:
+                subs = penalized_submissions(participation, prob)
+                if score:
+                    prev = subs.filter(submission__date__lte=time).count() - 1
+                    penalty += prev * self.config['penalty'] * 60
+                else:
+                    prev = subs.count()
+            else:
+                prev = 0
+
+            if score:
+                cumtime = max(cumtime, dt)
+
+            format_data[str(prob)] = {'time': dt, 'points': score, 'penalty': prev}
+            points += score
+
+        participation.cumtime = max(cumtime + penalty, 0)
+        participation.score = round(points, self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+        participation.save()
+
+
+class QueryVNOJContestFormat(VNOJContestFormat):
+    """The per-problem query implementation that the single pass version must agree with."""
+
+    def calculate_participation_info(self, participation, problem_submissions, frozen=False):
+        cumtime = last = penalty = score = 0
+        format_data = {}
+        frozen_time = participation.contest.frozen_time
+
+        if not frozen:
+            rows = ranking_rows(participation)
+        else:
+            db_time = to_database_time(frozen_time)
+            with connection.cursor() as cursor:
+                cursor.execute(FROZEN_RANKING_SQL, (participation.id, db_time, participation.id, db_time))
+                rows = [(points, from_database_time(time), prob) for points, time, prob in cursor.fetchall()]
+
+        for points, time, prob in rows:
+            dt = (time - participation.start).total_seconds()
+            problem_subs = penalized_submissions(participation, prob)
+
+            if self.config['penalty']:
+                subs = problem_subs
+                if frozen:
+                    subs = subs.filter(submission__date__lt=frozen_time)
+
+                if points:
+                    prev = subs.filter(submission__date__lte=time).count() - 1
+                    penalty += prev * self.config['penalty'] * 60
+                else:
+                    prev = subs.count()
+            else:
+                prev = 0
+
+            if points:
+                cumtime += dt
+                last = max(last, dt)
+
+            format_data[str(prob)] = {'time': dt, 'points': points, 'penalty': prev}
+
+            if not frozen and participation.contest.frozen_last_minutes != 0:
+                format_data[str(prob)]['pending'] = problem_subs.filter(submission__date__gte=frozen_time).count()
+
+            score += points
+
+        return ParticipationInfo(
+            cumtime=max((last if self.config['LSO'] else cumtime) + penalty, 0),
+            score=round(score, self.contest.points_precision),
+            tiebreaker=last,
+            format_data=format_data,
+        )
+
+
+class ContestFormatParityTestCase(TestCase):
+    fixtures = ['language_all.json']
+
+    fields = ('score', 'cumtime', 'tiebreaker', 'frozen_score', 'frozen_cumtime', 'frozen_tiebreaker', 'format_data')
+    submission_results = ['AC', 'AC', 'WA', 'WA', 'TLE', 'CE', 'IE', None]
+
+    @classmethod
+    def setUpTestData(self):
+        self.language = Language.get_python3()
+        self.problems = [create_problem(code='format_parity_%d' % i) for i in range(4)]
+        self.users = [create_user(username='format_parity_%d' % i).profile for i in range(6)]
+
+    def create_contest(self, key, format_name, format_config, frozen):
+        now = timezone.now()
+        contest = create_contest(
+            key=key,
+            start_time=now - timezone.timedelta(hours=5),
+            # When frozen, the scoreboard has been frozen for 50 minutes.
+            end_time=now + timezone.timedelta(minutes=10 if frozen else 120),
+            frozen_last_minutes=60,
+            format_name=format_name,
+            format_config=format_config,
+        )
+        contest_problems = [
+            create_contest_problem(contest=contest, problem=problem, points=100, order=order)
+            for order, problem in enumerate(self.problems)
+        ]
+        return contest, contest_problems
+
+    def create_submissions(self, contest, contest_problems, rng):
+        participations = []
+        for user in self.users:
+            participation = create_contest_participation(contest=contest, user=user)
+            participations.append(participation)
+            # A handful of exact times, so that ties and the freeze boundary are exercised.
+            times = [contest.start_time + timezone.timedelta(minutes=rng.randrange(0, 300, 15)) for _ in range(4)]
+            times.append(contest.frozen_time)
+
+            for _ in range(rng.randrange(12)):
+                contest_problem = rng.choice(contest_problems)
+                result = rng.choice(self.submission_results)
+                points = rng.choice([0, 30, 100]) if result == 'AC' else 0
+                submission = Submission.objects.create(
+                    user=user, problem=contest_problem.problem, language=self.language,
+                    status='D', result=result, points=points,
+                )
+                Submission.objects.filter(id=submission.id).update(date=rng.choice(times))
+                # Test cases in batches, and unbatched, for the IOI format.
+                for case, batch in enumerate((None, None, 1, 1, 2)):
+                    SubmissionTestCase.objects.create(
+                        submission=submission, case=case, status=result or 'IE', batch=batch,
+                        points=rng.choice([0, 10, 10, None]), total=10,
+                    )
+                ContestSubmission.objects.create(
+                    submission=submission, problem=contest_problem, participation=participation, points=points,
+                )
+        return participations
+
+    def results(self, participation):
+        participation.refresh_from_db()
+        return {field: getattr(participation, field) for field in self.fields}
+
+    def score(self, format, participation):
+        format.update_participation(participation)
+        return self.results(participation)
+
+    def assertParity(self, format_class, query_format_class, format_name, configs):
+        rng = random.Random(format_name)
+        for frozen in (False, True):
+            for index, config in enumerate(configs):
+                contest, contest_problems = self.create_contest(
+                    '%s_%d_%d' % (format_name, frozen, index), format_name, config, frozen,
+                )
+                for participation in self.create_submissions(contest, contest_problems, rng):
+                    with self.subTest(frozen=frozen, config=config, user=participation.user.username):
+                        expected = self.score(query_format_class(contest, config), participation)
+                        self.assertEqual(self.score(format_class(contest, config), participation), expected)
+
+    def test_default(self):
+        self.assertParity(DefaultContestFormat, QueryDefaultContestFormat, 'default', [{}])
+
+    def test_ecoo(self):
+        self.assertParity(ECOOContestFormat, QueryECOOContestFormat, 'ecoo',
+                          [{}, {'cumtime': True, 'time_bonus': 0}])
+
+    def test_legacy_ioi(self):
+        self.assertParity(LegacyIOIContestFormat, QueryLegacyIOIContestFormat, 'ioi',
+                          [{}, {'cumtime': True, 'last_score_altering': True}])
+
+    def test_ioi(self):
+        self.assertParity(IOIContestFormat, QueryIOIContestFormat, 'ioi16', [{}, {'cumtime': True}])
+
+    def test_icpc(self):
+        self.assertParity(ICPCContestFormat, QueryICPCContestFormat, 'icpc', [{}, {'penalty': 0}])
+
+    def test_atcoder(self):
+        self.assertParity(AtCoderContestFormat, QueryAtCoderContestFormat, 'atcoder', [{}, {'penalty': 0}])
+
+    def test_vnoj(self):
+        self.assertParity(VNOJContestFormat, QueryVNOJContestFormat, 'vnoj',
+                          [{}, {'penalty': 0}, {'LSO': True}])
+
+    def test_queries(self):
+        contest, contest_problems = self.create_contest('icpc_queries', 'icpc', {}, True)
+        participation = self.create_submissions(contest, contest_problems, random.Random(1))[0]
+        # One query for the submissions, and one to save the participation.
+        with self.assertNumQueries(2):
+            ICPCContestFormat(contest, {}).update_participation(participation)
+
+    def test_contest_recompute_results(self):
+        rng = random.Random('recompute_results')
+        for format_name in ('default', 'ecoo', 'ioi', 'ioi16', 'icpc', 'atcoder', 'vnoj'):
+            with self.subTest(format=format_name):
+                contest, contest_problems = self.create_contest('recompute_%s' % format_name, format_name, {}, True)
+                participations = self.create_submissions(contest, contest_problems, rng)
+                participations[1].is_disqualified = True
+                participations[1].save(update_fields=['is_disqualified'])
+
+                expected = []
+                for participation in participations:
+                    participation.recompute_results()
+                    expected.append(self.results(participation))
+
+                ContestParticipation.objects.filter(contest=contest).update(
+                    score=0, cumtime=0, tiebreaker=0, frozen_score=0, frozen_cumtime=0, frozen_tiebreaker=0,
+                    format_data=None,
+                )
+                self.assertEqual(contest.recompute_results(batch_size=4), len(participations))
+                self.assertEqual([self.results(participation) for participation in participations], expected)
@@ -0,0 +1,77 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from judge.event_poster_async import AsyncEventPoster
+
+
+class AsyncEventPosterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+        self.sent = threading.Event()
+
+    def post_batch(self, messages):
+        self.batches.append(messages)
+        self.sent.set()
+
+    def test_coalesced(self):
+        poster = AsyncEventPoster(self.post_batch, delay=60, max_pending=10)
+        poster.start()
+        try:
+            for _ in range(50):
+                poster.post('sub_1', {'type': 'test-case'})
+            poster.post('sub_2', {'type': 'test-case'})
+            poster.post('sub_1', {'type': 'grading-end'})
+            poster.post('submissions', {'type': 'update-submission', 'id': 1})
+
+            metrics = poster.metrics()
+            self.assertEqual(metrics['pending'], 4)
+            self.assertEqual(metrics['posted'], 53)
+            self.assertEqual(metrics['coalesced'], 49)
+            self.assertEqual(self.batches, [])
+        finally:
+            poster.stop()
+
+        # Stopping sends everything that is still pending, in the order it was posted.
+        self.assertEqual(self.batches, [[
+            ('sub_1', {'type': 'test-case'}),
+            ('sub_2', {'type': 'test-case'}),
+            ('sub_1', {'type': 'grading-end'}),
+            ('submissions', {'type': 'update-submission', 'id': 1}),
+        ]])
+        self.assertEqual(poster.metrics()['sent'], 4)
+
+    def test_delayed(self):
+        poster = AsyncEventPoster(self.post_batch, delay=0.01, max_pending=10)
+        poster.start()
+        try:
+            poster.post('sub_1', {'type': 'test-case'})
+            self.assertTrue(self.sent.wait(5))
+        finally:
+            poster.stop()
+        self.assertEqual(self.batches, [[('sub_1', {'type': 'test-case'})]])
+
+    def test_dropped(self):
+        poster = AsyncEventPoster(self.post_batch, delay=60, max_pending=2, max_batch=1)
+        poster.start()
+        try:
+            for id in range(3):
+                poster.post('sub_%d' % id, {'type': 'test-case'})
+            self.assertEqual(poster.metrics()['dropped'], 1)
+        finally:
+            poster.stop()
+        self.assertEqual(self.batches, [[('sub_0', {'type': 'test-case'})], [('sub_1', {'type': 'test-case'})]])
+
+    def test_synchronous_after_stop(self):
+        poster = AsyncEventPoster(self.post_batch, delay=60, max_pending=10)
+        poster.post('sub_1', {'type': 'test-case'})
+        self.assertEqual(self.batches, [[('sub_1', {'type': 'test-case'})]])
+
+    def test_failure(self):
+        def post_batch(messages):
+            raise ConnectionError()
+
+        poster = AsyncEventPoster(post_batch, delay=60, max_pending=10)
+        with self.assertLogs('judge.event_poster', 'ERROR'):
+            poster.post('sub_1', {'type': 'test-case'})
+        self.assertEqual(poster.metrics()['failed'], 1)
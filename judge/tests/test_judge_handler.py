@@ -0,0 +1,167 @@
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from django.test import TestCase, override_settings
+
+from judge.bridge.judge_handler import GradingResult, JudgeHandler, ORGANIZATION_CACHE_TIME
+from judge.judgeapi import batch_rejudge_submissions
+from judge.models import Language, Problem, Submission, SubmissionSource, UserProblemScore
+from judge.models.tests.util import create_organization, create_problem, create_user
+
+
+def test_case_packet(id, position, status=0, points=1, time=0.1):
+    return {
+        'name': 'test-case-status',
+        'submission-id': id,
+        'cases': [{
+            'position': position, 'status': status, 'time': time, 'memory': 1024 * position,
+            'points': points, 'total-points': 1, 'output': '',
+        }],
+    }
+
+
+@override_settings(BRIDGED_JUDGE_TEST_CASE_BUFFER_SIZE=10, BRIDGED_JUDGE_TEST_CASE_FLUSH_INTERVAL=3600)
+class JudgeHandlerTestCaseBufferTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.problem = create_problem(code='test_case_buffer', points=10)
+        self.profile = create_user(username='test_case_buffer').profile
+
+    def setUp(self):
+        self.submission = Submission.objects.create(
+            user=self.profile, problem=self.problem, language=Language.get_python3(), status='P',
+        )
+        server = SimpleNamespace(asynchronous=True, server_address=None)
+        self.handler = JudgeHandler(Mock(), ('127.0.0.1', 0), server, Mock())
+        self.handler.on_grading_begin({'submission-id': self.submission.id, 'pretested': False})
+
+    def send_test_cases(self, positions):
+        for position in positions:
+            self.handler.on_test_case(test_case_packet(self.submission.id, position))
+
+    def test_test_cases_are_buffered(self):
+        self.send_test_cases(range(1, 10))
+        self.assertEqual(self.submission.test_cases.count(), 0)
+
+        self.send_test_cases([10])
+        self.assertEqual(self.submission.test_cases.count(), 10)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.current_testcase, 11)
+
+    def test_grading_end_flushes_test_cases(self):
+        self.send_test_cases(range(1, 16))
+        self.handler.on_grading_end({'submission-id': self.submission.id})
+
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.test_cases.count(), 15)
+        self.assertEqual(self.submission.result, 'AC')
+        self.assertEqual(self.submission.case_points, 15)
+
+    def test_disconnect_flushes_test_cases(self):
+        self.send_test_cases(range(1, 6))
+        self.handler._test_case_flush_job = Mock()
+        self.handler.on_disconnect()
+        self.assertEqual(self.submission.test_cases.count(), 5)
+        self.handler._test_case_flush_job.cancel.assert_called_once()
+
+    def test_stale_test_cases_are_flushed(self):
+        self.send_test_cases(range(1, 4))
+        self.handler._flush_stale_test_cases()
+        self.assertEqual(self.submission.test_cases.count(), 0)
+
+        # Without waiting for the next test case to arrive.
+        with override_settings(BRIDGED_JUDGE_TEST_CASE_FLUSH_INTERVAL=0):
+            self.handler._flush_stale_test_cases()
+        self.assertEqual(self.submission.test_cases.count(), 3)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.current_testcase, 4)
+
+        self.send_test_cases([4])
+        self.handler.on_grading_end({'submission-id': self.submission.id})
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.test_cases.count(), 4)
+        self.assertEqual(self.submission.case_points, 4)
+
+    def test_grading_result_matches_database(self):
+        id = self.submission.id
+        self.handler.on_test_case(test_case_packet(id, 1, time=0.5))
+        self.handler.on_batch_begin({'submission-id': id})
+        self.handler.on_test_case(test_case_packet(id, 2))
+        self.handler.on_test_case(test_case_packet(id, 3, status=1, points=0))
+        self.handler.on_batch_end({'submission-id': id})
+        self.handler.on_batch_begin({'submission-id': id})
+        self.handler.on_test_case(test_case_packet(id, 4, status=4, points=0, time=1.5))
+        self.handler.on_batch_end({'submission-id': id})
+        self.handler.on_test_case(test_case_packet(id, 5))
+        self.handler.on_grading_end({'submission-id': id})
+
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.result, 'TLE')
+        self.assertEqual(self.submission.case_points, 2)
+        self.assertEqual(self.submission.case_total, 4)
+        self.assertEqual(self.submission.time, 1.5)
+        self.assertEqual(self.submission.memory, 1024 * 5)
+
+        result = GradingResult.from_database(id)
+        self.assertEqual(result.result, 'TLE')
+        self.assertEqual(result.case_points, 2)
+        self.assertEqual(result.case_total, 4)
+        self.assertEqual(result.time, 1.5)
+        self.assertAlmostEqual(result.total_time, 2.3)
+        self.assertEqual(result.memory, 1024 * 5)
+
+    def test_problem_stats(self):
+        self.send_test_cases(range(1, 3))
+        self.handler.on_grading_end({'submission-id': self.submission.id})
+
+        self.problem.refresh_from_db()
+        self.assertEqual((self.problem.submission_count, self.problem.ac_count, self.problem.user_count), (1, 1, 1))
+        self.assertEqual(self.problem.ac_rate, 100)
+        self.assertFalse(self.problem.update_stats())
+
+        self.submission.refresh_from_db()
+        self.submission.delete()
+        self.problem.refresh_from_db()
+        self.assertEqual((self.problem.submission_count, self.problem.ac_count, self.problem.user_count), (0, 0, 0))
+        self.assertEqual(self.problem.ac_rate, 0)
+        self.assertFalse(self.problem.update_stats())
+
+    def test_rejudge_ending_without_grading(self):
+        Problem.objects.filter(id=self.problem.id).update(is_public=True)
+        SubmissionSource.objects.create(submission=self.submission, source='')
+        id = self.submission.id
+        for name, packet in (('compile-error', {'log': ''}), ('internal-error', {'message': ''}),
+                             ('submission-terminated', {})):
+            with self.subTest(name):
+                self.handler.post_grading = Mock()
+                self.handler.on_grading_begin({'submission-id': id, 'pretested': False})
+                self.send_test_cases(range(1, 3))
+                self.handler.on_grading_end({'submission-id': id})
+                self.assertEqual(UserProblemScore.objects.filter(user=self.profile, problem=self.problem).count(), 1)
+
+                with patch('judge.judgeapi.judge_request_batch',
+                           side_effect=lambda packets: [{'name': 'submission-received', 'submission-id': id}]):
+                    batch_rejudge_submissions([id])
+                self.handler.post_grading = Mock()
+                with self.assertLogs('judge.bridge'):
+                    self.handler.handlers[name](dict(packet, **{'submission-id': id}))
+
+                # Aborted submissions get zero points, the others none.
+                self.assertFalse(UserProblemScore.objects.filter(user=self.profile, problem=self.problem,
+                                                                 points__gt=0).exists())
+                self.problem.refresh_from_db()
+                self.assertEqual((self.problem.ac_count, self.problem.user_count), (0, 0))
+                self.handler.post_grading.update_user.assert_called_once_with(self.profile.id)
+
+    def test_organizations_are_cached(self):
+        organization = create_organization(name='test_case_buffer_org')
+        self.profile.organizations.add(organization)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.handler._get_user_organizations(self.profile.id), [organization.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.handler._get_user_organizations(self.profile.id), [organization.id])
+
+        self.profile.organizations.remove(organization)
+        self.handler._organization_cache_time -= ORGANIZATION_CACHE_TIME + 1
+        with self.assertNumQueries(1):
+            self.assertEqual(self.handler._get_user_organizations(self.profile.id), [])
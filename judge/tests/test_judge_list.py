@@ -2,7 +2,7 @@ from django.test import SimpleTestCase
 
 from judge.bridge.judge_handler import SubmissionUnavailable
 from judge.bridge.judge_list import JudgeList
-from judge.judge_priority import DEFAULT_PRIORITY
+from judge.judge_priority import CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY
 
 
 class MockJudge:
@@ -83,3 +83,64 @@ class JudgeListVanishedSubmissionTestCase(SimpleTestCase):
         self.assertEqual(judge.submissions, [1, 3])
         self.assertEqual(self.judges.submission_map[3], judge)
         self.assertIn(judge, self.judges.judges)
+
+
+class JudgeListQueueOrderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.judges = JudgeList()
+        self.busy = MockJudge('busy')
+        self.busy.problems = {'problem', 'other'}
+        self.judges.register(self.busy)
+        self.submit(1, 'problem', DEFAULT_PRIORITY)
+
+    def submit(self, id, problem, priority, judge_id=None, banned_judges=()):
+        self.judges.judge(id, problem, 'lang', 'source', judge_id, priority, list(banned_judges))
+
+    def test_higher_priority_is_dispatched_first(self):
+        self.submit(2, 'problem', DEFAULT_PRIORITY)
+        self.submit(3, 'other', CONTEST_SUBMISSION_PRIORITY)
+        self.submit(4, 'problem', DEFAULT_PRIORITY)
+
+        self.judges.on_judge_free(self.busy, 1)
+        self.judges.on_judge_free(self.busy, 3)
+        self.judges.on_judge_free(self.busy, 2)
+        self.assertEqual(self.busy.submissions, [1, 3, 2, 4])
+
+    def test_submissions_are_dispatched_in_queue_order_across_problems(self):
+        self.submit(2, 'other', DEFAULT_PRIORITY)
+        self.submit(3, 'problem', DEFAULT_PRIORITY)
+        self.submit(4, 'other', DEFAULT_PRIORITY)
+
+        self.judges.on_judge_free(self.busy, 1)
+        self.judges.on_judge_free(self.busy, 2)
+        self.judges.on_judge_free(self.busy, 3)
+        self.assertEqual(self.busy.submissions, [1, 2, 3, 4])
+
+    def test_banned_and_pinned_submissions_are_skipped(self):
+        self.submit(2, 'problem', DEFAULT_PRIORITY, banned_judges=['busy'])
+        self.submit(3, 'problem', DEFAULT_PRIORITY, judge_id='other')
+        self.submit(4, 'problem', DEFAULT_PRIORITY)
+
+        self.judges.on_judge_free(self.busy, 1)
+        self.assertEqual(self.busy.submissions, [1, 4])
+        self.assertEqual(sorted(self.judges.node_map), [2, 3])
+
+    def test_aborted_submission_is_removed_from_queue(self):
+        self.submit(2, 'problem', DEFAULT_PRIORITY)
+        self.submit(3, 'problem', DEFAULT_PRIORITY)
+
+        self.assertFalse(self.judges.abort(2))
+        self.judges.on_judge_free(self.busy, 1)
+        self.assertEqual(self.busy.submissions, [1, 3])
+        self.assertEqual(self.judges.node_map, {})
+
+    def test_unsupported_problems_are_not_looked_at(self):
+        self.submit(2, 'unsupported', DEFAULT_PRIORITY)
+        self.submit(3, 'problem', DEFAULT_PRIORITY)
+
+        checked = []
+        can_judge = self.busy.can_judge
+        self.busy.can_judge = lambda problem, *args: checked.append(problem) or can_judge(problem, *args)
+        self.judges.on_judge_free(self.busy, 1)
+        self.assertEqual(self.busy.submissions, [1, 3])
+        self.assertNotIn('unsupported', checked)
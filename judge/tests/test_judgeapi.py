@@ -0,0 +1,206 @@
+import base64
+import os
+import socket
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from judge import judgeapi
+from judge.judgeapi import BridgeConnection, BridgeUnavailable, _encode_packet, _read_packet
+
+
+class StubBridge:
+    """Listens on a loopback port, and hands every connection to `handle(bridge, sock, index)` in its own thread."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.address = self.listener.getsockname()
+        self.connections = []
+        threading.Thread(target=self._accept_forever, daemon=True).start()
+
+    def _accept_forever(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            index = len(self.connections)
+            self.connections.append(sock)
+            threading.Thread(target=self.handle, args=(self, sock, index), daemon=True).start()
+
+    def read(self, sock):
+        return _read_packet(sock.makefile('rb', 0))
+
+    def reply(self, sock, packet, response):
+        sock.sendall(_encode_packet({'request-id': packet.get('request-id'), 'response': response}))
+
+    def close(self):
+        self.listener.close()
+        for sock in self.connections:
+            sock.close()
+
+
+class BridgeConnectionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.bridge = None
+        self.connection = None
+
+    def tearDown(self):
+        if self.connection is not None:
+            self.connection.close()
+        if self.bridge is not None:
+            self.bridge.close()
+
+    def connect(self, handle):
+        self.bridge = StubBridge(handle)
+        self.connection = BridgeConnection(self.bridge.address)
+        return self.connection
+
+    def test_multiplexing(self):
+        def handle(bridge, sock, index):
+            first = bridge.read(sock)
+            second = bridge.read(sock)
+            # Answer out of order, each request must still get its own response.
+            bridge.reply(sock, second, second['value'])
+            bridge.reply(sock, first, first['value'])
+
+        connection = self.connect(handle)
+        results = {}
+
+        def request(value):
+            results[value] = connection.request({'name': 'echo', 'value': value})
+
+        threads = [threading.Thread(target=request, args=(value,)) for value in ('first', 'second')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, {'first': 'first', 'second': 'second'})
+        self.assertFalse(connection.closed)
+
+    def test_request_without_reply(self):
+        received = []
+        done = threading.Event()
+
+        def handle(bridge, sock, index):
+            received.append(bridge.read(sock))
+            done.set()
+
+        self.assertIsNone(self.connect(handle).request({'name': 'ping'}, reply=False))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received[0]['name'], 'ping')
+
+    def test_reply_timeout(self):
+        def handle(bridge, sock, index):
+            bridge.read(sock)
+
+        connection = self.connect(handle)
+        with mock.patch.object(BridgeConnection, 'reply_timeout', 0.2):
+            with self.assertRaises(BridgeUnavailable):
+                connection.request({'name': 'ping'})
+        self.assertTrue(connection.closed)
+        with self.assertRaises(BridgeUnavailable):
+            connection.request({'name': 'ping'})
+
+    def test_closed_before_reply(self):
+        def handle(bridge, sock, index):
+            bridge.read(sock)
+            sock.shutdown(socket.SHUT_RDWR)
+
+        connection = self.connect(handle)
+        with self.assertRaises(BridgeUnavailable):
+            connection.request({'name': 'ping'})
+        self.assertTrue(connection.closed)
+
+    def test_idle_connection_stays_open(self):
+        def handle(bridge, sock, index):
+            while True:
+                packet = bridge.read(sock)
+                if packet is None:
+                    return
+                bridge.reply(sock, packet, 'pong')
+
+        with mock.patch.object(BridgeConnection, 'send_timeout', 0.1):
+            connection = self.connect(handle)
+            # Reads outlast the send timeout.
+            time.sleep(0.3)
+            self.assertEqual(connection.request({'name': 'ping'}), 'pong')
+        self.assertFalse(connection.closed)
+
+    def test_send_timeout(self):
+        stalled = threading.Event()
+
+        def handle(bridge, sock, index):
+            # Never read anything, as if the bridge were stuck.
+            stalled.wait(10)
+
+        with mock.patch.object(BridgeConnection, 'send_timeout', 0.5):
+            connection = self.connect(handle)
+            connection.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+            # Incompressible, and far more than the socket buffers hold.
+            source = base64.b64encode(os.urandom(8 * 1024 * 1024)).decode('ascii')
+            start = time.monotonic()
+            try:
+                with self.assertRaises(BridgeUnavailable):
+                    connection.request({'name': 'submission-request', 'source': source})
+            finally:
+                stalled.set()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(connection.closed)
+
+
+@override_settings(BRIDGED_DJANGO_PERSISTENT_CONNECTION=True)
+class JudgeRequestTestCase(SimpleTestCase):
+    def setUp(self):
+        judgeapi.close_bridge_connection()
+        self.bridge = None
+
+    def tearDown(self):
+        judgeapi.close_bridge_connection()
+        if self.bridge is not None:
+            self.bridge.close()
+
+    def request(self, handle, packet):
+        self.bridge = StubBridge(handle)
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.bridge.address):
+            return judgeapi.judge_request(packet)
+
+    def test_persistent_connection_is_reused(self):
+        def handle(bridge, sock, index):
+            while True:
+                packet = bridge.read(sock)
+                if packet is None:
+                    return
+                bridge.reply(sock, packet, {'name': 'pong', 'connection': index})
+
+        self.assertEqual(self.request(handle, {'name': 'ping'}), {'name': 'pong', 'connection': 0})
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.bridge.address):
+            self.assertEqual(judgeapi.judge_request({'name': 'ping'}), {'name': 'pong', 'connection': 0})
+        self.assertEqual(len(self.bridge.connections), 1)
+
+    def test_one_shot_fallback(self):
+        def handle(bridge, sock, index):
+            packet = bridge.read(sock)
+            if index == 0:
+                # The persistent connection dies without answering, e.g. the bridge restarted.
+                sock.shutdown(socket.SHUT_RDWR)
+                return
+            # One-shot requests carry no request ID, and get the bare response.
+            self.assertNotIn('request-id', packet)
+            sock.sendall(_encode_packet({'name': 'pong'}))
+
+        with self.assertLogs('judge.judgeapi', 'WARNING'):
+            self.assertEqual(self.request(handle, {'name': 'ping'}), {'name': 'pong'})
+        self.assertEqual(len(self.bridge.connections), 2)
+
+    def test_one_shot_fallback_when_bridge_unreachable(self):
+        def handle(bridge, sock, index):
+            bridge.read(sock)
+            sock.sendall(_encode_packet({'name': 'pong'}))
+
+        with mock.patch.object(BridgeConnection, '__init__', side_effect=ConnectionRefusedError()), \
+                self.assertLogs('judge.judgeapi', 'WARNING'):
+            self.assertEqual(self.request(handle, {'name': 'ping'}), {'name': 'pong'})
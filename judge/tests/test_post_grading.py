@@ -0,0 +1,57 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from judge.bridge.post_grading import PostGradingPipeline
+
+
+class PostGradingPipelineTestCase(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.done = threading.Event()
+
+    def record(self, *args):
+        self.calls.append(args)
+
+    def test_synchronous(self):
+        pipeline = PostGradingPipeline()
+        pipeline.schedule(('problem', 1), self.record, 1)
+        pipeline.schedule(('problem', 1), self.record, 1)
+        self.assertEqual(self.calls, [(1,), (1,)])
+        self.assertEqual(pipeline.metrics()['completed'], 2)
+
+    def test_coalesced(self):
+        pipeline = PostGradingPipeline(delay=60)
+        pipeline.start()
+        try:
+            for _ in range(50):
+                pipeline.schedule(('problem', 1), self.record, 1)
+            pipeline.schedule(('problem', 2), self.record, 2)
+            pipeline.schedule(('user', 1), self.record, 'user')
+
+            metrics = pipeline.metrics()
+            self.assertEqual(metrics['pending'], 3)
+            self.assertEqual(metrics['scheduled'], 52)
+            self.assertEqual(metrics['coalesced'], 49)
+            self.assertEqual(self.calls, [])
+        finally:
+            pipeline.stop()
+
+        # Stopping runs everything that is still pending, in the order it was scheduled.
+        self.assertEqual(self.calls, [(1,), (2,), ('user',)])
+        self.assertEqual(pipeline.metrics()['pending'], 0)
+
+    def test_delayed(self):
+        pipeline = PostGradingPipeline(delay=0.01)
+        pipeline.start()
+        try:
+            pipeline.schedule(('problem', 1), self.done.set)
+            self.assertTrue(self.done.wait(5))
+        finally:
+            pipeline.stop()
+
+    def test_failure(self):
+        pipeline = PostGradingPipeline()
+        with self.assertLogs('judge.bridge', 'ERROR'):
+            pipeline.schedule(('problem', 1), int, 'invalid')
+        self.assertEqual(pipeline.metrics()['failed'], 1)
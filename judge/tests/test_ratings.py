@@ -0,0 +1,212 @@
+import random
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from judge import ratings
+from judge.models import Profile, Rating
+from judge.models.tests.util import create_contest, create_contest_participation, create_user
+from judge.ratings import MEAN_INIT, get_history_limit, preview_contest_ratings, recalculate_ratings, \
+    recalculate_ratings_python, tie_ranker
+
+
+@skipIf(ratings.np is None, 'NumPy is not installed')
+@override_settings(VNOJ_RATING_NUMPY=True)
+class NumpyRatingsTestCase(SimpleTestCase):
+    def generate(self, n, scores):
+        rng = random.Random(n)
+        users = []
+        for _ in range(n):
+            times = rng.choice((0, 0, 1, 2, 5, 10, 20))
+            users.append((rng.randrange(scores), 1500. if not times else rng.gauss(1500, 300), times,
+                          [rng.gauss(1500, 400) for _ in range(times)]))
+        users.sort(key=lambda user: -user[0])
+        ranking = list(tie_ranker(users, key=lambda user: user[0]))
+        return ranking, [user[1] for user in users], [user[2] for user in users], [user[3] for user in users]
+
+    def assertSameRatings(self, inputs):
+        expected_rating, expected_mean, expected_performance = recalculate_ratings_python(*inputs)
+        rating, mean, performance = recalculate_ratings(*inputs)
+        self.assertEqual(rating, expected_rating)
+        for value, expected in zip(mean + performance, expected_mean + expected_performance):
+            self.assertAlmostEqual(value, expected, delta=0.01)
+
+    def test_distinct_ranks(self):
+        for n in (2, 3, 10, 200):
+            with self.subTest(n=n):
+                self.assertSameRatings(self.generate(n, scores=10 ** 9))
+
+    def test_ties(self):
+        for n, scores in ((2, 1), (10, 1), (200, 7)):
+            with self.subTest(n=n, scores=scores):
+                self.assertSameRatings(self.generate(n, scores))
+
+
+class HistoryLimitTestCase(SimpleTestCase):
+    def test_history_limit(self):
+        self.assertIsNone(get_history_limit(0))
+        self.assertEqual(get_history_limit(0.9), 0)
+        self.assertEqual(get_history_limit(0.8), 1)
+        self.assertEqual(get_history_limit(1e-3), 23)
+
+    def test_rating_changes(self):
+        rng = random.Random(0)
+        n = 200
+        times_ranked = [rng.randrange(100) for _ in range(n)]
+        inputs = (
+            list(range(1, n + 1)),
+            [rng.gauss(1600, 300) if times else MEAN_INIT for times in times_ranked],
+            times_ranked,
+            [[rng.gauss(1600, 500) for _ in range(times)] for times in times_ranked],
+        )
+        with self.settings(VNOJ_RATING_HISTORY_MIN_WEIGHT=0):
+            expected_rating, expected_mean, _ = recalculate_ratings(*inputs)
+        with self.settings(VNOJ_RATING_HISTORY_MIN_WEIGHT=1e-3):
+            rating, mean, _ = recalculate_ratings(*inputs)
+        for value, expected in zip(rating, expected_rating):
+            self.assertAlmostEqual(value, expected, delta=1)
+        for value, expected in zip(mean, expected_mean):
+            self.assertAlmostEqual(value, expected, delta=0.5)
+
+
+class RateContestsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        now = timezone.now()
+        self.users = {name: create_user(username='rating_%s' % name).profile for name in ('a', 'b', 'c')}
+        self.contests = []
+        for days, scores in ((3, {'a': 300, 'b': 200, 'c': 100}), (2, {'a': 100, 'b': 200}), (1, {'b': 100, 'c': 200})):
+            contest = create_contest(
+                key='rating_%d' % days,
+                start_time=now - timezone.timedelta(days=days, hours=2),
+                end_time=now - timezone.timedelta(days=days),
+                is_rated=True,
+                rate_all=True,
+            )
+            for name, score in scores.items():
+                create_contest_participation(contest=contest, user=self.users[name], score=score)
+            self.contests.append(contest)
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_ratings(self, standings):
+        history = {}
+        expected = []
+        for standing in standings:
+            ranking = list(tie_ranker(standing, key=lambda user: -user[1]))
+            users = [name for name, score in standing]
+            rating, mean, performance = recalculate_ratings(
+                ranking,
+                [history[name][-1][1] if name in history else MEAN_INIT for name in users],
+                [len(history.get(name, ())) for name in users],
+                [[p for r, m, p in reversed(history.get(name, ()))] for name in users],
+            )
+            for name, r, m, p in zip(users, rating, mean, performance):
+                history.setdefault(name, []).append((r, m, p))
+                expected.append((name, r))
+        return expected, {name: h[-1][0] for name, h in history.items()}
+
+    def assertRatings(self, standings):
+        expected, profile_ratings = self.expected_ratings(standings)
+        self.assertEqual(
+            [(rating.user.user.username[len('rating_'):], rating.rating)
+             for rating in Rating.objects.order_by('contest__end_time', 'rank')],
+            expected,
+        )
+        for name, profile in self.users.items():
+            self.assertEqual(Profile.objects.get(id=profile.id).rating, profile_ratings.get(name))
+
+    def test_rate(self):
+        self.contests[0].rate()
+        self.assertRatings([
+            [('a', 300), ('b', 200), ('c', 100)],
+            [('b', 200), ('a', 100)],
+            [('c', 200), ('b', 100)],
+        ])
+
+    @override_settings(VNOJ_RATING_HISTORY_MIN_WEIGHT=0.8)
+    def test_rate_with_history_limit(self):
+        self.contests[0].rate()
+        self.assertRatings([
+            [('a', 300), ('b', 200), ('c', 100)],
+            [('b', 200), ('a', 100)],
+            [('c', 200), ('b', 100)],
+        ])
+
+        # Only the latest performance is loaded, but b has been rated twice before.
+        contest = self.contests[2]
+        contest.rate_exclude.set([self.users['c']])
+        contest.rate()
+        self.assertRatings([
+            [('a', 300), ('b', 200), ('c', 100)],
+            [('b', 200), ('a', 100)],
+            [('b', 100)],
+        ])
+
+    def test_rerate(self):
+        self.contests[0].rate()
+        contest = self.contests[1]
+        contest.rate_exclude.set([self.users['b']])
+        contest.rate()
+        self.assertRatings([
+            [('a', 300), ('b', 200), ('c', 100)],
+            [('a', 100)],
+            [('c', 200), ('b', 100)],
+        ])
+
+        self.contests[2].is_rated = False
+        self.contests[2].save()
+        contest.rate()
+        # The ratings of the contest that is no longer rated are removed from the profiles.
+        self.assertRatings([
+            [('a', 300), ('b', 200), ('c', 100)],
+            [('a', 100)],
+        ])
+
+    def preview(self, contest, rate_exclude=None):
+        return [(participation['user_id'], rank, old_rating, rating)
+                for participation, rank, old_rating, rating, mean, performance
+                in preview_contest_ratings(contest, rate_exclude)]
+
+    def test_preview(self):
+        self.contests[0].rate()
+        contest = self.contests[1]
+        ratings = contest.ratings.order_by('rank').values_list('user_id', 'rank', 'rating')
+        old_ratings = dict(self.contests[0].ratings.values_list('user_id', 'rating'))
+
+        self.assertEqual(self.preview(contest), [
+            (user_id, rank, old_ratings[user_id], rating) for user_id, rank, rating in ratings
+        ])
+        self.assertEqual(Rating.objects.count(), 7)
+
+        # The standings and histories are cached, so only who is rated is looked up again.
+        a, b = self.users['a'].id, self.users['b'].id
+        with self.assertNumQueries(0):
+            preview = self.preview(contest, rate_exclude=[b])
+        self.assertEqual([(user_id, rank) for user_id, rank, old_rating, rating in preview], [(a, 1)])
+
+        contest.rating_ceiling = old_ratings[a] - 1
+        with self.assertNumQueries(1):
+            preview = self.preview(contest)
+        self.assertEqual([(user_id, rank) for user_id, rank, old_rating, rating in preview], [(b, 1)])
+
+    def test_preview_invalidation(self):
+        contest = self.contests[1]
+        self.assertEqual([old_rating for user_id, rank, old_rating, rating in self.preview(contest)], [None, None])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.contests[0].rate()
+        old_ratings = self.contests[0].ratings.filter(user__in=contest.users.values('user'))
+        self.assertEqual(
+            sorted(old_rating for user_id, rank, old_rating, rating in self.preview(contest)),
+            sorted(old_ratings.values_list('rating', flat=True)),
+        )
+
+        participation = contest.users.get(user=self.users['a'])
+        participation.score = 300
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+        self.assertEqual([user_id for user_id, *_ in self.preview(contest)], [self.users['a'].id, self.users['b'].id])
@@ -0,0 +1,210 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from judge.models import ContestParticipation
+from judge.models.tests.util import create_contest, create_contest_participation, create_contest_problem, \
+    create_user
+from judge.scoreboard import SCOREBOARD_LOCK_KEY, SCOREBOARD_ROW_KEY, get_scoreboard
+
+
+class MaterializedScoreboardTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        now = timezone.now()
+        self.contest = create_contest(
+            key='scoreboard',
+            start_time=now - timezone.timedelta(hours=2),
+            end_time=now + timezone.timedelta(hours=1),
+        )
+        create_contest_problem(contest=self.contest, problem='scoreboard_problem', points=100, order=1)
+
+        self.participations = {}
+        for name, score, frozen_score, cumtime, virtual, is_disqualified in (
+            ('first', 300, 100, 50, ContestParticipation.LIVE, False),
+            ('second', 200, 200, 40, ContestParticipation.LIVE, False),
+            ('tied', 200, 200, 40, ContestParticipation.LIVE, False),
+            ('virtual', 250, 250, 10, 1, False),
+            ('disqualified', 400, 400, 0, ContestParticipation.LIVE, True),
+            ('spectator', 500, 500, 0, ContestParticipation.SPECTATE, False),
+        ):
+            self.participations[name] = create_contest_participation(
+                contest=self.contest,
+                user=create_user(username='scoreboard_%s' % name).profile,
+                virtual=virtual,
+                score=score,
+                frozen_score=frozen_score,
+                cumtime=cumtime,
+                frozen_cumtime=cumtime,
+                is_disqualified=is_disqualified,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def ranking(self, frozen=False, show_virtual=False):
+        return [(p['user']['username'][len('scoreboard_'):], p['rank'])
+                for p in get_scoreboard(self.contest).participations(frozen, show_virtual)]
+
+    def test_ranking(self):
+        self.assertEqual(self.ranking(), [('first', 1), ('second', 2), ('tied', 2), ('disqualified', 4)])
+        self.assertEqual(self.ranking(frozen=True), [('second', 1), ('tied', 1), ('first', 3), ('disqualified', 4)])
+        self.assertEqual(
+            self.ranking(show_virtual=True),
+            [('first', 1), ('virtual', 2), ('second', 3), ('tied', 3), ('disqualified', 5)],
+        )
+
+    def test_ranks_are_not_cached(self):
+        self.ranking(show_virtual=True)
+        self.assertEqual(self.ranking(), [('first', 1), ('second', 2), ('tied', 2), ('disqualified', 4)])
+
+    def test_update(self):
+        version = get_scoreboard(self.contest).version
+        participation = self.participations['tied']
+        participation.score = 350
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+
+        scoreboard = get_scoreboard(self.contest)
+        self.assertGreater(scoreboard.version, version)
+        self.assertEqual(self.ranking(), [('tied', 1), ('first', 2), ('second', 3), ('disqualified', 4)])
+        self.assertEqual(self.ranking(frozen=True), [('second', 1), ('tied', 1), ('first', 3), ('disqualified', 4)])
+
+    def test_small_blocks(self):
+        with mock.patch('judge.scoreboard.SCOREBOARD_BLOCK_SIZE', 1):
+            self.assertEqual(self.ranking(), [('first', 1), ('second', 2), ('tied', 2), ('disqualified', 4)])
+            total, offset, participations = get_scoreboard(self.contest).window(False, False, 2, 2)
+            self.assertEqual([p['rank'] for p in participations], [2, 4])
+            for name, score in (('tied', 350), ('second', 500), ('first', 0)):
+                participation = self.participations[name]
+                participation.score = score
+                with self.captureOnCommitCallbacks(execute=True):
+                    participation.save()
+            self.assertEqual(self.ranking(), [('second', 1), ('tied', 2), ('first', 3), ('disqualified', 4)])
+            self.assertEqual(
+                self.ranking(show_virtual=True),
+                [('second', 1), ('tied', 2), ('virtual', 3), ('first', 4), ('disqualified', 5)],
+            )
+
+    def test_update_while_locked(self):
+        version = get_scoreboard(self.contest).version
+        cache.add(SCOREBOARD_LOCK_KEY % self.contest.id, True)
+        participation = self.participations['tied']
+        participation.score = 350
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+        # The holder of the lock applies the update once it is done.
+        self.assertEqual(get_scoreboard(self.contest).version, version)
+
+        cache.delete(SCOREBOARD_LOCK_KEY % self.contest.id)
+        participation = self.participations['second']
+        participation.score = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+        self.assertEqual(get_scoreboard(self.contest).version, version + 2)
+        self.assertEqual(self.ranking(), [('tied', 1), ('first', 2), ('second', 3), ('disqualified', 4)])
+
+    def test_evicted_row(self):
+        scoreboard = get_scoreboard(self.contest)
+        cache.delete(SCOREBOARD_ROW_KEY % (scoreboard.epoch, self.participations['second'].id))
+        self.assertEqual(self.ranking(), [('first', 1), ('second', 2), ('tied', 2), ('disqualified', 4)])
+        self.assertNotEqual(get_scoreboard(self.contest).epoch, scoreboard.epoch)
+
+    def test_new_participation(self):
+        scoreboard = get_scoreboard(self.contest)
+        # Registrations start at the epoch, long before the scoreboard was built.
+        with self.captureOnCommitCallbacks(execute=True):
+            ContestParticipation.objects.create(
+                contest=self.contest, user=create_user(username='scoreboard_registered').profile, virtual=0,
+                real_start=datetime(1970, 1, 1, tzinfo=dt_timezone.utc), score=250,
+            )
+        self.assertEqual(get_scoreboard(self.contest).epoch, scoreboard.epoch)
+        self.assertEqual(self.ranking(),
+                         [('first', 1), ('registered', 2), ('second', 3), ('tied', 3), ('disqualified', 5)])
+
+    def test_evicted_row_of_new_participation(self):
+        scoreboard = get_scoreboard(self.contest)
+        with self.captureOnCommitCallbacks(execute=True):
+            participation = create_contest_participation(
+                contest=self.contest, user=create_user(username='scoreboard_late').profile, score=250,
+            )
+        self.assertEqual(get_scoreboard(self.contest).epoch, scoreboard.epoch)
+
+        cache.delete(SCOREBOARD_ROW_KEY % (scoreboard.epoch, participation.id))
+        participation.score = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+        self.assertNotEqual(get_scoreboard(self.contest).epoch, scoreboard.epoch)
+        self.assertEqual(self.ranking(),
+                         [('first', 1), ('second', 2), ('tied', 2), ('late', 4), ('disqualified', 5)])
+
+    def test_delete(self):
+        get_scoreboard(self.contest)
+        with self.captureOnCommitCallbacks(execute=True):
+            ContestParticipation.objects.get(id=self.participations['first'].id).delete()
+        self.assertEqual(self.ranking(), [('second', 1), ('tied', 1), ('disqualified', 3)])
+
+    def test_update_without_cached_scoreboard(self):
+        participation = self.participations['second']
+        participation.score = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+        self.assertEqual(self.ranking(), [('first', 1), ('tied', 2), ('second', 3), ('disqualified', 4)])
+
+    def test_contest_problem_change(self):
+        self.assertEqual(len(get_scoreboard(self.contest).problems), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_contest_problem(contest=self.contest, problem='scoreboard_problem_2', points=100, order=2)
+        self.assertEqual(len(get_scoreboard(self.contest).problems), 2)
+
+    def test_delta(self):
+        scoreboard = get_scoreboard(self.contest)
+        since = scoreboard.version_token(False, False)
+        participation = self.participations['tied']
+        participation.score = 350
+        with self.captureOnCommitCallbacks(execute=True):
+            participation.save()
+
+        scoreboard = get_scoreboard(self.contest)
+        delta = scoreboard.delta(since, False, False)
+        self.assertEqual(delta['version'], scoreboard.version_token(False, False))
+        self.assertEqual(delta['count'], 4)
+        self.assertEqual([p['id'] for p in delta['updated']], [participation.id])
+        self.assertEqual(delta['updated'][0]['rank'], 1)
+        self.assertEqual(delta['moved'], [
+            [participation.id, 1, 0],
+            [self.participations['first'].id, 2, 1],
+            [self.participations['second'].id, 3, 2],
+        ])
+        self.assertEqual(delta['removed'], [])
+
+        self.assertEqual(scoreboard.delta(delta['version'], False, False)['updated'], [])
+        # The frozen ranking and a rebuilt scoreboard are not comparable with this version.
+        self.assertIsNone(scoreboard.delta(since, True, False))
+        cache.clear()
+        self.assertIsNone(get_scoreboard(self.contest).delta(since, False, False))
+
+    def test_window(self):
+        scoreboard = get_scoreboard(self.contest)
+
+        def window(*args, **kwargs):
+            total, offset, participations = scoreboard.window(False, False, *args, **kwargs)
+            return total, offset, [(p['user']['username'][len('scoreboard_'):], p['rank']) for p in participations]
+
+        self.assertEqual(window(1, 2), (4, 1, [('second', 2), ('tied', 2)]))
+        self.assertEqual(window(3, 10), (4, 3, [('disqualified', 4)]))
+        self.assertEqual(window(0, 1, around=self.participations['tied'].id), (4, 2, [('tied', 2)]))
+        # Virtual participations are not on this ranking, so there is nothing to center on.
+        self.assertEqual(window(0, 1, around=self.participations['virtual'].id), (4, 0, [('first', 1)]))
+
+        participation_ids = [self.participations[name].id for name in ('tied', 'virtual', 'disqualified')]
+        queryset = ContestParticipation.objects.filter(id__in=participation_ids)
+        self.assertEqual(window(0, 10, queryset), (2, 0, [('tied', 2), ('disqualified', 4)]))
+        self.assertEqual(window(0, 1, queryset, around=participation_ids[2]), (2, 1, [('disqualified', 4)]))
+        # Ties are broken by the number of submissions, then by id, like on the scoreboard.
+        queryset = ContestParticipation.objects.filter(id__in=[self.participations[name].id
+                                                               for name in ('first', 'second', 'tied')])
+        self.assertEqual(window(0, 1, queryset, around=self.participations['tied'].id), (3, 2, [('tied', 2)]))
@@ -0,0 +1,115 @@
+import collections.abc
+
+from django.http import Http404
+
+from judge.utils.infinite_paginator import DummyPaginator
+
+CURSOR_KWARGS = ('before', 'after')
+
+
+class KeysetPage(collections.abc.Sequence):
+    """
+    A page of a queryset ordered by descending id, that starts right after a known id.
+
+    Pages are fetched with `id < before` (older items) or `id > after` (newer items) instead of an offset,
+    so that deep pages cost as much as the first one. Since the position of the page in the whole list is
+    unknown, there are no page numbers: `number` is 1 on the first page and None elsewhere.
+    """
+    def __init__(self, object_list, is_first, has_next, paginator):
+        self.object_list = list(object_list)
+        self.number = 1 if is_first else None
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page %s>' % ('1' if self.number else 'before %s' % self.next_cursor)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number is None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].id if self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].id if self.object_list else None
+
+
+def keyset_paginate(queryset, page_size, before=None, after=None, paginator=None):
+    """
+    Returns the page of `page_size` items of `queryset`, which must be ordered by descending id, that come
+    right after `before` or right before `after`, or the first page if neither is given.
+    """
+    if before is not None:
+        items = list(queryset.filter(id__lt=before)[:page_size + 1])
+        return KeysetPage(items[:page_size], False, len(items) > page_size, paginator)
+
+    if after is not None:
+        items = list(queryset.filter(id__gt=after).reverse()[:page_size + 1])
+        # Only a full page is shown after the cursor: near the top of the list, that's the first page.
+        if len(items) > page_size:
+            items.reverse()
+            return KeysetPage(items[1:], False, True, paginator)
+
+    items = list(queryset[:page_size + 1])
+    return KeysetPage(items[:page_size], True, len(items) > page_size, paginator)
+
+
+def strip_cursors(query):
+    """Returns a copy of the query dict without the pagination cursors."""
+    query = query.copy()
+    for kwarg in CURSOR_KWARGS:
+        query.pop(kwarg, None)
+    return query
+
+
+class KeysetPaginationMixin:
+    """
+    Paginates a list view ordered by descending id with `?before=<id>` and `?after=<id>` cursors.
+
+    Cursors are always accepted. The view's `use_keyset_pagination` decides whether the first page and the
+    pagination links use them too, instead of page numbers. Page numbers in existing links keep working.
+    """
+    def get_cursor(self, kwarg):
+        cursor = self.request.GET.get(kwarg)
+        if cursor is None:
+            return None
+        try:
+            return int(cursor)
+        except ValueError:
+            raise Http404('Cursor cannot be converted to an int.')
+
+    def is_keyset_paginated(self):
+        if any(kwarg in self.request.GET for kwarg in CURSOR_KWARGS):
+            return True
+        page_kwarg = self.page_kwarg
+        return self.use_keyset_pagination and not (self.kwargs.get(page_kwarg) or self.request.GET.get(page_kwarg))
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.is_keyset_paginated():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = DummyPaginator(page_size)
+        paginator.is_keyset = True
+        page = keyset_paginate(queryset, page_size, self.get_cursor('before'), self.get_cursor('after'), paginator)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = strip_cursors(self.request.GET).urlencode()
+        context['is_keyset_paginated'] = getattr(context.get('paginator'), 'is_keyset', False)
+        context['keyset_prefix'] = '.?%s&' % query if query else '.?'
+        return context
@@ -1,3 +1,6 @@
+import os
+import re
+
 from django.shortcuts import render
 from django.views.generic import FormView
 from django.views.generic.detail import SingleObjectMixin
@@ -24,6 +27,35 @@ def add_file_response(request, response, url_path, file_path, file_object=None):
                 response.content = f.read()
 
 
+def add_file_range_response(request, response, url_path, file_path):
+    """Like add_file_response, but serves just the requested part of the file for a single-range Range header."""
+    response['Accept-Ranges'] = 'bytes'
+    match = re.match(r'^bytes=(\d*)-(\d*)$', request.META.get('HTTP_RANGE', ''))
+    if match is None or not any(match.groups()) or \
+            url_path is not None and request.META.get('SERVER_SOFTWARE', '').startswith('nginx/'):
+        # nginx handles ranges itself.
+        add_file_response(request, response, url_path, file_path)
+        return
+
+    size = os.path.getsize(file_path)
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last bytes of the file.
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        first, last = int(first), min(int(last), size - 1) if last else size - 1
+    if first > last:
+        response.status_code = 416
+        response['Content-Range'] = 'bytes */%d' % size
+        return
+
+    with open(file_path, 'rb') as f:
+        f.seek(first)
+        response.content = f.read(last - first + 1)
+    response.status_code = 206
+    response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+
+
 def paginate_query_context(request):
     query = request.GET.copy()
     query.setlist('page', [])
@@ -1,5 +1,11 @@
+import hashlib
 import json
 import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
 from calendar import Calendar, SUNDAY
 from collections import defaultdict, namedtuple
 from datetime import date, datetime, time, timedelta
@@ -13,11 +19,10 @@ from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMix
 from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist, PermissionDenied
 from django.db import IntegrityError
-from django.db.models import BooleanField, Case, Count, F, FloatField, IntegerField, Max, Min, OuterRef, Q, Subquery, \
-    Sum, Value, When
+from django.db.models import BooleanField, Case, Count, F, FloatField, IntegerField, Max, Min, Q, Sum, Value, When
 from django.db.models.expressions import CombinedExpression
-from django.db.models.query import Prefetch
-from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect, \
+    JsonResponse
 from django.shortcuts import redirect, render
 from django.template.defaultfilters import date as date_filter, floatformat
 from django.template.loader import get_template
@@ -41,8 +46,9 @@ from judge.contest_format import ICPCContestFormat
 from judge.forms import ContestAnnouncementForm, ContestCloneForm, ContestDownloadDataForm, ContestForm, \
     ProposeContestProblemFormSet
 from judge.models import Contest, ContestAnnouncement, ContestMoss, ContestParticipation, ContestProblem, \
-    ContestSubmission, ContestTag, Language, Organization, Problem, ProblemClarification, Profile, Solution, Submission
+    ContestSubmission, ContestTag, Language, Problem, ProblemClarification, Solution, Submission
 from judge.ratings import RATING_CLASS, RATING_LEVELS, RATING_VALUES
+from judge.scoreboard import get_scoreboard, make_contest_ranking_json
 from judge.tasks import on_new_contest, prepare_contest_data, rescore_problem, run_moss
 from judge.utils.celery import redirect_to_task_status, task_status_by_id, task_status_url_by_id
 from judge.utils.cms import parse_csv_ranking
@@ -51,7 +57,7 @@ from judge.utils.opengraph import generate_opengraph
 from judge.utils.problems import _get_result_data, user_attempted_ids, user_completed_ids
 from judge.utils.stats import get_bar_chart, get_pie_chart, get_stacked_bar_chart
 from judge.utils.views import SingleObjectFormView, TitleMixin, \
-    add_file_response, generic_message, paginate_query_context
+    add_file_range_response, add_file_response, generic_message, paginate_query_context
 
 __all__ = ['ContestList', 'ContestDetail', 'ContestRanking', 'ContestJoin', 'ContestLeave', 'ContestCalendar',
            'ContestClone', 'ContestStats', 'ContestMossView', 'ContestMossDelete',
@@ -820,115 +826,6 @@ class ContestStats(TitleMixin, ContestMixin, DetailView):
         return super().dispatch(request, *args, **kwargs)
 
 
-def base_contest_ranking_queryset(contest):
-    return contest.users.filter(virtual__gt=ContestParticipation.SPECTATE) \
-        .prefetch_related(Prefetch('user__organizations',
-                                   queryset=Organization.objects.filter(is_unlisted=False))) \
-        .annotate(submission_count=Count('submission')) \
-        .order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker', '-submission_count')
-
-
-def base_contest_frozen_ranking_queryset(contest):
-    return contest.users.filter(virtual__gt=ContestParticipation.SPECTATE) \
-        .prefetch_related(Prefetch('user__organizations',
-                                   queryset=Organization.objects.filter(is_unlisted=False))) \
-        .annotate(submission_count=Count('submission')) \
-        .order_by('is_disqualified', '-frozen_score', 'frozen_cumtime', 'frozen_tiebreaker', '-submission_count')
-
-
-def _serialize_user(row, user_url_tpl, org_url_tpl):
-    """Serialize the user/profile portion of a participation row into a JSON-safe dict."""
-    username = row['user__user__username']
-    display_name = row['user__username_display_override'] or username
-    org_short_name = row['_org_short_name']
-    org_slug = row['_org_slug']
-    badge_mini = row['_badge_mini']
-    badge_name = row['_badge_name']
-
-    return {
-        'username': username,
-        'display_name': display_name,
-        'name': row['user__user__first_name'],
-        'css_class': Profile.get_user_css_class(row['user__display_rank'], row['user__rating']),
-        'url': user_url_tpl.replace('__USERNAME__', username),
-        'organization': {
-            'short_name': org_short_name,
-            'url': org_url_tpl.replace('__SLUG__', org_slug),
-        } if org_short_name else None,
-        'badge': {
-            'mini': badge_mini,
-            'name': badge_name,
-        } if badge_mini else None,
-    }
-
-
-def _serialize_format_data(contest, problems, raw_format_data, frozen):
-    """Transform raw format_data into an API-safe dict keyed by problem id."""
-    result = {}
-    for prob in problems:
-        pid = str(prob.id)
-        raw = (raw_format_data or {}).get(pid)
-        if raw is not None:
-            result[pid] = contest.format.get_format_data_for_api(raw, prob.points, frozen)
-    return result
-
-
-def make_contest_ranking_json(contest, problems, queryset, frozen=False):
-    # Pre-compute URL templates once to avoid per-row reverse() overhead.
-    _user_url_tpl = reverse('user_page', args=['__USERNAME__'])
-    _org_url_tpl = reverse('organization_home', args=['__SLUG__'])
-
-    # Subqueries for the user's first organisation (replicates Profile.organization).
-    _org_qs = Organization.objects.filter(
-        member=OuterRef('user'), is_unlisted=False,
-    ).order_by('name')
-
-    queryset = queryset.annotate(
-        _org_short_name=Subquery(_org_qs.values('short_name')[:1]),
-        _org_slug=Subquery(_org_qs.values('slug')[:1]),
-        _badge_mini=F('user__display_badge__mini'),
-        _badge_name=F('user__display_badge__name'),
-    ).values(
-        'id', 'score', 'frozen_score', 'cumtime', 'frozen_cumtime',
-        'tiebreaker', 'frozen_tiebreaker', 'is_disqualified', 'virtual',
-        'format_data',
-        'user_id', 'user__display_rank', 'user__rating',
-        'user__username_display_override',
-        'user__user__username', 'user__user__first_name',
-        'rating__rating',
-        '_org_short_name', '_org_slug', '_badge_mini', '_badge_name',
-    )
-
-    participations_data = []
-    for row in queryset:
-        participations_data.append({
-            'id': row['id'],
-            'score': float(row['frozen_score'] if frozen else row['score']),
-            'cumtime': float(row['frozen_cumtime'] if frozen else row['cumtime']),
-            'tiebreaker': float(row['frozen_tiebreaker'] if frozen else row['tiebreaker']),
-            'is_disqualified': row['is_disqualified'],
-            'virtual': row['virtual'],
-            'rating': row['rating__rating'],
-            'user': _serialize_user(row, _user_url_tpl, _org_url_tpl),
-            'format_data': _serialize_format_data(contest, problems, row['format_data'], frozen),
-        })
-    return participations_data
-
-
-def _add_ranks_to_participation_json(participations):
-    rank = 0
-    delta = 1
-    last_key = None
-    for p in participations:
-        key = (p['is_disqualified'], p['score'], p['cumtime'], p['tiebreaker'])
-        if key != last_key:
-            rank += delta
-            delta = 0
-        delta += 1
-        p['rank'] = rank
-        last_key = key
-
-
 class ContestRankingBase(ContestMixin, TitleMixin, DetailView):
     template_name = 'contest/ranking.html'
     tab = None
@@ -1008,6 +905,8 @@ class ContestRankingBase(ContestMixin, TitleMixin, DetailView):
 class ContestRanking(ContestRankingBase):
     tab = 'ranking'
     show_virtual = False
+    ranking_window_size = 100
+    max_ranking_window_size = 1000
 
     def get_title(self):
         return _('%s Rankings') % self.object.name
@@ -1041,15 +940,6 @@ class ContestRanking(ContestRankingBase):
         else:
             self.show_virtual = self.request.session.get('show_virtual', False)
 
-    def get_ranking_queryset(self):
-        if self.is_frozen:
-            queryset = base_contest_frozen_ranking_queryset(self.object)
-        else:
-            queryset = base_contest_ranking_queryset(self.object)
-        if not self.show_virtual:
-            queryset = queryset.filter(virtual=ContestParticipation.LIVE)
-        return queryset
-
     @property
     def _show_full_ranking(self):
         return self.object.can_see_full_scoreboard(self.request.user)
@@ -1063,20 +953,22 @@ class ContestRanking(ContestRankingBase):
         contest = self.object
         problems, problems_data, contest_data = self._build_json_base()
 
+        data = {'contest': contest_data, 'problems': problems_data}
         if not self._show_full_ranking:
             queryset = contest.users.filter(user=self.request.profile, virtual=ContestParticipation.LIVE)
             participations = make_contest_ranking_json(contest, problems, queryset)
             for p in participations:
                 p['rank'] = '???'
         else:
-            queryset = self.get_ranking_queryset()
-            participations = make_contest_ranking_json(contest, problems, queryset, frozen=self.is_frozen)
-            _add_ranks_to_participation_json(participations)
+            scoreboard = get_scoreboard(contest)
+            participations = scoreboard.participations(self.is_frozen, self.show_virtual)
+            data['version'] = scoreboard.version_token(self.is_frozen, self.show_virtual)
 
         contest_data['is_frozen'] = self.is_frozen
         contest_data['has_rating'] = contest.ratings.exists()
 
-        return {'contest': contest_data, 'problems': problems_data, 'participations': participations}
+        data['participations'] = participations
+        return data
 
     def _build_virtual_json_data(self):
         virtual_part = self._virtual_participation
@@ -1133,6 +1025,58 @@ class ContestRanking(ContestRankingBase):
             cache.set(self.json_cache_key, cached, self.object.scoreboard_cache_timeout)
         return cached
 
+    def get_cached_json_ranking_delta(self, since):
+        if self._virtual_participation or not self._show_full_ranking:
+            return None
+        if self.bypass_cache_ranking:
+            return get_scoreboard(self.object).delta(since, self.is_frozen, self.show_virtual)
+
+        # Spectators polling together mostly hold the same version, so they can share the delta.
+        cache_key = 'contest_ranking_delta_%s' % hashlib.sha1(
+            f'{self.object.key}_{since}_{self.show_virtual}_{self.is_frozen}'.encode(),
+        ).hexdigest()
+        cached = cache.get(cache_key)
+        if cached is None:
+            cached = get_scoreboard(self.object).delta(since, self.is_frozen, self.show_virtual) or {}
+            cache.set(cache_key, cached, self.object.scoreboard_cache_timeout)
+        return cached or None
+
+    def get_json_ranking_window(self):
+        """
+        Returns the part of the ranking selected by the `offset`, `limit`, `around=me` and `organization` parameters,
+        or None if the full ranking is asked for.
+        """
+        params = self.request.GET
+        if not any(param in params for param in ('offset', 'limit', 'around', 'organization')):
+            return None
+        if self._virtual_participation or not self._show_full_ranking:
+            return None
+
+        offset = max(int(params.get('offset', 0)), 0)
+        limit = min(max(int(params.get('limit', self.ranking_window_size)), 1), self.max_ranking_window_size)
+        contest = self.object
+        queryset = None
+        if 'organization' in params:
+            queryset = contest.users.filter(user__organizations=int(params['organization']))
+        around = None
+        if params.get('around') == 'me' and self.request.user.is_authenticated:
+            around = contest.users.filter(user=self.request.profile, virtual=ContestParticipation.LIVE) \
+                                  .values_list('id', flat=True).first()
+
+        total, offset, participations = get_scoreboard(contest).window(
+            self.is_frozen, self.show_virtual, offset, limit, queryset, around,
+        )
+        _, problems_data, contest_data = self._build_json_base()
+        contest_data['is_frozen'] = self.is_frozen
+        contest_data['has_rating'] = contest.ratings.exists()
+        return {
+            'contest': contest_data,
+            'problems': problems_data,
+            'participations': participations,
+            'total': total,
+            'offset': offset,
+        }
+
     def _inject_replay_url(self, data):
         contest = self.object
         if not contest.can_replay or 'contest' not in data:
@@ -1142,6 +1086,9 @@ class ContestRanking(ContestRankingBase):
             'contest': {
                 **data['contest'],
                 'replay_url': reverse('contest_replay_data', args=[contest.key, contest.replay_version]),
+                **({
+                    'replay_columns_url': reverse('contest_replay_columns', args=[contest.key, contest.replay_version]),
+                } if contest.csv_ranking != Contest.HAS_GHOST_PARTICIPATION else {}),
                 'replay_duration': int((contest.end_time - contest.start_time).total_seconds()),
             },
         }
@@ -1151,6 +1098,16 @@ class ContestRanking(ContestRankingBase):
             self.object = self.get_object()
             self._resolve_show_virtual()
             self.check_can_see_own_scoreboard()
+            if 'since' in request.GET:
+                delta = self.get_cached_json_ranking_delta(request.GET['since'])
+                if delta is not None:
+                    return JsonResponse({'delta': delta})
+            try:
+                window = self.get_json_ranking_window()
+            except ValueError:
+                return HttpResponseBadRequest()
+            if window is not None:
+                return JsonResponse(self._inject_replay_url(window))
             return JsonResponse(self._inject_replay_url(self.get_cached_json_ranking_data()))
         return super().get(request, *args, **kwargs)
 
@@ -1267,15 +1224,18 @@ class ContestParticipationDisqualify(ContestMixin, SingleObjectMixin, View):
         return HttpResponseRedirect(reverse('contest_ranking', args=(self.object.key,)))
 
 
+# Changed whenever the layout of columnar replay files changes, so that files in an older layout are not read.
+REPLAY_COLUMNS_MAGIC = b'VNR2'
+REPLAY_COLUMNS_WINDOW = 5 * 60
+
+
 def contest_replay_data_path(contest):
     replay_dir = os.path.join(settings.MEDIA_ROOT, settings.CONTEST_REPLAY_MEDIA_DIR)
     filename = f'{contest.key}_v{contest.replay_version}.json'
     return os.path.join(replay_dir, filename), filename
 
 
-def build_contest_replay_data(contest):
-    duration = int((contest.end_time - contest.start_time).total_seconds())
-
+def _contest_replay_header(contest):
     problems = list(
         contest.contest_problems
         .select_related('problem').defer('problem__description').order_by('order'),
@@ -1286,7 +1246,17 @@ def build_contest_replay_data(contest):
     for p in participations_data:
         del p['score'], p['cumtime'], p['tiebreaker'], p['format_data']
 
-    subs_qs = (
+    return {
+        'start': int(contest.start_time.timestamp()),
+        'duration': int((contest.end_time - contest.start_time).total_seconds()),
+        'frozen': 0,
+        'problems': [prob.id for prob in problems],
+        'participations': participations_data,
+    }
+
+
+def _contest_replay_submissions(contest):
+    return (
         ContestSubmission.objects
         .filter(
             participation__contest=contest,
@@ -1296,21 +1266,16 @@ def build_contest_replay_data(contest):
         .order_by('submission__date')
     )
 
+
+def build_contest_replay_data(contest):
     subs = []
-    for part_id, prob_id, points, result, sub_date in subs_qs:
+    for part_id, prob_id, points, result, sub_date in _contest_replay_submissions(contest):
         if result in (None, 'CE', 'IE'):
             continue
         t = (sub_date - contest.start_time).total_seconds()
         subs.append([part_id, prob_id, float(points), round(t, 3)])
 
-    return {
-        'start': int(contest.start_time.timestamp()),
-        'duration': duration,
-        'frozen': 0,
-        'problems': [prob.id for prob in problems],
-        'participations': participations_data,
-        'subs': subs,
-    }
+    return {**_contest_replay_header(contest), 'subs': subs}
 
 
 def write_contest_replay_data(contest, data):
@@ -1323,11 +1288,128 @@ def write_contest_replay_data(contest, data):
     return filepath, filename
 
 
+def contest_replay_columns_path(contest):
+    filepath, filename = contest_replay_data_path(contest)
+    suffix = '.%s.bin' % REPLAY_COLUMNS_MAGIC.decode('ascii').lower()
+    return os.path.splitext(filepath)[0] + suffix, os.path.splitext(filename)[0] + suffix
+
+
+def _write_replay_chunk(f, columns):
+    for column in columns:
+        if sys.byteorder == 'big':
+            column.byteswap()
+        column.tofile(f)
+    # Keep every chunk, and so every column, aligned for typed arrays.
+    f.write(b'\0' * (-f.tell() % 8))
+
+
+def write_contest_replay_columns(contest):
+    """
+    Writes the replay data in a columnar binary form, streaming the submissions from the database.
+
+    The file starts with REPLAY_COLUMNS_MAGIC and the length of a JSON header as a little-endian uint32. The header
+    has the same fields as build_contest_replay_data, except that `subs` is replaced by their `count` and a list of
+    `chunks`. Each chunk holds the submissions of a REPLAY_COLUMNS_WINDOW seconds window, and is listed with the
+    start of that window, its number of submissions, and its byte offset and size from the end of the header. This
+    lets clients load only the part of the contest they replay.
+
+    A chunk stores its submissions column by column as little-endian arrays, each aligned to 8 bytes: points
+    (float64), milliseconds since the start of the chunk's window (uint32), index into the participations (uint32)
+    and index into the problems (uint16). Times are relative to the window so that they fit in 32 bits however long
+    the contest is.
+    """
+    header = _contest_replay_header(contest)
+    participation_index = {p['id']: i for i, p in enumerate(header['participations'])}
+    problem_index = {id: i for i, id in enumerate(header['problems'])}
+    window_ms = REPLAY_COLUMNS_WINDOW * 1000
+
+    chunks = []
+    with tempfile.TemporaryFile() as body:
+        columns = window = None
+        for part_id, prob_id, points, result, sub_date in _contest_replay_submissions(contest).iterator():
+            if result in (None, 'CE', 'IE'):
+                continue
+            # Rounded the same way as in the JSON replay data.
+            t = max(round(round((sub_date - contest.start_time).total_seconds(), 3) * 1000), 0)
+            if columns is None or t // window_ms != window:
+                if columns is not None:
+                    _write_replay_chunk(body, columns)
+                window = t // window_ms
+                chunks.append({'time': window * REPLAY_COLUMNS_WINDOW, 'count': 0, 'offset': body.tell()})
+                columns = (array('d'), array('I'), array('I'), array('H'))
+            columns[0].append(float(points))
+            columns[1].append(t - window * window_ms)
+            columns[2].append(participation_index[part_id])
+            columns[3].append(problem_index[prob_id])
+            chunks[-1]['count'] += 1
+        if columns is not None:
+            _write_replay_chunk(body, columns)
+
+        for chunk, next_chunk in zip(chunks, chunks[1:] + [{'offset': body.tell()}]):
+            chunk['size'] = next_chunk['offset'] - chunk['offset']
+        header['count'] = sum(chunk['count'] for chunk in chunks)
+        header['chunks'] = chunks
+
+        header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        # Pad with whitespace so that the chunks start 8-byte aligned.
+        header += b' ' * (-(len(REPLAY_COLUMNS_MAGIC) + 4 + len(header)) % 8)
+
+        filepath, filename = contest_replay_columns_path(contest)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp = filepath + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(REPLAY_COLUMNS_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            body.seek(0)
+            shutil.copyfileobj(body, f)
+        os.replace(tmp, filepath)
+    return filepath, filename
+
+
+def read_contest_replay_columns(f):
+    """
+    Reads a file written by write_contest_replay_columns into the header and a list of columns per chunk, with
+    times in milliseconds since the start of the contest.
+    """
+    if f.read(len(REPLAY_COLUMNS_MAGIC)) != REPLAY_COLUMNS_MAGIC:
+        raise ValueError('not a columnar replay file')
+    header_size, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(header_size))
+    data = f.read()
+    chunks = []
+    for chunk in header['chunks']:
+        offset, count = chunk['offset'], chunk['count']
+        columns = []
+        for typecode in 'dIIH':
+            column = array(typecode)
+            column.frombytes(data[offset:offset + count * column.itemsize])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+            offset += count * column.itemsize
+        start = chunk['time'] * 1000
+        columns[1] = array('Q', (start + t for t in columns[1]))
+        chunks.append(columns)
+    return header, chunks
+
+
 class ContestReplayData(ContestMixin, SingleObjectMixin, View):
+    content_type = 'application/json'
+
+    def is_available(self, contest):
+        return contest.can_replay
+
+    def get_replay_path(self, contest):
+        return contest_replay_data_path(contest)
+
+    def write_replay_data(self, contest):
+        write_contest_replay_data(contest, build_contest_replay_data(contest))
+
     def get(self, request, *args, **kwargs):
         contest = self.get_object()
 
-        if not contest.can_replay:
+        if not self.is_available(contest):
             raise Http404()
 
         version = kwargs['version']
@@ -1341,18 +1423,32 @@ class ContestReplayData(ContestMixin, SingleObjectMixin, View):
         else:
             url_path = None
 
-        response = HttpResponse(content_type='application/json')
+        response = HttpResponse(content_type=self.content_type)
         response['Cache-Control'] = 'public, max-age=31536000, immutable'
-        add_file_response(request, response, url_path, filepath)
+        add_file_range_response(request, response, url_path, filepath)
         return response
 
     def prepare_replay_data(self, contest):
-        filepath, filename = contest_replay_data_path(contest)
+        filepath, filename = self.get_replay_path(contest)
         if not os.path.exists(filepath):
-            write_contest_replay_data(contest, build_contest_replay_data(contest))
+            self.write_replay_data(contest)
         return filepath, filename
 
 
+class ContestReplayColumns(ContestReplayData):
+    content_type = 'application/octet-stream'
+
+    def is_available(self, contest):
+        # Merged ghost participations only exist in the JSON replay data.
+        return super().is_available(contest) and contest.csv_ranking != Contest.HAS_GHOST_PARTICIPATION
+
+    def get_replay_path(self, contest):
+        return contest_replay_columns_path(contest)
+
+    def write_replay_data(self, contest):
+        write_contest_replay_columns(contest)
+
+
 class ContestMossMixin(ContestMixin, PermissionRequiredMixin):
     permission_required = 'judge.moss_contest'
     permission_denied_message = _('You are not allowed to run MOSS.')
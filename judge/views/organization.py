@@ -33,6 +33,7 @@ from judge.models.profile import OrganizationMonthlyUsage, OrganizationQuota
 from judge.tasks import on_new_problem
 from judge.utils.cache_helper import storage_pie_cache_factory
 from judge.utils.infinite_paginator import InfinitePaginationMixin
+from judge.utils.keyset_paginator import KeysetPaginationMixin
 from judge.utils.organization import add_admin_to_group, add_quota_context
 from judge.utils.problems import user_completed_ids
 from judge.utils.ranker import ranker
@@ -915,7 +916,8 @@ class ContestListOrganization(PrivateOrganizationMixin, ContestList):
         return context
 
 
-class SubmissionListOrganization(InfinitePaginationMixin, PrivateOrganizationMixin, SubmissionsListBase):
+class SubmissionListOrganization(KeysetPaginationMixin, InfinitePaginationMixin, PrivateOrganizationMixin,
+                                 SubmissionsListBase):
     template_name = 'organization/submission-list.html'
     permission_bypass = ['judge.view_all_submission']
 
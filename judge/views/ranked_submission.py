@@ -63,6 +63,10 @@ class RankedSubmissions(ProblemSubmissions):
         else:
             return queryset.order_by('-points', 'time')
 
+    def is_keyset_paginated(self):
+        # Ranked submissions are not ordered by id.
+        return False
+
     def get_title(self):
         return _('Best solutions for %s') % self.problem_name
 
@@ -27,6 +27,7 @@ from judge.highlight_code import highlight_code
 from judge.models import Contest, Language, Organization, Problem, ProblemTranslation, Profile, Submission
 from judge.models.problem import ProblemTestcaseResultAccess, SubmissionSourceAccess
 from judge.utils.infinite_paginator import InfinitePaginationMixin
+from judge.utils.keyset_paginator import KeysetPaginationMixin, strip_cursors
 from judge.utils.lazy import memo_lazy
 from judge.utils.problem_data import get_problem_testcases_data
 from judge.utils.problems import get_result_data, user_completed_ids, user_editable_ids, user_tester_ids
@@ -477,7 +478,8 @@ class SubmissionsListBase(DiggPaginatorMixin, TitleMixin, ListView):
         context['results_json'] = mark_safe(json.dumps(self.get_result_data()))
         context['results_colors_json'] = mark_safe(json.dumps(settings.DMOJ_STATS_SUBMISSION_RESULT_COLORS))
 
-        context['page_suffix'] = suffix = ('?' + self.request.GET.urlencode()) if self.request.GET else ''
+        query = strip_cursors(self.request.GET)
+        context['page_suffix'] = suffix = ('?' + query.urlencode()) if query else ''
         context['first_page_href'] = (self.first_page_href or '.') + suffix
         context['my_submissions_link'] = self.get_my_submissions_page()
         context['all_submissions_link'] = self.get_all_submissions_page()
@@ -488,6 +490,10 @@ class SubmissionsListBase(DiggPaginatorMixin, TitleMixin, ListView):
     def is_in_low_power_mode(self):
         return settings.VNOJ_LOW_POWER_MODE and not self.request.user.is_superuser
 
+    @property
+    def use_keyset_pagination(self):
+        return settings.VNOJ_SUBMISSION_KEYSET_PAGINATION or self.is_in_low_power_mode()
+
     def get(self, request, *args, **kwargs):
         check = self.access_check(request)
         if check is not None:
@@ -553,7 +559,8 @@ class ConditionalUserTabMixin(object):
         return context
 
 
-class AllUserSubmissions(InfinitePaginationMixin, ConditionalUserTabMixin, UserMixin, SubmissionsListBase):
+class AllUserSubmissions(KeysetPaginationMixin, InfinitePaginationMixin, ConditionalUserTabMixin, UserMixin,
+                         SubmissionsListBase):
     def get_queryset(self):
         return super(AllUserSubmissions, self).get_queryset().filter(user_id=self.profile.id)
 
@@ -650,7 +657,7 @@ class ProblemSubmissionsBase(SubmissionsListBase):
         return context
 
 
-class ProblemSubmissions(InfinitePaginationMixin, ProblemSubmissionsBase):
+class ProblemSubmissions(KeysetPaginationMixin, InfinitePaginationMixin, ProblemSubmissionsBase):
     def get_my_submissions_page(self):
         if self.request.user.is_authenticated:
             if hasattr(self, 'contest'):
@@ -740,7 +747,7 @@ def single_submission(request):
     })
 
 
-class AllSubmissions(InfinitePaginationMixin, SubmissionsListBase):
+class AllSubmissions(KeysetPaginationMixin, InfinitePaginationMixin, SubmissionsListBase):
     stats_update_interval = 3600
 
     @property
@@ -1,17 +1,21 @@
+import tempfile
 from unittest.mock import patch
 
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
 
-from judge.models import Solution
+from judge.models import ContestSubmission, Language, Solution, Submission
 from judge.models.tests.util import (
     create_contest,
+    create_contest_participation,
     create_contest_problem,
     create_problem,
     create_solution,
     create_user,
 )
+from judge.views.contests import build_contest_replay_data, read_contest_replay_columns, \
+    write_contest_replay_columns
 
 
 class ContestProblemMakePublicTestCase(TestCase):
@@ -145,3 +149,85 @@ class ContestProblemMakePublicTestCase(TestCase):
         self.problem_with_editorial.refresh_from_db()
         self.assertFalse(self.problem_with_editorial.is_public)
         mock_rescore.delay.assert_not_called()
+
+
+class ContestReplayColumnsTestCase(TestCase):
+    fixtures = ['language_all.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.contest = create_contest(
+            key='test_replay_columns',
+            start_time=now - timezone.timedelta(hours=5),
+            end_time=now - timezone.timedelta(hours=1),
+        )
+        contest_problems = [
+            create_contest_problem(contest=cls.contest, problem='replay_columns_%d' % i, points=100, order=i)
+            for i in range(3)
+        ]
+        language = Language.get_python3()
+
+        for i in range(4):
+            user = create_user(username='replay_columns_%d' % i).profile
+            participation = create_contest_participation(contest=cls.contest, user=user)
+            for minutes, result in ((10, 'WA'), (20, 'CE'), (200, 'AC'), (230, None)):
+                contest_problem = contest_problems[(i + minutes) % 3]
+                points = 100 / 3 if result == 'AC' else 0
+                submission = Submission.objects.create(
+                    user=user, problem=contest_problem.problem, language=language,
+                    status='D', result=result, points=points,
+                )
+                Submission.objects.filter(id=submission.id).update(
+                    date=cls.contest.start_time + timezone.timedelta(minutes=minutes + i, seconds=0.0015),
+                )
+                ContestSubmission.objects.create(
+                    submission=submission, problem=contest_problem, participation=participation, points=points,
+                )
+
+    def read_round_trip(self, contest):
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            filepath, _ = write_contest_replay_columns(contest)
+            with open(filepath, 'rb') as f:
+                header, chunks = read_contest_replay_columns(f)
+
+        data = build_contest_replay_data(contest)
+        subs = data.pop('subs')
+        self.assertEqual(header.pop('count'), len(subs))
+        chunk_times = [chunk['time'] for chunk in header.pop('chunks')]
+        self.assertEqual(header, data)
+
+        participations = [p['id'] for p in header['participations']]
+        self.assertEqual(subs, [
+            [participations[part], header['problems'][prob], points, t / 1000]
+            for columns in chunks for points, t, part, prob in zip(*columns)
+        ])
+        return chunk_times
+
+    def test_round_trip(self):
+        self.assertEqual(self.read_round_trip(self.contest), [600, 12000])
+
+    def test_long_contest(self):
+        # Milliseconds since the start of a contest this long don't fit in 32 bits.
+        now = timezone.now()
+        contest = create_contest(
+            key='test_replay_columns_long',
+            start_time=now - timezone.timedelta(days=60),
+            end_time=now,
+        )
+        contest_problem = create_contest_problem(contest=contest, problem='replay_columns_0', points=100)
+        user = create_user(username='replay_columns_long').profile
+        participation = create_contest_participation(contest=contest, user=user)
+        for days in (1, 55):
+            submission = Submission.objects.create(
+                user=user, problem=contest_problem.problem, language=Language.get_python3(),
+                status='D', result='AC', points=100,
+            )
+            Submission.objects.filter(id=submission.id).update(
+                date=contest.start_time + timezone.timedelta(days=days, seconds=0.0015),
+            )
+            ContestSubmission.objects.create(
+                submission=submission, problem=contest_problem, participation=participation, points=100,
+            )
+
+        self.assertEqual(self.read_round_trip(contest), [86400, 55 * 86400])
@@ -1186,6 +1186,76 @@ class AllSubmissionsTestCase(CommonDataMixin, TestCase):
         self.assertIn(self.sub_2.id, submission_ids)
 
 
+class SubmissionsKeysetPaginationTestCase(CommonDataMixin, TestCase):
+    """Test cases for cursor pagination of submission lists."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.public_problem = create_problem(code='keyset_problem', is_public=True)
+        cls.submissions = [
+            Submission.objects.create(
+                user=cls.users['normal'].profile,
+                problem=cls.public_problem,
+                language=Language.get_python3(),
+                result='AC' if i % 2 else 'WA',
+                status='D',
+            ) for i in range(7)
+        ]
+        cls.ac_ids = [sub.id for sub in reversed(cls.submissions) if sub.result == 'AC']
+
+    def _paginate(self, query, page_size=2, selected_statuses=()):
+        request = RequestFactory().get('/submissions/', query)
+        request.user = self.users['superuser']
+        request.profile = self.users['superuser'].profile
+        request.LANGUAGE_CODE = 'en'
+
+        view = AllSubmissions()
+        view.request = request
+        view.kwargs = {}
+        view.show_problem = True
+        view.selected_languages = set()
+        view.selected_statuses = set(selected_statuses)
+        view.selected_organization = None
+
+        queryset = view.get_queryset().filter(problem=self.public_problem)
+        return view.paginate_queryset(queryset, page_size)[1]
+
+    def test_cursors_with_filter(self):
+        with self.settings(VNOJ_SUBMISSION_KEYSET_PAGINATION=True):
+            first = self._paginate({}, selected_statuses={'AC'})
+        self.assertEqual([sub.id for sub in first], self.ac_ids[:2])
+        self.assertEqual(first.number, 1)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+        second = self._paginate({'before': first.next_cursor}, selected_statuses={'AC'})
+        self.assertEqual([sub.id for sub in second], self.ac_ids[2:])
+        self.assertIsNone(second.number)
+        self.assertTrue(second.has_previous())
+        self.assertFalse(second.has_next())
+
+        previous = self._paginate({'after': second.previous_cursor}, selected_statuses={'AC'})
+        self.assertEqual([sub.id for sub in previous], self.ac_ids[:2])
+        self.assertEqual(previous.number, 1)
+
+    def test_after_cursor_shows_full_page(self):
+        ids = [sub.id for sub in reversed(self.submissions)]
+        page = self._paginate({'after': ids[5]})
+        self.assertEqual([sub.id for sub in page], ids[3:5])
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_page_numbers_without_keyset_pagination(self):
+        page = self._paginate({'page': 2})
+        self.assertEqual(page.number, 2)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self._paginate({'before': 'x'})
+
+
 class AllContestSubmissionsTestCase(CommonDataMixin, TestCase):
     """Test cases for AllContestSubmissions view (ForceContestMixin)."""
 
@@ -4,6 +4,9 @@
  *
  * Entry point: window.renderRankingTable(data)
  *   data — the JSON object returned by the ?data endpoint on the contest ranking view.
+ *
+ * window.applyRankingDelta(data, delta) patches that object with the changes
+ * returned by ?data&since=<data.version>.
  */
 
 (function ($) {
@@ -520,6 +523,43 @@
         return html;
     }
 
+    // ─── Ranking deltas ───────────────────────────────────────────────────────
+
+    // Applies a delta from the ?data&since= endpoint to ranking data, returning the
+    // patched data, or null if the delta does not fit and the full ranking is needed.
+    // Rows that are not mentioned in the delta keep both their rank and position.
+    window.applyRankingDelta = function (data, delta) {
+        var updated = {}, moved = {}, removed = {};
+        var i;
+        for (i = 0; i < delta.updated.length; i++) updated[delta.updated[i].id] = delta.updated[i];
+        for (i = 0; i < delta.moved.length; i++) moved[delta.moved[i][0]] = delta.moved[i];
+        for (i = 0; i < delta.removed.length; i++) removed[delta.removed[i]] = true;
+
+        var participations = new Array(delta.count);
+        var placed = 0;
+        function place(row, position) {
+            if (position >= delta.count || participations[position] !== undefined) return false;
+            participations[position] = row;
+            placed++;
+            return true;
+        }
+
+        var old = data.participations || [];
+        for (i = 0; i < old.length; i++) {
+            var row = old[i];
+            if (removed[row.id] || updated[row.id]) continue;
+            var move = moved[row.id];
+            if (move) row = $.extend({}, row, {rank: move[1]});
+            if (!place(row, move ? move[2] : i)) return null;
+        }
+        for (var id in updated) {
+            if (!moved[id] || !place(updated[id], moved[id][2])) return null;
+        }
+        if (placed !== delta.count) return null;
+
+        return $.extend({}, data, {version: delta.version, participations: participations});
+    };
+
     // ─── Public entry point ───────────────────────────────────────────────────
 
     window.renderRankingTable = function (data, isNewDataFromBackend) {
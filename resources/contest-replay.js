@@ -228,17 +228,18 @@
 
         // Single forward pass: build state[partId][probId]
         var state = {};
-        var subs = virtualSubsData.subs;
-        for (var i = 0; i < subs.length; i++) {
-            var s = subs[i]; // [partId, probId, pts, t]
-            if (s[3] > cutoff) continue;
-            var partId = s[0], probId = s[1];
+        var cols = virtualSubsData.columns;
+        for (var i = 0; i < cols.loaded; i++) {
+            var t = cols.t[i] / cols.tScale;
+            if (t > cutoff) continue;
+            var partId = cols.partIds ? cols.partIds[cols.part[i]] : cols.part[i];
+            var probId = cols.probIds ? cols.probIds[cols.prob[i]] : cols.prob[i];
             if (!state[partId]) state[partId] = {};
             if (!state[partId][probId]) state[partId][probId] = emptyState();
-            if (frozenSec > 0 && s[3] > freezePoint) {
+            if (frozenSec > 0 && t > freezePoint) {
                 state[partId][probId].pending++;
             } else {
-                updateState(state[partId][probId], { pts: s[2], t: s[3] });
+                updateState(state[partId][probId], { pts: cols.pts[i], t: t });
             }
         }
 
@@ -290,21 +291,97 @@
     }
 
     // ─── Fetch helpers ────────────────────────────────────────────────────────
+    // Both replay formats are handed to the engine as `columns`: part/prob hold participation
+    // and problem ids, or indices into partIds/probIds; t is in 1/tScale seconds; only the
+    // first `loaded` entries are filled in. data.ensure(time, callback) calls back once every
+    // submission up to `time` is loaded.
+
+    function columnsFromJson(data) {
+        var subs = data.subs, n = subs.length;
+        var cols = {
+            part: new Array(n), prob: new Array(n), pts: new Array(n), t: new Array(n),
+            partIds: null, probIds: null, tScale: 1, loaded: n,
+        };
+        for (var i = 0; i < n; i++) {
+            var s = subs[i]; // [partId, probId, pts, t]
+            cols.part[i] = s[0]; cols.prob[i] = s[1]; cols.pts[i] = s[2]; cols.t[i] = s[3];
+        }
+        data.columns = cols;
+        data.ensure = function (time, callback) { callback(); };
+        return data;
+    }
 
     function fetchReplayData(url, callback) {
         var cacheKey = 'replay_' + url;
         var cached   = sessionStorage.getItem(cacheKey);
         if (cached) {
-            try { callback(JSON.parse(cached)); return; } catch (e) { sessionStorage.removeItem(cacheKey); }
+            try { callback(columnsFromJson(JSON.parse(cached))); return; } catch (e) { sessionStorage.removeItem(cacheKey); }
         }
         $.ajax({ url: url, dataType: 'json' })
             .done(function (data) {
                 try { sessionStorage.setItem(cacheKey, JSON.stringify(data)); } catch (e) {}
-                callback(data);
+                callback(columnsFromJson(data));
             })
             .fail(function () { callback(null); });
     }
 
+    function fetchRange(url, first, last) {
+        return fetch(url, { headers: { Range: 'bytes=' + first + '-' + last } }).then(function (response) {
+            if (!response.ok) throw new Error(response.statusText);
+            return response.arrayBuffer().then(function (buffer) {
+                // A server that ignores the range sends the whole file.
+                return response.status === 206 ? buffer : buffer.slice(first, last + 1);
+            });
+        });
+    }
+
+    // Columnar replay files (see write_contest_replay_columns) are loaded a time window at a time.
+    function fetchReplayColumns(url, callback) {
+        fetchRange(url, 0, 7).then(function (buffer) {
+            var view = new DataView(buffer);
+            var magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+            if (magic !== 'VNR2') throw new Error('not a columnar replay file');
+            var headerSize = view.getUint32(4, true);
+            return fetchRange(url, 8, 8 + headerSize - 1).then(function (buffer) {
+                var data = JSON.parse(new TextDecoder().decode(buffer));
+                var base = 8 + headerSize, chunks = data.chunks, nextChunk = 0;
+                var cols = {
+                    part: new Uint32Array(data.count), prob: new Uint16Array(data.count),
+                    pts: new Float64Array(data.count), t: new Float64Array(data.count),
+                    partIds: data.participations.map(function (p) { return p.id; }), probIds: data.problems,
+                    tScale: 1000, loaded: 0,
+                };
+
+                function load(time) {
+                    var last = nextChunk;
+                    while (last < chunks.length && chunks[last].time <= time) last++;
+                    if (last === nextChunk) return;
+                    var first = chunks[nextChunk], end = chunks[last - 1];
+                    return fetchRange(url, base + first.offset, base + end.offset + end.size - 1).then(function (buffer) {
+                        for (; nextChunk < last; nextChunk++) {
+                            var chunk = chunks[nextChunk], n = chunk.count, at = chunk.offset - first.offset;
+                            cols.pts.set(new Float64Array(buffer, at, n), cols.loaded);
+                            // Times are stored relative to the start of their chunk.
+                            var times = new Uint32Array(buffer, at + 8 * n, n), start = chunk.time * 1000;
+                            for (var i = 0; i < n; i++) cols.t[cols.loaded + i] = start + times[i];
+                            cols.part.set(new Uint32Array(buffer, at + 12 * n, n), cols.loaded);
+                            cols.prob.set(new Uint16Array(buffer, at + 16 * n, n), cols.loaded);
+                            cols.loaded += n;
+                        }
+                    });
+                }
+
+                var loading = Promise.resolve();
+                data.columns = cols;
+                data.ensure = function (time, callback) {
+                    // Loads run one after another, so that chunks are appended in order.
+                    loading = loading.then(function () { return load(time); }).then(callback, function () {});
+                };
+                callback(data);
+            });
+        }).catch(function () { callback(null); });
+    }
+
     function fmtHMS(s) {
         s = Math.floor(Math.max(0, s));
         var h = Math.floor(s / 3600), m = Math.floor((s % 3600) / 60), sec = s % 60;
@@ -328,6 +405,15 @@
         var replayUrl = rankingData.contest && rankingData.contest.replay_url;
         if (!replayUrl) return;
 
+        var columnsUrl = rankingData.contest.replay_columns_url;
+        function loadReplay(callback) {
+            if (columnsUrl && window.fetch && window.TextDecoder) {
+                fetchReplayColumns(columnsUrl, callback);
+            } else {
+                fetchReplayData(replayUrl, callback);
+            }
+        }
+
         // Virtual participations have no replay subs, so virtual and ghost/replay
         // are mutually exclusive in the UI.
         var showVirtual = window.CONTEST_SHOW_VIRTUAL;
@@ -358,9 +444,11 @@
         } else if ($ghost.length) {
             $ghost.on('change', function () {
                 if (this.checked) {
-                    fetchReplayData(replayUrl, function (data) {
+                    loadReplay(function (data) {
                         if (!data) return;
-                        window.renderRankingTable(computeVirtualRanking(data, rankingData, data.duration));
+                        data.ensure(data.duration, function () {
+                            window.renderRankingTable(computeVirtualRanking(data, rankingData, data.duration));
+                        });
                     });
                 } else {
                     window.renderRankingTable(rankingData);
@@ -386,10 +474,12 @@
         }
 
         function renderAt(elapsed) {
-            var data = frozenOverride !== null
-                ? Object.assign({}, virtualSubsData, { frozen: frozenOverride * 60 })
-                : virtualSubsData;
-            window.renderRankingTable(computeVirtualRanking(data, rankingData, elapsed));
+            virtualSubsData.ensure(elapsed, function () {
+                var data = frozenOverride !== null
+                    ? Object.assign({}, virtualSubsData, { frozen: frozenOverride * 60 })
+                    : virtualSubsData;
+                window.renderRankingTable(computeVirtualRanking(data, rankingData, elapsed));
+            });
         }
 
         function updateBar(elapsed, duration) {
@@ -432,7 +522,7 @@
                 if (!virtualSubsData) {
                     if (!isVirtual && frozenOverride !== null) {
                         $slider.off('mousedown touchstart');
-                        fetchReplayData(replayUrl, onReplayLoaded);
+                        loadReplay(onReplayLoaded);
                     }
                     return;
                 }
@@ -484,7 +574,7 @@
 
         var _endBtn;
         if (isVirtual) {
-            fetchReplayData(replayUrl, function (data) {
+            loadReplay(function (data) {
                 if (!data) return;
                 virtualSubsData = data;
                 _endBtn = createBar(data.duration);
@@ -502,10 +592,10 @@
             } else {
                 wireFreezeInput();
                 if (frozenOverride !== null) {
-                    fetchReplayData(replayUrl, onReplayLoaded);
+                    loadReplay(onReplayLoaded);
                 } else {
                     $slider.one('mousedown touchstart', function () {
-                        fetchReplayData(replayUrl, onReplayLoaded);
+                        loadReplay(onReplayLoaded);
                     });
                 }
             }
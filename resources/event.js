@@ -5,10 +5,12 @@ function WSEventDispatcher(websocket_path, polling_base, last_msg) {
     this.last_msg = last_msg;
     this.events = {};
     this.channels = [];
+    this.predicates = {};
     this.auto_reconnect = false;
 
     var receiver = this;
     var onwsclose_secret = 'wsclose_ZQ4hNB3vUc33q7Y7K1os';
+    var ongap_prefix = 'gap_ZQ4hNB3vUc33q7Y7K1os_';
 
     function Event() {
         this.callbacks = [];
@@ -24,13 +26,29 @@ function WSEventDispatcher(websocket_path, polling_base, last_msg) {
         }
     }
 
+    function has_predicates() {
+        return Object.keys(receiver.predicates).length > 0;
+    }
+
+    function poll_data() {
+        var data = {last: receiver.last_msg};
+        if (has_predicates()) {
+            data.where = JSON.stringify(receiver.predicates);
+        }
+        return data;
+    }
+
     function init_poll() {
         function long_poll() {
             receiver.polling_request = $.ajax({
                 url: receiver.polling_path,
-                data: {last: receiver.last_msg},
+                data: poll_data(),
                 success: function (data, status, jqXHR) {
-                    receiver.dispatch(data.channel, data.message);
+                    if (data.gap) {
+                        receiver.dispatch_gap(data.gap);
+                    } else {
+                        receiver.dispatch(data.channel, data.message);
+                    }
                     receiver.last_msg = data.id;
                     long_poll();
                 },
@@ -60,6 +78,10 @@ function WSEventDispatcher(websocket_path, polling_base, last_msg) {
         };
         receiver.websocket.onmessage = function (event) {
             var data = JSON.parse(event.data);
+            if (data.gap) {
+                receiver.dispatch_gap(data.gap);
+                return;
+            }
             receiver.dispatch(data.channel, data.message);
             receiver.last_msg = data.id;
         };
@@ -93,10 +115,14 @@ function WSEventDispatcher(websocket_path, polling_base, last_msg) {
                 if (receiver.websocket &&
                     receiver.websocket.readyState === WebSocket.OPEN &&
                     receiver.websocket.readyForData === true) {
-                    receiver.websocket.send(JSON.stringify({
+                    var request = {
                         command: 'set-filter',
                         filter: receiver.channels,
-                    }));
+                    };
+                    if (has_predicates()) {
+                        request.where = receiver.predicates;
+                    }
+                    receiver.websocket.send(JSON.stringify(request));
                 } else {
                     set_filters();
                 }
@@ -118,21 +144,46 @@ function WSEventDispatcher(websocket_path, polling_base, last_msg) {
         }
     };
 
-    this.on = function (event_name, callback) {
+    this.dispatch_gap = function (channels) {
+        channels.forEach(function (channel) {
+            receiver.dispatch(ongap_prefix + channel);
+        });
+    };
+
+    // If given, `where` is an object of fields that the messages of the channel must have, with the value they must be
+    // equal to, or contain if the field is a list. The event daemon only sends the messages that match, so it applies
+    // to all the callbacks of the channel.
+    this.on = function (event_name, callback, where) {
         if (!this.connected) {
             this.connected = true;
             init_connection();
         }
+        var changed = false;
         if (!this.events[event_name]) {
             this.events[event_name] = new Event();
             this.channels.push(event_name);
-
+            changed = true;
+        }
+        if (where && Object.keys(where).length) {
+            this.predicates[event_name] = where;
+            changed = true;
+        }
+        if (changed) {
             clearTimeout(filter_timeout);
             set_filters();
         }
         this.events[event_name].registerCallback(callback);
     };
 
+    // The callback is called when messages of the channel were lost while reconnecting, so that the page can reload
+    // what they were about.
+    this.ongap = function (event_name, callback) {
+        if (!this.events[ongap_prefix + event_name]) {
+            this.events[ongap_prefix + event_name] = new Event();
+        }
+        this.events[ongap_prefix + event_name].registerCallback(callback);
+    };
+
     this.onwsclose = function (callback) {
         if (!this.events[onwsclose_secret]) {
             this.events[onwsclose_secret] = new Event();
@@ -0,0 +1,135 @@
+// @ts-check
+/**
+ * Load generator for the event daemon: subscribes many websocket clients to a set of channels,
+ * then posts messages to those channels and measures how fast the daemon accepts and delivers them.
+ */
+import { Command } from "@commander-js/extra-typings";
+import { WebSocket } from "ws";
+
+import config from "./config.js";
+
+const options = new Command()
+  .option("--subscribers <count>", "number of subscribed clients", "10000")
+  .option("--channels <count>", "number of channels the clients are spread over", "1000")
+  .option("--messages <count>", "number of messages to post", "10000")
+  .option("--batch <count>", "number of messages per post-batch command", "100")
+  .option("--connect-concurrency <count>", "number of clients connecting at once", "500")
+  .parse()
+  .opts();
+
+const subscriberCount = Number(options.subscribers);
+const channelCount = Number(options.channels);
+const messageCount = Number(options.messages);
+const batchSize = Number(options.batch);
+const connectConcurrency = Number(options.connectConcurrency);
+const prefix = `benchmark_${Date.now()}_`;
+
+/**
+ * @param {string} url
+ * @returns {Promise<WebSocket>}
+ */
+const connect = (url) =>
+  new Promise((resolve, reject) => {
+    const socket = new WebSocket(url);
+    socket.once("open", () => resolve(socket));
+    socket.once("error", reject);
+  });
+
+/**
+ * Resolves once `condition` holds, checking every 10ms.
+ * @param {() => boolean} condition
+ */
+const waitFor = (condition) =>
+  new Promise((resolve) => {
+    const check = () => (condition() ? resolve(undefined) : setTimeout(check, 10));
+    check();
+  });
+
+/**
+ * @param {number} start
+ */
+const elapsed = (start) => (performance.now() - start) / 1000;
+
+let received = 0;
+/** @type {Set<WebSocket>} */
+const waiting = new Set();
+/** @type {WebSocket[]} */
+const subscribers = [];
+const perChannel = new Array(channelCount).fill(0);
+
+let start = performance.now();
+for (let i = 0; i < subscriberCount; i += connectConcurrency) {
+  const sockets = await Promise.all(
+    Array.from({ length: Math.min(connectConcurrency, subscriberCount - i) }, () =>
+      connect(`ws://${config.get_host}:${config.get_port}/`),
+    ),
+  );
+  sockets.forEach((socket, j) => {
+    const channel = (i + j) % channelCount;
+    perChannel[channel]++;
+    socket.on("message", () => {
+      received++;
+      waiting.delete(socket);
+    });
+    socket.send(JSON.stringify({ command: "set-filter", filter: [prefix + channel] }));
+    waiting.add(socket);
+    subscribers.push(socket);
+  });
+}
+console.log(`Connected ${subscriberCount} subscribers in ${elapsed(start).toFixed(3)}s`);
+
+const sender = await connect(`ws://${config.post_host}:${config.post_port}/`);
+let acked = 0;
+sender.on("message", (data) => {
+  const response = JSON.parse(data.toString());
+  if (response.status !== "success") {
+    throw new Error(`post failed: ${response.code}`);
+  }
+  acked += response.ids.length;
+});
+
+/**
+ * Posts `count` messages, in batches, spread over the channels round-robin.
+ * @param {number} count
+ */
+const post = (count) => {
+  for (let i = 0; i < count; i += batchSize) {
+    const messages = [];
+    for (let j = i; j < Math.min(i + batchSize, count); j++) {
+      messages.push({
+        channel: prefix + (j % channelCount),
+        message: { type: "benchmark", id: j },
+      });
+    }
+    sender.send(JSON.stringify({ command: "post-batch", messages: messages }));
+  }
+};
+
+// Every subscriber gets a message once its filter is in place.
+post(channelCount);
+await waitFor(() => !waiting.size);
+received = acked = 0;
+
+let expected = 0;
+for (let j = 0; j < messageCount; j++) {
+  expected += perChannel[j % channelCount];
+}
+
+start = performance.now();
+post(messageCount);
+await waitFor(() => acked === messageCount);
+const postTime = elapsed(start);
+await waitFor(() => received === expected);
+const deliveryTime = elapsed(start);
+
+console.log(
+  `Posted ${messageCount} messages in ${postTime.toFixed(3)}s ` +
+    `(${Math.round(messageCount / postTime)} messages/s)`,
+);
+console.log(
+  `Delivered ${expected} messages in ${deliveryTime.toFixed(3)}s ` +
+    `(${Math.round(expected / deliveryTime)} messages/s)`,
+);
+
+sender.close();
+subscribers.forEach((socket) => socket.close());
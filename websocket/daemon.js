@@ -5,12 +5,14 @@
  * @typedef {import("./types.js").IncomingMessageExtended} IncomingMessageExtended
  * @typedef {import("./types.js").ServerResponseExtended} ServerResponseExtended
  * @typedef {import("./types.js").WebSocketRawExtended} WebSocketRawExtended
+ * @typedef {import("./types.js").Subscriber} Subscriber
+ * @typedef {import("./types.js").ChannelBuffer} ChannelBuffer
+ * @typedef {import("./types.js").Predicates} Predicates
  */
 import { createServer } from "http";
 import { WebSocketServer } from "ws";
 
 import config from "./config.js";
-import { Queue } from "./queue.js";
 
 const wssReceiver = new WebSocketServer({
   host: config.get_host,
@@ -21,33 +23,153 @@ const wssSender = new WebSocketServer({
   port: config.post_port,
 });
 
+const maxQueue = config.max_queue || 50;
+const maxChannels = config.max_channels || 10000;
+const maxFilter = config.max_filter || 5;
+const maxPredicates = config.max_predicates || 5;
+const maxBodySize = config.max_body_size || 500;
+const longPollTimeout = config.long_poll_timeout || 60000;
+let messageId = Date.now();
+// Messages posted before the daemon started are lost.
+const firstMessageId = messageId + 1;
+
 /**
- * @type {Queue<Message>}
+ * The last `maxQueue` messages of each channel, for clients to catch up on, for the `maxChannels`
+ * channels that were posted to most recently. `dropped` is the id of the newest message of the
+ * channel that is not kept anymore.
+ * @type {Map<string, ChannelBuffer>}
  */
-const messages = new Queue();
+const channelBuffers = new Map();
+// The id of the newest message of any channel whose buffer was discarded.
+let droppedChannelsId = 0;
 /**
- * @type {Set<WebSocketExtended>}
+ * The clients subscribed to each channel.
+ * @type {Map<string, Set<Subscriber>>}
  */
-const followers = new Set();
+const subscribers = new Map();
+
 /**
- * @type {Set<IncomingMessageExtended>}
+ * @param {string[]} channels
+ * @param {Subscriber} client
  */
-const pollers = new Set();
-const maxQueue = config.max_queue || 50;
-const maxFilter = config.max_filter || 5;
-const maxBodySize = config.max_body_size || 200;
-const longPollTimeout = config.long_poll_timeout || 60000;
-let messageId = Date.now();
+const subscribe = (channels, client) => {
+  channels.forEach((channel) => {
+    let clients = subscribers.get(channel);
+    if (!clients) {
+      clients = new Set();
+      subscribers.set(channel, clients);
+    }
+    clients.add(client);
+  });
+};
+
+/**
+ * @param {string[]} channels
+ * @param {Subscriber} client
+ */
+const unsubscribe = (channels, client) => {
+  channels.forEach((channel) => {
+    const clients = subscribers.get(channel);
+    if (clients && clients.delete(client) && !clients.size) {
+      subscribers.delete(channel);
+    }
+  });
+};
+
+/**
+ * Parses the predicates a client wants the messages of its channels to satisfy, given as an object
+ * of the form `{channel: {field: value}}`. Channels that are not subscribed to are ignored.
+ * @param {unknown} where
+ * @param {string[]} channels
+ * @returns {Predicates}
+ */
+const parsePredicates = (where, channels) => {
+  /** @type {Predicates} */
+  const predicates = new Map();
+  if (where === undefined || where === null) {
+    return predicates;
+  }
+  if (typeof where !== "object" || Array.isArray(where)) {
+    throw new Error("invalid predicates");
+  }
+  channels.forEach((channel) => {
+    if (!Object.prototype.hasOwnProperty.call(where, channel)) {
+      return;
+    }
+    const fields = /** @type {Record<string, unknown>} */ (where)[channel];
+    if (typeof fields !== "object" || fields === null || Array.isArray(fields)) {
+      throw new Error("invalid predicates");
+    }
+    const entries = Object.entries(fields);
+    if (
+      entries.length > maxPredicates ||
+      !entries.every(([, value]) => ["string", "number", "boolean"].includes(typeof value))
+    ) {
+      throw new Error("invalid predicates");
+    }
+    if (entries.length) {
+      predicates.set(channel, entries);
+    }
+  });
+  return predicates;
+};
+
+/**
+ * Whether the message satisfies the predicates on its channel: every field of the message must be
+ * equal to the wanted value, or contain it if the field is a list.
+ * @param {Message} message
+ * @param {Predicates} predicates
+ */
+const matches = (message, predicates) => {
+  const fields = predicates.get(message.channel);
+  if (!fields) {
+    return true;
+  }
+  const data = message.message;
+  if (typeof data !== "object" || data === null) {
+    return false;
+  }
+  return fields.every(([field, value]) => {
+    const actual = Object.prototype.hasOwnProperty.call(data, field) ? data[field] : undefined;
+    return Array.isArray(actual) ? actual.includes(value) : actual === value;
+  });
+};
+
+/**
+ * Returns the id of the newest message of the channel that was lost, or 0 if none are known to be.
+ * @param {string} channel
+ */
+const droppedId = (channel) => {
+  const buffer = channelBuffers.get(channel);
+  return Math.max(firstMessageId - 1, buffer ? buffer.dropped : droppedChannelsId);
+};
 
 /**
- * @param {WebSocketExtended} client
+ * Returns the kept messages of the channels that are newer than `lastMessage` and satisfy the
+ * predicates, oldest first, and the channels that lost messages newer than `lastMessage`, which
+ * clients have to reload.
+ * @param {number} lastMessage
+ * @param {string[]} channels
+ * @param {Predicates} predicates
+ * @returns {{ messages: Message[], gaps: string[] }}
  */
-const messagesCatchUp = (client) => {
-  messages.forEach((message) => {
-    if (message.id > client.lastMessage) {
-      client.gotMessage(message);
+const messagesSince = (lastMessage, channels, predicates) => {
+  /** @type {Message[]} */
+  const messages = [];
+  channels.forEach((channel) => {
+    const buffer = channelBuffers.get(channel);
+    if (buffer) {
+      for (let i = buffer.messages.length - 1; i >= 0 && buffer.messages[i].id > lastMessage; i--) {
+        if (matches(buffer.messages[i], predicates)) {
+          messages.push(buffer.messages[i]);
+        }
+      }
     }
   });
+  messages.sort((a, b) => a.id - b.id);
+  // A client that did not receive any message yet has nothing to resume.
+  const gaps = lastMessage ? channels.filter((channel) => droppedId(channel) > lastMessage) : [];
+  return { messages, gaps };
 };
 
 /**
@@ -65,21 +187,38 @@ const messagesPost = (channel, message) => {
     channel: channel,
     message: message,
   };
-  messages.push(resolvedMessage);
-  if (messages.length > maxQueue) {
-    messages.pop();
+
+  let buffer = channelBuffers.get(channel);
+  if (buffer) {
+    // Keep the buffers in order of their last message, so that the least recently used is first.
+    channelBuffers.delete(channel);
+  } else {
+    buffer = { messages: [], dropped: droppedChannelsId };
   }
-  followers.forEach((client) => {
-    client.gotMessage(resolvedMessage);
-  });
-  pollers.forEach((request) => {
-    request.gotMessage(resolvedMessage);
+  channelBuffers.set(channel, buffer);
+  buffer.messages.push(resolvedMessage);
+  if (buffer.messages.length > maxQueue) {
+    buffer.dropped = /** @type {Message} */ (buffer.messages.shift()).id;
+  }
+  if (channelBuffers.size > maxChannels) {
+    const [oldest, oldestBuffer] = channelBuffers.entries().next().value;
+    channelBuffers.delete(oldest);
+    const newest = oldestBuffer.messages[oldestBuffer.messages.length - 1];
+    droppedChannelsId = Math.max(droppedChannelsId, newest.id);
+  }
+
+  subscribers.get(channel)?.forEach((client) => {
+    if (matches(resolvedMessage, client.predicates)) {
+      client.gotMessage(resolvedMessage);
+    }
   });
   return resolvedMessage.id;
 };
 
 wssReceiver.on("connection", (/** @type {WebSocketExtended} */ socket) => {
   socket.lastMessage = 0;
+  socket.channels = [];
+  socket.predicates = new Map();
   const commands = {
     /**
      * @param {WebSocketRawExtended} request
@@ -101,26 +240,29 @@ wssReceiver.on("connection", (/** @type {WebSocketExtended} */ socket) => {
      * @param {WebSocketRawExtended} request
      */
     set_filter(request) {
-      /**
-       * @type {Record<string, boolean>}
-       */
       try {
-        const filter = {};
         if (
           Array.isArray(request.filter) &&
           request.filter.length > 0 &&
           request.filter.length <= maxFilter &&
-          request.filter.every((channel) => {
-            if (typeof channel !== "string") {
-              return false;
-            }
-            filter[channel] = true;
-            return true;
-          })
+          request.filter.every((channel) => typeof channel === "string")
         ) {
-          socket.filter = filter;
-          followers.add(socket);
-          messagesCatchUp(socket);
+          const channels = [...new Set(/** @type {string[]} */ (request.filter))];
+          const predicates = parsePredicates(request.where, channels);
+          unsubscribe(socket.channels, socket);
+          socket.channels = channels;
+          socket.predicates = predicates;
+          subscribe(socket.channels, socket);
+          const { messages, gaps } = messagesSince(
+            socket.lastMessage,
+            socket.channels,
+            socket.predicates,
+          );
+          if (gaps.length) {
+            socket.send(JSON.stringify({ gap: gaps }));
+          }
+          messages.forEach(socket.gotMessage);
+          socket.lastMessage = messageId;
         } else {
           throw new Error("invalid filter");
         }
@@ -137,9 +279,7 @@ wssReceiver.on("connection", (/** @type {WebSocketExtended} */ socket) => {
   };
 
   socket.gotMessage = (message) => {
-    if (message.channel in socket.filter) {
-      socket.send(JSON.stringify(message));
-    }
+    socket.send(JSON.stringify(message));
     socket.lastMessage = message.id;
   };
 
@@ -169,7 +309,7 @@ wssReceiver.on("connection", (/** @type {WebSocketExtended} */ socket) => {
   });
 
   socket.on("close", () => {
-    followers.delete(socket);
+    unsubscribe(socket.channels, socket);
   });
 });
 
@@ -191,6 +331,25 @@ wssSender.on("connection", (socket) => {
         id: messagesPost(request.channel, request.message),
       };
     },
+    /**
+     * @param {WebSocketRawExtended} request
+     * @returns
+     */
+    post_batch(request) {
+      if (
+        !Array.isArray(request.messages) ||
+        !request.messages.every((message) => message && typeof message.channel === "string")
+      ) {
+        return {
+          status: "error",
+          code: "invalid-channel",
+        };
+      }
+      return {
+        status: "success",
+        ids: request.messages.map((message) => messagesPost(message.channel, message.message)),
+      };
+    },
     last_msg() {
       return {
         status: "success",
@@ -243,39 +402,47 @@ createServer(
       return;
     }
 
-    req.channels = {};
+    req.channels = [...new Set(channels)];
     req.lastMessage = parseInt(parts.searchParams.get("last") || "0");
     if (isNaN(req.lastMessage)) {
       req.lastMessage = 0;
     }
-
-    channels.forEach((channel) => {
-      req.channels[channel] = true;
-    });
+    try {
+      const where = parts.searchParams.get("where");
+      req.predicates = parsePredicates(where ? JSON.parse(where) : null, req.channels);
+    } catch (err) {
+      res.writeHead(400, { "Content-Type": "text/plain" });
+      res.end("400 Bad Request");
+      return;
+    }
 
     req.on("close", () => {
-      pollers.delete(req);
+      unsubscribe(req.channels, req);
     });
 
     req.gotMessage = (message) => {
-      if (message.channel in req.channels) {
-        res.writeHead(200, { "Content-Type": "application/json" });
-        res.end(JSON.stringify(message));
-        pollers.delete(req);
-        return true;
-      }
-      return false;
+      unsubscribe(req.channels, req);
+      res.writeHead(200, { "Content-Type": "application/json" });
+      res.end(JSON.stringify(message));
     };
-    let got = false;
-    messages.forEach((message) => {
-      if (!got && message.id > req.lastMessage) {
-        got = req.gotMessage(message);
-      }
-    });
+    const { messages, gaps } = messagesSince(req.lastMessage, req.channels, req.predicates);
+    // Answer with the oldest kept message, unless messages of some channels were lost before it.
+    // In that case, report those channels, and let the client resume after the lost messages.
+    const nextId = messages.length ? messages[0].id : Infinity;
+    const gapsBefore = gaps.filter((channel) => droppedId(channel) < nextId);
+    let got = true;
+    if (gapsBefore.length) {
+      res.writeHead(200, { "Content-Type": "application/json" });
+      res.end(JSON.stringify({ id: Math.max(...gapsBefore.map(droppedId)), gap: gapsBefore }));
+    } else if (messages.length) {
+      req.gotMessage(messages[0]);
+    } else {
+      got = false;
+    }
     if (!got) {
-      pollers.add(req);
+      subscribe(req.channels, req);
       res.setTimeout(longPollTimeout, () => {
-        pollers.delete(req);
+        unsubscribe(req.channels, req);
         res.writeHead(504, { "Content-Type": "application/json" });
         res.end('{"error": "timeout"}');
       });
@@ -4,19 +4,30 @@ import type { RawData, WebSocket } from "ws";
 export interface Message {
   id: number;
   channel: string;
-  message: string;
+  message: any;
 }
 
-export interface WebSocketExtended extends WebSocket {
-  lastMessage: number;
-  filter: Record<string, boolean>;
+// The fields that the messages of each channel must have, with the value they must have or contain.
+export type Predicates = Map<string, [string, string | number | boolean][]>;
+
+export interface ChannelBuffer {
+  messages: Message[];
+  dropped: number;
+}
+
+export interface Subscriber {
+  predicates: Predicates;
   gotMessage(message: Message): void;
 }
 
-export interface IncomingMessageExtended extends IncomingMessage {
+export interface WebSocketExtended extends WebSocket, Subscriber {
+  lastMessage: number;
+  channels: string[];
+}
+
+export interface IncomingMessageExtended extends IncomingMessage, Subscriber {
   lastMessage: number;
-  channels: Record<string, boolean>;
-  gotMessage(message: Message): boolean;
+  channels: string[];
 }
 
 export interface ServerResponseExtended extends ServerResponse<IncomingMessageExtended> {
@@ -26,7 +37,9 @@ export interface ServerResponseExtended extends ServerResponse<IncomingMessageEx
 export type WebSocketRawExtended = RawData & {
   command: string;
   filter: unknown[];
+  where: unknown;
   start: number;
   channel: unknown;
   message: string;
+  messages: { channel: unknown; message: string }[];
 };